@@ -0,0 +1,69 @@
+"""
+Microbenchmark of the previous per-call AES/base64 functions against the raw CipherContext API.
+
+    $ python3 benchmarks/encryption_benchmark.py
+"""
+import base64
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import Crypto.Cipher.AES as AES  # noqa: E402
+from Crypto import Random  # noqa: E402
+import encryption  # noqa: E402
+
+MESSAGE = json.dumps({"vehicleId": "7", "alert": "Low or high heart rate", "senorId": "HRS",
+                      "senorReading": "118", "location": "(53.3498,6.2603)"})
+BATCH = 100
+NUMBER = 20000
+
+
+def legacy_encrypt(message):
+    """
+    do_encrypt as it was before CipherContext: new cipher per call, str padding, base64.
+    """
+    iv = Random.new().read(AES.block_size)
+    cipher = AES.new(encryption.KEY, AES.MODE_CBC, iv)
+    return base64.b64encode(iv + cipher.encrypt(encryption.padding(message).encode("utf-8")))
+
+
+def legacy_decrypt(ciphertext):
+    """
+    do_decrypt as it was before CipherContext.
+    """
+    enc = base64.b64decode(ciphertext)
+    cipher = AES.new(encryption.KEY, AES.MODE_CBC, enc[:16])
+    return encryption.unpadding(cipher.decrypt(enc[16:])).decode("utf8")
+
+
+def report(name: str, seconds: float, messages: int):
+    print(f"{name:<32} {seconds / messages * 1e6:>8.2f} us/message")
+
+
+def main():
+    context = encryption.CipherContext()
+    payload = MESSAGE.encode('utf-8')
+    wrapped = encryption.do_encrypt(MESSAGE)
+    raw = context.encrypt(payload)
+    out = bytearray(context.sealed_size(len(payload)))
+    batch = [payload] * BATCH
+
+    print(f"message {len(payload)} bytes, base64 wire {len(wrapped)} bytes, raw wire {len(raw)} bytes")
+    report("legacy encrypt", timeit.timeit(lambda: legacy_encrypt(MESSAGE), number=NUMBER), NUMBER)
+    report("do_encrypt (base64)", timeit.timeit(lambda: encryption.do_encrypt(MESSAGE), number=NUMBER), NUMBER)
+    report("CipherContext.encrypt", timeit.timeit(lambda: context.encrypt(payload), number=NUMBER), NUMBER)
+    report("CipherContext.encrypt_into", timeit.timeit(lambda: context.encrypt_into(payload, out), number=NUMBER),
+           NUMBER)
+    rounds = NUMBER // BATCH
+    report(f"CipherContext.encrypt_batch({BATCH})", timeit.timeit(lambda: context.encrypt_batch(batch), number=rounds),
+           rounds * BATCH)
+    report("legacy decrypt", timeit.timeit(lambda: legacy_decrypt(wrapped), number=NUMBER), NUMBER)
+    report("do_decrypt (base64)", timeit.timeit(lambda: encryption.do_decrypt(wrapped), number=NUMBER), NUMBER)
+    report("CipherContext.decrypt", timeit.timeit(lambda: context.decrypt(raw), number=NUMBER), NUMBER)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Per-broadcast CPU cost of BroadcastSystem.send_information against neighbour count.
+
+Compares the encrypt-once fan-out with the previous per-peer serialize/encrypt loop.
+Messages are handed to a counting stub instead of the network so only the
+serialization and encryption work is measured.
+
+    $ python3 benchmarks/fanout_benchmark.py
+"""
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+# node identities created by the benchmark go to a temporary directory, not ~/.v2v/keys
+KEY_DIR = tempfile.TemporaryDirectory(prefix='v2v-keys-')
+os.environ['V2V_KEY_DIR'] = KEY_DIR.name
+
+import broadcast_system as bs  # noqa: E402
+import encryption  # noqa: E402
+
+logging.getLogger('v2vnode').setLevel(logging.WARNING)
+
+NEIGHBOURS = (1, 5, 10, 25, 50, 100)
+RELAYED_SHARE = 0.2
+ROUNDS = 200
+ALERT = {"vehicleId": "7", "alert": "Low or high heart rate", "senorId": "HRS", "senorReading": "118",
+         "location": "(53.3498,6.2603)"}
+
+
+class CountingQueue:
+    """
+    Stand-in for OutboundQueue counting the queued messages.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def put(self, destination, payload, key=None):
+        self.count += 1
+        return True
+
+
+def build_system(neighbours: int) -> bs.BroadcastSystem:
+    """
+    Build a node with the given number of neighbours, a share of them reachable through a relay.
+    :param neighbours: number of destinations.
+    :return: BroadcastSystem ready to send.
+    """
+    system = bs.BroadcastSystem(0, '127.0.0.1', 1, 2, (53.3498, 6.2603))
+    system.send_queue = CountingQueue()
+    relayed = int(neighbours * RELAYED_SHARE)
+    routes = {}
+    for node in range(1, neighbours + 1):
+        system.peers.upsert(node, '10.0.0.1', 30000 + node)
+        through = 'self' if node > relayed else neighbours
+        routes[node] = {'hop': 1 if through == 'self' else 2, 'through': through}
+    system.routes.apply(lambda current: (routes, ()))
+    return system
+
+
+def legacy_send_information(system: bs.BroadcastSystem, data):
+    """
+    The per-peer serialize and encrypt loop send_information used before the fan-out path.
+    (The old loop also re-serialized its own output, nesting the JSON deeper for every
+    peer; a fresh copy is serialized here so the baseline stays linear.)
+    """
+    for peer in list(system.pair_list):
+        node_id = peer
+        record = system.route_table[node_id]
+        next_hop = node_id
+        message = dict(data)
+        if record['through'] != 'self':
+            next_hop = record['through']
+            message.update({'relay': node_id})
+        system.send_queue.put(next_hop, encryption.do_encrypt(json.dumps(message)))
+
+
+def measure(send, system) -> float:
+    """
+    CPU time of one broadcast in microseconds, averaged over ROUNDS.
+    """
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        send(system, dict(ALERT))
+    return (time.process_time() - start) / ROUNDS * 1e6
+
+
+def main():
+    print(f"{'neighbours':>10} {'legacy us':>12} {'fan-out us':>12} {'speed-up':>9}")
+    for neighbours in NEIGHBOURS:
+        system = build_system(neighbours)
+        legacy = measure(legacy_send_information, system)
+        fanout = measure(bs.BroadcastSystem.send_information, system)
+        print(f"{neighbours:>10} {legacy:>12.1f} {fanout:>12.1f} {legacy / fanout:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Readings per second of the scalar per-vehicle Sensors against the vectorized FleetSensors,
+and a check that both draw from the same distributions.
+
+One reading is one GET_DATA list of one sensor of one vehicle (7 per vehicle and tick,
+speed sensor left out as in Sensors.getSensors).
+
+    $ python3 benchmarks/fleet_sensors_benchmark.py [vehicles]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import sensor_data_generators as sdg  # noqa: E402
+from fleet_sensors import FleetSensors  # noqa: E402
+
+SCALAR_VEHICLES = 2000
+TICKS = 5
+SENSORS_PER_VEHICLE = 7
+
+
+def scalar_rate(vehicles: int) -> float:
+    fleet = [sdg.Sensors().getSensors() for _ in range(vehicles)]
+    start = time.perf_counter()
+    for _ in range(TICKS):
+        for sensors in fleet:
+            for sensor in sensors:
+                sensor.GET_DATA()
+    return vehicles * TICKS * SENSORS_PER_VEHICLE / (time.perf_counter() - start)
+
+
+def vectorized_rate(vehicles: int) -> float:
+    fleet = FleetSensors(vehicles, seed=1)
+    start = time.perf_counter()
+    for _ in range(TICKS):
+        fleet.step()
+    return vehicles * TICKS * SENSORS_PER_VEHICLE / (time.perf_counter() - start)
+
+
+def share(values, low, high):
+    return sum(low <= value <= high for value in values) / len(values)
+
+
+def distributions(vehicles: int):
+    """
+    Share of vehicles starting with a normal tyre pressure and heart rate, and
+    mean fuel after a tick, for both implementations.
+    """
+    scalar = [sdg.Sensors().getSensors() for _ in range(vehicles)]
+    fleet = FleetSensors(vehicles, seed=2)
+    readings = fleet.step()
+    rows = [
+        ('pressure 30-35', share([sensors[0].GET_DATA()[1] for sensors in scalar], 30, 35),
+         share(readings.pressure.tolist(), 30, 35)),
+        ('heart rate 60-100', share([sensors[5].GET_DATA()[1] for sensors in scalar], 59, 101),
+         share(readings.heart_rate.tolist(), 59, 101)),
+        ('mean fuel', sum(sensors[2].GET_DATA()[1] for sensors in scalar) / vehicles,
+         float(readings.fuel.mean())),
+    ]
+    print(f"{'distribution':>18} {'scalar':>10} {'vectorized':>10}")
+    for name, expected, actual in rows:
+        print(f"{name:>18} {expected:>10.3f} {actual:>10.3f}")
+
+
+def main():
+    vehicles = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    scalar = scalar_rate(SCALAR_VEHICLES)
+    vectorized = vectorized_rate(vehicles)
+    print(f"{'scalar':>18} {scalar:>14,.0f} readings/s ({SCALAR_VEHICLES} vehicles)")
+    print(f"{'vectorized':>18} {vectorized:>14,.0f} readings/s ({vehicles} vehicles)")
+    print(f"{'speedup':>18} {vectorized / scalar:>14.1f}x")
+    distributions(SCALAR_VEHICLES * 5)
+
+
+if __name__ == '__main__':
+    main()
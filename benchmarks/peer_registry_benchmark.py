@@ -0,0 +1,90 @@
+"""
+Discovery and send cost of the peer registry against the previous linear pair_list scans
+at 10/100/1000 peers.
+
+Discovery is the handling of a beacon from an already known peer; send is the
+per-destination lookup work of one send_information call (network and encryption
+left out).
+
+    $ python3 benchmarks/peer_registry_benchmark.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from peer_registry import PeerRegistry  # noqa: E402
+
+PEERS = (10, 100, 1000)
+
+
+class LegacyPeer:
+    """
+    The former HostConfigure record.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+
+def legacy_discovery(pair_list, node_id, host, port):
+    flag = [host == pair_list[key].host and port == pair_list[key].port for key in list(pair_list)]
+    if not any(flag):
+        pair_list[node_id] = LegacyPeer(host, port)
+
+
+def legacy_get_node_id(pair_list, remote_addr):
+    for node in list(pair_list):
+        if remote_addr[0] == pair_list[node].host and int(remote_addr[1]) == pair_list[node].port:
+            return node
+
+
+def legacy_send(pair_list, route_table):
+    hops = []
+    for peer in list(pair_list):
+        peer_host = pair_list[peer].host
+        peer_port = int(pair_list[peer].port)
+        node_id = legacy_get_node_id(pair_list, (peer_host, peer_port))
+        hops.append(route_table[node_id]['through'])
+    return hops
+
+
+def registry_send(registry, route_table):
+    hops = []
+    for node_id, peer in registry.snapshot().items():
+        record = route_table.get(node_id)
+        if record is not None:
+            hops.append(record['through'])
+    return hops
+
+
+def per_call(statement, number: int) -> float:
+    return min(timeit.repeat(statement, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    print(f"{'peers':>6} {'discovery legacy us':>20} {'registry us':>12} {'send legacy us':>15} {'registry us':>12}")
+    for count in PEERS:
+        pair_list = {}
+        registry = PeerRegistry()
+        route_table = {}
+        for node in range(count):
+            host, port = f'10.0.{node // 250}.{node % 250}', 30000 + node
+            legacy_discovery(pair_list, node, host, port)
+            registry.upsert(node, host, port)
+            route_table[node] = {'hop': 1, 'through': 'self'}
+        last = count - 1
+        beacon = (last, f'10.0.{last // 250}.{last % 250}', 30000 + last)
+        number = max(10, 20000 // count)
+        discovery_legacy = per_call(lambda: legacy_discovery(pair_list, *beacon), number)
+        discovery_registry = per_call(lambda: registry.upsert(*beacon), number)
+        send_number = max(3, 2000 // count)
+        send_legacy = per_call(lambda: legacy_send(pair_list, route_table), max(1, send_number // 10))
+        send_registry = per_call(lambda: registry_send(registry, route_table), send_number)
+        print(f"{count:>6} {discovery_legacy:>20.2f} {discovery_registry:>12.2f} {send_legacy:>15.1f} {send_registry:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Nearest hospital / gas station lookups against a POI index of 100k+ points.
+
+Builds an index of random POIs over Ireland, then reports the build time, the time
+to open (memory-map) the prebuilt file, and the cost of one query: a linear scan,
+the exact KD-tree search and the cached per geohash cell lookup. The KD-tree results
+are checked against the linear scan.
+
+    $ python3 benchmarks/poi_index_benchmark.py [pois]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import poi_index  # noqa: E402
+
+KINDS = ('hospital', 'gas_station', 'gas_station', 'gas_station')
+BOUNDS = ((51.4, 55.4), (-10.5, -5.4))
+QUERIES = 5000
+CHECKED = 50
+SCANNED = 20
+K = 3
+
+
+def random_pois(count: int, rng) -> list:
+    return [(rng.choice(KINDS), f"POI {index}", rng.uniform(*BOUNDS[0]), rng.uniform(*BOUNDS[1]))
+            for index in range(count)]
+
+
+def linear_nearest(pois: list, kind: str, location: tuple, k: int) -> list:
+    query = poi_index.to_vector(*location)
+    distances = []
+    for poi_kind, name, latitude, longitude in pois:
+        if poi_kind == kind:
+            vector = poi_index.to_vector(latitude, longitude)
+            distances.append((sum((a - b) ** 2 for a, b in zip(query, vector)), name))
+    return [name for _, name in sorted(distances)[:k]]
+
+
+def per_query(function, queries) -> float:
+    start = time.perf_counter()
+    for kind, location in queries:
+        function(kind, location, K)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = random.Random(1)
+    pois = random_pois(count, rng)
+    queries = [(rng.choice(('hospital', 'gas_station')), (rng.uniform(*BOUNDS[0]), rng.uniform(*BOUNDS[1])))
+               for _ in range(QUERIES)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'pois.idx')
+        start = time.perf_counter()
+        poi_index.build(pois, path)
+        built = time.perf_counter() - start
+        start = time.perf_counter()
+        index = poi_index.PoiIndex(path)
+        opened = time.perf_counter() - start
+        mismatches = sum([name for _, name, _, _ in index.nearest(kind, location, K)] !=
+                         linear_nearest(pois, kind, location, K) for kind, location in queries[:CHECKED])
+        scan = per_query(lambda kind, location, k: linear_nearest(pois, kind, location, k), queries[:SCANNED])
+        exact = per_query(index.nearest, queries)
+        per_query(index.nearest_cached, queries)
+        cached = per_query(index.nearest_cached, queries)
+        size = os.path.getsize(path)
+        del index
+    print(f"{'pois':>14} {count:>12}")
+    print(f"{'index file':>14} {size / 2 ** 20:>11.1f}M")
+    print(f"{'build':>14} {built:>11.2f}s")
+    print(f"{'open':>14} {opened * 1e3:>10.2f}ms")
+    print(f"{'linear scan':>14} {scan:>10.0f}us")
+    print(f"{'kd-tree':>14} {exact:>10.1f}us")
+    print(f"{'cached cell':>14} {cached:>10.1f}us")
+    print(f"{'mismatches':>14} {mismatches:>12}")
+    sys.exit(0 if not mismatches else 1)
+
+
+if __name__ == '__main__':
+    main()
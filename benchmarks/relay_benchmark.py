@@ -0,0 +1,111 @@
+"""
+Per-message CPU cost at a relay node: the former relay field, which the relay
+decrypts, parses, re-encodes and seals again, against routed frames forwarded on
+their cleartext routing header without being opened.
+
+Three nodes in a line (origin -> relay -> destination); the relay's output is handed
+to a stub instead of the network. Every forwarded frame is then checked to
+open at the destination.
+
+    $ python3 benchmarks/relay_benchmark.py
+"""
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import broadcast_system as bs  # noqa: E402
+import security  # noqa: E402
+from session_keys import SessionKeyManager  # noqa: E402
+
+MESSAGES = 20000
+ALERT = {"vehicleId": "1", "alert": "Low or high heart rate", "senorId": "HRS", "senorReading": 118,
+         "location": "(53.3498,6.2603)"}
+
+
+class CapturingQueue:
+    """
+    Stand-in for OutboundQueue keeping the queued messages.
+    """
+
+    def __init__(self):
+        self.items = []
+
+    def put(self, destination, payload, key=None):
+        self.items.append((destination, payload))
+        return True
+
+    def discard(self, destination):
+        pass
+
+
+def build_nodes(key_dir: str) -> list:
+    nodes = []
+    for node in (1, 2, 3):
+        system = bs.BroadcastSystem(node, '127.0.0.1', 30000 + node, 31000 + node, (53.3498, 6.2603))
+        system.session_keys = SessionKeyManager(node, security.KeyStore.for_node(node, key_dir))
+        system.send_queue = CapturingQueue()
+        nodes.append(system)
+    for system in nodes:
+        for other in nodes:
+            if other is not system:
+                system.handle_beacon({'node': other.vehicle_id, 'host': '127.0.0.1', 'port': other.port,
+                                      'location': None, 'public_key': other.session_keys.public_key_pem,
+                                      'formats': ['bin1', 'json']})
+    origin, relay, destination = nodes
+    origin.routes.apply(lambda routes: ({2: {'hop': 1, 'through': 'self'}, 3: {'hop': 2, 'through': 2}}, ()))
+    relay.routes.apply(lambda routes: ({1: {'hop': 1, 'through': 'self'}, 3: {'hop': 1, 'through': 'self'}}, ()))
+    # direct session keys, as handed over when the streams are opened
+    relay.process_message(origin.session_keys.key_exchange_frame(2), None, None)
+    destination.process_message(relay.session_keys.key_exchange_frame(3), None, None)
+    return nodes
+
+
+def flatten(payload) -> bytes:
+    return b''.join(bytes(part) for part in payload) if isinstance(payload, tuple) else payload
+
+
+def measure(relay, frames: list) -> float:
+    """
+    CPU time the relay spends per received frame, in microseconds.
+    """
+    start = time.process_time()
+    for frame in frames:
+        relay.process_message(frame, None, lambda record: None)
+    return (time.process_time() - start) / len(frames) * 1e6
+
+
+def main():
+    logging.getLogger('v2vnode').setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as key_dir:
+        origin, relay, destination = build_nodes(key_dir)
+        legacy_frames = [origin.session_keys.seal(bs.relay_envelope(json.dumps(ALERT), 3))
+                         for _ in range(MESSAGES)]
+        legacy = measure(relay, legacy_frames)
+        sent = len(relay.send_queue.items)
+        relay.send_queue.items.clear()
+
+        for _ in range(MESSAGES):
+            origin.send_to(3, ALERT)
+        routed_frames = [flatten(payload) for _, payload in origin.send_queue.items]
+        routed = measure(relay, routed_frames)
+        forwarded = relay.send_queue.items
+
+        received = []
+        for _, payload in forwarded:
+            destination.process_message(flatten(payload), None, received.append)
+    print(f"{'legacy relay':>14} {legacy:>8.1f}us {sent:>8} frames")
+    print(f"{'routed frames':>14} {routed:>8.1f}us {len(forwarded):>8} frames")
+    print(f"{'speed-up':>14} {legacy / routed:>8.1f}x")
+    print(f"{'delivered':>14} {len(received):>10}")
+    ok = len(received) == MESSAGES and all(record == ALERT for record in received)
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Throughput of the vehicle pipeline fed from a recorded sensor trace at max speed.
+
+A trace of seeded sensor readings is recorded once, then replayed into vehicles
+with 10 neighbours each: every sensor pass runs the alert checks, serialization
+and encryption of send_information, and the messages are handed to a counting
+stub instead of the network. Recording the same seed twice must give the same
+trace, so runs of the benchmark are comparable.
+
+    $ python3 benchmarks/replay_benchmark.py [vehicles] [ticks]
+"""
+import contextlib
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+# node identities created by the benchmark go to a temporary directory, not ~/.v2v/keys
+KEY_DIR = tempfile.TemporaryDirectory(prefix='v2v-keys-')
+os.environ['V2V_KEY_DIR'] = KEY_DIR.name
+
+import control as ctrl  # noqa: E402
+import sensor_data_generators as sdg  # noqa: E402
+import sensor_trace  # noqa: E402
+
+NEIGHBOURS = 10
+SEED = 7
+
+
+class CountingQueue:
+    """
+    Stand-in for OutboundQueue counting the queued messages.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def put(self, destination, payload, key=None):
+        self.count += 1
+        return True
+
+
+def record(path: str, vehicles: int, ticks: int):
+    """
+    Record the sensor passes and speed steps of seeded vehicles, one second apart.
+    """
+    random.seed(SEED)
+    fleet = [sdg.Sensors() for _ in range(vehicles)]
+    sensors = [master.getSensors() for master in fleet]
+    writer = sensor_trace.TraceWriter(path)
+    for tick in range(ticks):
+        for vehicle_id, master in enumerate(fleet):
+            writer.record(vehicle_id, [sensor.GET_DATA() for sensor in sensors[vehicle_id]], now=tick)
+            if tick % 2 == 0:
+                writer.record(vehicle_id, [master.s1.GET_DATA()], sensor_trace.SPEED_STEP, now=tick)
+    writer.close()
+
+
+def build_vehicle(vehicle_id: int) -> ctrl.VehicleControls:
+    vehicle = ctrl.VehicleControls(vehicle_id, '127.0.0.1', 1, 2, 53.3498, 6.2603)
+    vehicle.send_queue = CountingQueue()
+    routes = {}
+    for node in range(1000, 1000 + NEIGHBOURS):
+        vehicle.peers.upsert(node, '10.0.0.1', 30000 + node)
+        routes[node] = {'hop': 1, 'through': 'self'}
+    vehicle.routes.apply(lambda current: (routes, ()))
+    return vehicle
+
+
+def main():
+    logging.disable(logging.INFO)
+    vehicles = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    with tempfile.TemporaryDirectory() as directory:
+        first, second = os.path.join(directory, 'first.trace'), os.path.join(directory, 'second.trace')
+        record(first, vehicles, ticks)
+        record(second, vehicles, ticks)
+        with open(first, 'rb') as a, open(second, 'rb') as b:
+            deterministic = a.read() == b.read()
+        fleet = {vehicle_id: build_vehicle(vehicle_id) for vehicle_id in range(vehicles)}
+        trace = sensor_trace.TraceReader(first)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            entries = sensor_trace.replay(trace, fleet, speed=0)
+            elapsed = time.perf_counter() - start
+        trace.close()
+        size = os.path.getsize(first)
+    messages = sum(vehicle.send_queue.count for vehicle in fleet.values())
+    print(f"{'trace':>14} {entries:>10} entries {size:>10} bytes")
+    print(f"{'deterministic':>14} {str(deterministic):>10}")
+    print(f"{'entries/s':>14} {entries / elapsed:>10,.0f}")
+    print(f"{'messages/s':>14} {messages / elapsed:>10,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Messages an infra node queues to answer its vehicles: every reply flooded to all the
+peers (the former behaviour) against unicast replies to the reporting vehicle, and a
+weather alert flooded against geocast to the vehicles within WEATHER_RADIUS.
+
+Every vehicle reports one low fuel alert. Messages are handed to a counting stub
+instead of the network.
+
+    $ python3 benchmarks/reply_traffic_benchmark.py
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+# node identities created by the benchmark go to a temporary directory, not ~/.v2v/keys
+KEY_DIR = tempfile.TemporaryDirectory(prefix='v2v-keys-')
+os.environ['V2V_KEY_DIR'] = KEY_DIR.name
+
+import control as ctrl  # noqa: E402
+
+VEHICLES = (10, 100, 500)
+ORIGIN = (53.3498, -6.2603)
+# vehicles are spread over twice the weather radius, north of the infra
+SPREAD = 2 * ctrl.WEATHER_RADIUS / 111320.0
+
+
+class CountingQueue:
+    """
+    Stand-in for OutboundQueue counting the queued messages.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def put(self, destination, payload, key=None):
+        self.count += 1
+        return True
+
+
+def build_infra(vehicles: int) -> ctrl.InfraControls:
+    infra = ctrl.InfraControls(0, '127.0.0.1', 1, 2, *ORIGIN)
+    infra.send_queue = CountingQueue()
+    routes = {}
+    for node in range(1, vehicles + 1):
+        infra.peers.upsert(node, '10.0.0.1', 30000 + node)
+        infra.neighbourhood.update(node, (ORIGIN[0] + SPREAD * node / vehicles, ORIGIN[1]))
+        routes[node] = {'hop': 1, 'through': 'self'}
+    infra.routes.apply(lambda current: (routes, ()))
+    return infra
+
+
+def run(vehicles: int, flood: bool):
+    infra = build_infra(vehicles)
+    if flood:
+        infra.reply = lambda data, message: infra.send_information(message)
+        infra.geocast = lambda data, radius, origin=None: infra.send_information(data)
+    start = time.perf_counter()
+    for node in range(1, vehicles + 1):
+        infra.information_processor({"vehicleId": str(node), "alert": "Low fuel", "senorId": "FLG",
+                                     "senorReading": 70})
+    replies = infra.send_queue.count
+    infra.weather_update()
+    weather = infra.send_queue.count - replies
+    return replies, weather, time.perf_counter() - start
+
+
+def main():
+    logging.disable(logging.INFO)
+    print(f"{'vehicles':>8} {'flood replies':>14} {'unicast':>8} {'flood weather':>14} {'geocast':>8} "
+          f"{'flood ms':>9} {'targeted ms':>12}")
+    for vehicles in VEHICLES:
+        flood_replies, flood_weather, flood_time = run(vehicles, True)
+        replies, weather, elapsed = run(vehicles, False)
+        print(f"{vehicles:>8} {flood_replies:>14} {replies:>8} {flood_weather:>14} {weather:>8} "
+              f"{flood_time * 1e3:>9.1f} {elapsed * 1e3:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
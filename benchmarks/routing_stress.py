@@ -0,0 +1,133 @@
+"""
+Stress test of the routing state: discovery beacons, route updates, expiry sweeps and
+sends hammer one node from concurrent threads for a few seconds.
+
+Every snapshot a sender reads must be consistent (each learned route goes through a
+destination present in the same snapshot) and no thread may raise. Exits non-zero
+on failure.
+
+    $ python3 benchmarks/routing_stress.py [seconds]
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+# node identities created by the benchmark go to a temporary directory, not ~/.v2v/keys
+KEY_DIR = tempfile.TemporaryDirectory(prefix='v2v-keys-')
+os.environ['V2V_KEY_DIR'] = KEY_DIR.name
+
+import broadcast_system as bs  # noqa: E402
+from route_updates import RouteUpdate  # noqa: E402
+
+NODES = 200
+ORIGIN = (53.3498, -6.2603)
+NEAR = (53.3498, -6.26025)
+FAR = (53.3598, -6.2603)
+SENDERS = 4
+
+
+class CountingQueue:
+    """
+    Stand-in for the OutboundQueue that only counts the queued messages.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def put(self, destination, payload, key=None):
+        self.count += 1
+
+    def discard(self, destination):
+        pass
+
+
+class Stress:
+    """
+    Runs the worker threads and collects their errors and counters.
+    """
+
+    def __init__(self, duration: float):
+        self.duration = duration
+        self.system = bs.BroadcastSystem(0, '127.0.0.1', 1, 2, ORIGIN)
+        self.system.send_queue = CountingQueue()
+        self.system.route_announcer.send = lambda packet: None
+        self.stop = threading.Event()
+        self.errors = []
+        self.violations = 0
+        self.counters = {}
+
+    def loop(self, name, step):
+        count = 0
+        rng = random.Random(name)
+        try:
+            while not self.stop.is_set():
+                step(rng)
+                count += 1
+        except Exception as e:
+            self.errors.append(f"{name}: {e!r}")
+            self.stop.set()
+        self.counters[name] = count
+
+    def discovery(self, rng):
+        node = rng.randrange(1, NODES)
+        peer, _ = self.system.peers.upsert(node, '10.0.0.1', 30000 + node, ['bin1', 'json'])
+        self.system.peer_expiry.touch(node, peer.last_seen + bs.PEER_TIMEOUT)
+        self.system.route_add({'node': node, 'location': NEAR if rng.random() < 0.8 else FAR})
+
+    def route_update(self, rng):
+        neighbour = rng.randrange(1, NODES)
+        routes = [[rng.randrange(1, NODES * 2), rng.randrange(1, 4)] for _ in range(rng.randrange(1, 20))]
+        removed = [rng.randrange(1, NODES * 2) for _ in range(rng.randrange(0, 5))]
+        self.system.apply_route_update(RouteUpdate(neighbour, rng.random() < 0.1, routes, removed))
+
+    def expiry(self, rng):
+        if rng.random() < 0.5:
+            self.system.expire_soft_state(time.monotonic() + rng.uniform(0, bs.ROUTE_TIMEOUT * 2))
+        else:
+            self.system.drop_peers([rng.randrange(1, NODES) for _ in range(rng.randrange(1, 4))])
+        time.sleep(0.001)
+
+    def send(self, rng):
+        routes = self.system.route_table
+        for record in routes.values():
+            if record['through'] != 'self' and record['through'] not in routes:
+                self.violations += 1
+        self.system.send_information({'vehicleId': '0', 'alert': "Low fuel", 'senorId': 'FLG',
+                                      'senorReading': rng.randrange(100)})
+
+    def run(self) -> bool:
+        workers = [('discovery', self.discovery), ('route_update', self.route_update), ('expiry', self.expiry)]
+        workers += [(f'send-{index}', self.send) for index in range(SENDERS)]
+        threads = [threading.Thread(target=self.loop, args=worker) for worker in workers]
+        for thread in threads:
+            thread.start()
+        self.stop.wait(self.duration)
+        self.stop.set()
+        for thread in threads:
+            thread.join()
+        for name, count in sorted(self.counters.items()):
+            print(f"{name:>14} {count:>10}")
+        print(f"{'versions':>14} {self.system.routes.version:>10}")
+        print(f"{'queued':>14} {self.system.send_queue.count:>10}")
+        print(f"{'violations':>14} {self.violations:>10}")
+        for error in self.errors:
+            print(error)
+        return not self.errors and not self.violations
+
+
+def main():
+    logging.getLogger('v2vnode').setLevel(logging.WARNING)
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    ok = Stress(duration).run()
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Alerts per second an infra node processes with the rule engine against the previous
+if/elif information_processor, which logged every message in full at INFO.
+
+The alert mix is the one of a vehicle tick. Logs go to /dev/null and replies to a
+counting stub instead of the network, so only the processing work is measured.
+Also checks that a changed rule file is picked up.
+
+    $ python3 benchmarks/rule_engine_benchmark.py
+"""
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+# node identities created by the benchmark go to a temporary directory, not ~/.v2v/keys
+KEY_DIR = tempfile.TemporaryDirectory(prefix='v2v-keys-')
+os.environ['V2V_KEY_DIR'] = KEY_DIR.name
+
+import control as ctrl  # noqa: E402
+import rule_engine  # noqa: E402
+
+MESSAGES = 20000
+VEHICLES = 1000
+
+
+class CountingQueue:
+    """
+    Stand-in for OutboundQueue counting the queued messages.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def put(self, destination, payload, key=None):
+        self.count += 1
+        return True
+
+
+def legacy_information_processor(infra, data):
+    logging.info(f"On infra--->[{data}]")
+    if data["senorId"] == "LT":
+        infra.turnOnLights(data)
+    elif data["senorId"] == "FLG":
+        infra.sendGasStation(data)
+    elif data["senorId"] == "HRS" and (data["senorReading"] < 60 or data["senorReading"] > 100):
+        infra.takeActionOnDanger(data)
+
+
+def alerts(count: int) -> list:
+    rng = random.Random(1)
+    kinds = [
+        ('GPS', "GPS co-ordinates", lambda: [53.35 + rng.random(), 6.26 + rng.random()]),
+        ('PRX', "Proximity alert", lambda: True),
+        ('TP', "Low or high tyre pressure alert", lambda: rng.choice([28, 37])),
+        ('HRS', "Low or high heart rate", lambda: rng.choice([55, 59, 101, 110])),
+        ('SPD', "Over speeding alert", lambda: rng.randrange(81, 120)),
+        ('BRK', "Brake applied", lambda: True),
+        ('FLG', "Low fuel", lambda: rng.randrange(40, 80)),
+        ('LT', "Low lights alert", lambda: 'LOW'),
+    ]
+    messages = []
+    for _ in range(count):
+        sensor_id, alert, reading = rng.choice(kinds)
+        messages.append({"vehicleId": str(rng.randrange(VEHICLES)), "alert": alert, "senorId": sensor_id,
+                         "senorReading": reading()})
+    return messages
+
+
+def build_infra(rules_path=None) -> ctrl.InfraControls:
+    infra = ctrl.InfraControls(0, '127.0.0.1', 1, 2, 53.3498, 6.2603, rules_path)
+    infra.send_queue = CountingQueue()
+    infra.peers.upsert(1, '10.0.0.1', 30001)
+    infra.routes.apply(lambda current: ({1: {'hop': 1, 'through': 'self'}}, ()))
+    return infra
+
+
+def rate(process, messages) -> float:
+    start = time.perf_counter()
+    for data in messages:
+        process(data)
+    return len(messages) / (time.perf_counter() - start)
+
+
+def check_reload(directory: str) -> bool:
+    path = os.path.join(directory, 'rules.json')
+    with open(path, 'w') as file:
+        json.dump({'rules': [{'sensor': 'FLG', 'action': 'log'}]}, file)
+    infra = build_infra(path)
+    flg = {"vehicleId": "7", "alert": "Low fuel", "senorId": "FLG", "senorReading": 70}
+    tp = {"vehicleId": "7", "alert": "Low or high tyre pressure alert", "senorId": "TP", "senorReading": 20}
+    before = infra.rules.evaluate(flg), infra.rules.evaluate(tp)
+    with open(path, 'w') as file:
+        json.dump({'rules': [{'sensor': 'TP', 'when': {'below': 25}, 'action': 'log'}]}, file)
+    os.utime(path, (time.time() + 1, time.time() + 1))
+    time.sleep(rule_engine.RELOAD_INTERVAL)
+    after = infra.rules.evaluate(flg), infra.rules.evaluate(tp)
+    return before == (1, 0) and after == (0, 1)
+
+
+def main():
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    devnull = open(os.devnull, 'w')
+    root.addHandler(logging.StreamHandler(devnull))
+    root.setLevel(logging.INFO)
+    logging.getLogger('v2vnode').setLevel(logging.WARNING)
+    messages = alerts(MESSAGES)
+    legacy = build_infra()
+    engine = build_infra()
+    legacy_rate = rate(lambda data: legacy_information_processor(legacy, data), messages)
+    engine_rate = rate(engine.information_processor, messages)
+    print(f"{'legacy':>10} {legacy_rate:>10,.0f} alerts/s {legacy.send_queue.count:>7} replies")
+    print(f"{'rules':>10} {engine_rate:>10,.0f} alerts/s {engine.send_queue.count:>7} replies")
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'reload':>10} {'OK' if check_reload(directory) else 'FAILED':>10}")
+    devnull.close()
+
+
+if __name__ == '__main__':
+    main()
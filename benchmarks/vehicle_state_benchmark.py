@@ -0,0 +1,90 @@
+"""
+Replies and memory of an infra node keeping per-vehicle state.
+
+Vehicles pass by the infra in waves, each of them repeating its low fuel, heart rate
+and light alerts every tick as the vehicles do, and some alerts arrive twice over
+two relays. The infra with the default rules must answer each condition once per
+suppress window, while the store stays within MAX_VEHICLES however many vehicles
+have passed.
+
+    $ python3 benchmarks/vehicle_state_benchmark.py [vehicles]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+# node identities created by the benchmark go to a temporary directory, not ~/.v2v/keys
+KEY_DIR = tempfile.TemporaryDirectory(prefix='v2v-keys-')
+os.environ['V2V_KEY_DIR'] = KEY_DIR.name
+
+import control as ctrl  # noqa: E402
+import vehicle_state  # noqa: E402
+
+TICKS = 5
+WAVE = 2000
+
+
+class CountingQueue:
+    """
+    Stand-in for OutboundQueue counting the queued messages.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def put(self, destination, payload, key=None):
+        self.count += 1
+        return True
+
+
+def tick_alerts(vehicle_id: int, tick: int) -> list:
+    vehicle = str(vehicle_id)
+    return [
+        {"vehicleId": vehicle, "alert": "Low fuel", "senorId": "FLG", "senorReading": 70 - tick // 50},
+        {"vehicleId": vehicle, "alert": "Low or high heart rate", "senorId": "HRS", "senorReading": 101 + tick},
+        {"vehicleId": vehicle, "alert": "Low lights alert", "senorId": "LT", "senorReading": 'LOW'},
+    ]
+
+
+def main():
+    logging.disable(logging.INFO)
+    vehicles = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    infra = ctrl.InfraControls(0, '127.0.0.1', 1, 2, 53.3498, 6.2603)
+    infra.send_queue = CountingQueue()
+    # every vehicle is a direct neighbour of the infra
+    infra.routes.apply(lambda current: ({vehicle_id: {'hop': 1, 'through': 'self'} for vehicle_id in range(vehicles)},
+                                        ()))
+    tracemalloc.start()
+    alerts = 0
+    start = time.perf_counter()
+    for first in range(0, vehicles, WAVE):
+        wave = range(first, min(first + WAVE, vehicles))
+        for tick in range(TICKS):
+            for vehicle_id in wave:
+                for data in tick_alerts(vehicle_id, tick):
+                    infra.information_processor(data)
+                    alerts += 1
+                # the same low fuel alert relayed over a second path
+                infra.information_processor(tick_alerts(vehicle_id, tick)[0])
+                alerts += 1
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    replies = infra.send_queue.count
+    print(f"{'vehicles':>12} {vehicles:>10}")
+    print(f"{'alerts':>12} {alerts:>10} {alerts / elapsed:>10,.0f}/s")
+    print(f"{'replies':>12} {replies:>10} (legacy: {vehicles * TICKS * 3 + vehicles * TICKS})")
+    print(f"{'stored':>12} {len(infra.rules.state):>10} (max {vehicle_state.MAX_VEHICLES})")
+    print(f"{'peak memory':>12} {peak / 2 ** 20:>9.1f}M")
+    ok = replies == vehicles * 3 and len(infra.rules.state) <= vehicle_state.MAX_VEHICLES
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,22 @@
+import contextlib
 import json
 import socket
 import threading
 import time
-import geopy.distance
 import encryption
-import struct
 import logging
+from connection_pool import PeerConnectionPool
+from peer_registry import PeerRegistry
+from session_keys import SessionKeyManager
+from send_queue import OutboundQueue
+import wire_format
+import routing_header
+import spatial_index
+from route_table import RouteTable, with_dependents
+from route_updates import RouteAnnouncer, RouteUpdateReceiver
+from soft_state import ExpiryHeap
+from worker_pool import WorkerPool
+import node_runtime
 
 logging.basicConfig(format='%(asctime)-15s  %(message)s', level=logging.INFO)
 logger = logging.getLogger('v2vnode')
@@ -15,28 +26,38 @@ logger = logging.getLogger('v2vnode')
 MCAST_TTL = 1
 MCAST_GRP = '224.1.1.1'
 MCAST_PORT = 34599
+# Nodes closer than this (metres) are direct neighbours.
+NEIGHBOUR_RADIUS = 20
+# Routes longer than this are treated as unreachable, which bounds count-to-infinity loops.
+MAX_HOPS = 16
+# Seconds between two discovery beacons; expired peers and routes are swept on every beacon.
+BEACON_INTERVAL = 5
+# A peer (and its direct route) is dropped after missing this many seconds of beacons.
+PEER_TIMEOUT = 3 * BEACON_INTERVAL
+# A learned route is dropped if no update from its next hop lists it for this long,
+# i.e. after missing more than two full route snapshots.
+ROUTE_TIMEOUT = 75
+# Seconds between two routed key exchanges towards the same node beyond the neighbours.
+ROUTED_KEY_INTERVAL = 30
 
 
-class HostConfigure:
+def relay_envelope(body: str, destination) -> str:
     """
-    This class acts as the shell for storing peer details
+    Add the relay field to an already serialized JSON object without re-serializing it.
+    :param body: JSON encoded message object.
+    :param destination: id of the node the message has to be relayed to.
+    :return: JSON encoded message object carrying the relay field.
     """
+    separator = ', ' if body != '{}' else ''
+    return f'{body[:-1]}{separator}"relay": {json.dumps(destination)}}}'
 
-    def __init__(self, host_address: str, port: int):
-        """
-        Initializer for the shell class.
-        :param host_address: ip address of the host.
-        :param port: port number of the host.
-        """
-        self.host = host_address
-        self.port = port
 
-
-class BroadcastSystem(HostConfigure):
+class BroadcastSystem:
     """
     This class acts as the communication system/router for the Vehicle or Infra.
     """
-    def __init__(self, vehicle_id: int, host_address: str, port: int, sending_port: int, gps: tuple = None):
+    def __init__(self, vehicle_id: int, host_address: str, port: int, sending_port: int, gps: tuple = None,
+                 send_queue_size: int = 1024, send_rate: float = 50.0, coalesce_window: float = 0.05):
         """
         Initializer for the communication system.
         :param vehicle_id: id of the vehicle/infra node.
@@ -44,81 +65,176 @@ class BroadcastSystem(HostConfigure):
         :param port: listening port of the node.
         :param sending_port: port to be used while sending a data.
         :param gps: GPS coordinates of the node.
+        :param send_queue_size: maximum number of messages waiting to be sent.
+        :param send_rate: messages per second allowed towards each neighbour.
+        :param coalesce_window: seconds an alert waits to be replaced by a newer reading of the same sensor.
         """
-        super(BroadcastSystem, self).__init__(host_address, port)
+        self.host = host_address
+        self.port = port
         self.vehicle_id = vehicle_id
-        self.pair_list = {}
+        self.peers = PeerRegistry()
         self.broadcast_port = 33341
-        self.lock = threading.Lock()
         self.listening_port = port
         self.sending_port = sending_port
         self.gps = gps
         # TODO: replace above code with the self.GPS defined in the control.py
         self.sock = None
-        self.route_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        self.get_route_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        self.route_table = {}
+        # created on first use; nodes on a NodeRuntime send through the runtime's multicast socket
+        self.route_sock = None
+        self.routes = RouteTable()
+        self.neighbourhood = spatial_index.GridIndex()
+        self.pending_alerts = threading.local()
+        self.session_keys = SessionKeyManager(vehicle_id)
+        self.connection_pool = PeerConnectionPool(source_host=host_address, handshake=self.session_keys.key_exchange_frame)
+        self.send_queue = OutboundQueue(self.deliver, maxsize=send_queue_size, rate=send_rate,
+                                        coalesce_window=coalesce_window)
+        self.route_announcer = RouteAnnouncer(vehicle_id, self.routes.snapshot, self.multicast_route_update)
+        self.route_receiver = RouteUpdateReceiver()
+        self.peer_expiry = ExpiryHeap()
+        # set in worker processes: sends are handed to the owner process
+        self.owner_link = None
+        self.worker_pool = None
+        self.runtime = None
+        self.route_expiry = ExpiryHeap()
+        # routed messages forwarded (loop detection) and authenticated ones delivered here
+        self.forwarded_messages = routing_header.SeenMessages()
+        self.seen_messages = routing_header.SeenMessages()
+        # node id -> time of the last routed key exchange sent to it
+        self.routed_keys = {}
+
+    @property
+    def pair_list(self) -> dict:
+        """
+        Read-only snapshot of the neighbours, node id -> Peer.
+        """
+        return self.peers.snapshot()
+
+    @property
+    def route_table(self) -> dict:
+        """
+        Read-only snapshot of the routing table, destination -> {'hop', 'through'}.
+        """
+        return self.routes.snapshot()
 
     def route_add(self, node_information: dict):
         """
-        Add new entry to the routing table.
+        Add new entry to the routing table, or refresh the direct route of a node that
+        is still within range. Called for every discovery beacon.
         :param node_information: remote node information received from broadcast.
         """
         node = node_information['node']
-        if node not in self.route_table.keys():
-            node_gps = node_information['location']
-            node_coordinate = (node_gps[0], node_gps[1])
-            distance = geopy.distance.geodesic(self.gps, node_coordinate).meters
-            logger.debug(self.gps, node_coordinate, distance)
-            if distance < 20:
-                self.route_table[node] = {'hop': 1, 'through': 'self'}
-                logger.info(f"ROUTE TABLE UPDATE : {self.route_table}")
-                self.broadcast_route_table()
-
-    def receive_route(self):
-        """
-        Receive route table from the neighbouring nodes.
-        """
-        self.get_route_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.get_route_sock.bind(('', MCAST_PORT))
-        mreq = struct.pack("4sl", socket.inet_aton(MCAST_GRP), socket.INADDR_ANY)
-        self.get_route_sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-        while True:
-            table, addr = self.get_route_sock.recvfrom(10240)
-            decoded_table = json.loads(table, object_hook=lambda d: {int(k) if k.lstrip('-').isdigit() else k: v for k, v in d.items()})
-            logger.debug(f"DECODED TABLE from {addr} - {decoded_table}")
-            if decoded_table['node'] not in self.route_table.keys():
-                continue
-            update_flag = False
-            for node in decoded_table['route']:
-                if node == self.vehicle_id:
+        node_gps = node_information['location']
+        if node_gps is None:
+            return
+        node_coordinate = (node_gps[0], node_gps[1])
+        self.neighbourhood.update(node, node_coordinate)
+        distance = spatial_index.within_radius(self.gps, node_coordinate, NEIGHBOUR_RADIUS)
+        logger.debug(f"{self.gps} {node_coordinate} {distance}")
+        if distance is None:
+            # out of range: a known direct route is left to expire
+            return
+        self.route_expiry.touch(node, time.monotonic() + PEER_TIMEOUT)
+        record = self.routes.get(node)
+        if record is not None and record['through'] == 'self':
+            return
+        direct = {'hop': 1, 'through': 'self'}
+        updates, _ = self.routes.apply(
+            lambda routes: ({node: direct} if routes.get(node, {}).get('through') != 'self' else {}, ()))
+        if updates:
+            logger.info(f"ROUTE TABLE UPDATE : {self.route_table}")
+            self.route_announcer.mark_changed([node])
+
+    def nodes_within(self, radius: float, origin: tuple = None) -> list:
+        """
+        Discovered nodes within a radius of a point.
+        :param radius: radius in metres.
+        :param origin: (latitude, longitude), the node's own location by default.
+        :return: list of (distance, node id) sorted by distance.
+        """
+        return self.neighbourhood.within(origin if origin is not None else self.gps, radius)
+
+    def handle_route_packet(self, packet: bytes, addr):
+        """
+        Process a route update datagram (delta or full snapshot) from a neighbouring node.
+        :param packet: received datagram.
+        :param addr: address of the sender.
+        """
+        try:
+            update = self.route_receiver.receive(packet)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.debug(f"bad route update from {addr} {e}")
+            return
+        if update is None or update.node == self.vehicle_id or update.node not in self.routes:
+            return
+        logger.debug(f"ROUTE UPDATE from {addr} - {update.node} {update.routes} {update.removed}")
+        self.apply_route_update(update)
+
+    def apply_route_update(self, update):
+        """
+        Merge a route update from a neighbour into the routing table in one atomic change.
+        Only direct neighbours are used as next hops, so every learned route goes through
+        a direct route and withdrawing it never leaves a dangling route behind.
+        :param update: RouteUpdate received from the neighbouring node.
+        """
+        through = update.node
+        refreshed = []
+
+        def compute(routes):
+            refreshed.clear()
+            if routes.get(through, {}).get('through') != 'self':
+                return {}, ()
+            updates = {}
+            unreachable = []
+            for node, hop in update.routes:
+                if node == self.vehicle_id or node == through:
+                    continue
+                new_hop = hop + 1
+                record = routes.get(node)
+                if new_hop > MAX_HOPS:
+                    if record is not None and record['through'] == through:
+                        unreachable.append(node)
+                    continue
+                if record is None or new_hop < record['hop'] or \
+                        (record['through'] == through and new_hop != record['hop']):
+                    updates[node] = {'hop': new_hop, 'through': through}
+                elif record['through'] != through:
                     continue
-                new_hop = decoded_table['route'][node]['hop'] + 1
-                # through = self.get_node_id(addr)
-                through = decoded_table['node']
-                if node not in self.route_table.keys():
-                    self.route_table[node] = {'hop': new_hop, 'through': through}
-                    update_flag = True
-                elif new_hop < self.route_table[node]['hop']:
-                    self.route_table[node] = {'hop': new_hop, 'through': through}
-                    update_flag = True
-            self.check_null_route(decoded_table)
-            if update_flag:
-                self.broadcast_route_table()
-
-    def check_null_route(self, remote_route_table: dict):
+                refreshed.append(node)
+            withdrawn = unreachable + self.check_null_route(update, routes)
+            return updates, with_dependents(routes, withdrawn, keep=updates) if withdrawn else ()
+
+        updates, removed = self.routes.apply(compute)
+        deadline = time.monotonic() + ROUTE_TIMEOUT
+        for node in refreshed:
+            self.route_expiry.touch(node, deadline)
+        self.routes_removed(removed)
+        if updates:
+            self.route_announcer.mark_changed(list(updates))
+
+    def check_null_route(self, update, routes: dict) -> list:
         """
         Check for null/old non-existent routes in the neighbours routing table.
-        If null route exist, remove the entry from the self routing table.
-        :param remote_route_table: route table of the neighbouring node.
+        A full snapshot withdraws every route through the neighbour it does not list,
+        a delta only the destinations it lists as removed.
+        :param update: RouteUpdate received from the neighbouring node.
+        :param routes: routing table snapshot to check.
+        :return: list of the withdrawn destinations.
+        """
+        route_through_node = [node for node, record in routes.items() if record['through'] == update.node]
+        if update.full:
+            nodes = {node for node, _ in update.routes}
+            return [node for node in route_through_node if node not in nodes]
+        removed = set(update.removed)
+        return [node for node in route_through_node if node in removed]
+
+    def peer_formats(self, node_id):
+        """
+        Wire formats announced by a neighbour.
+        :param node_id: id of the neighbour.
+        :return: list of formats or None.
         """
-        remove_route = []
-        route_through_node = [i for i in self.route_table if self.route_table[i]['through'] == remote_route_table['node']]
-        nodes = list(remote_route_table['route'].keys())
-        for node in route_through_node:
-            if node not in nodes:
-                remove_route.append(node)
-        self.route_delete(remove_route)
+        peer = self.peers.get(node_id)
+        return peer.formats if peer is not None else None
 
     def get_node_id(self, remote_addr: tuple):
         """
@@ -126,197 +242,408 @@ class BroadcastSystem(HostConfigure):
         :param remote_addr: ip address and port number of the remote node.
         :return: int: id of the resulting node.
         """
-        for node in list(self.pair_list):
-            if remote_addr[0] == self.pair_list[node].host and int(remote_addr[1]) == self.pair_list[node].port:
-                return node
+        return self.peers.node_for(remote_addr[0], remote_addr[1])
 
     def broadcast_route_table(self):
         """
-        Broadcast route table to neighbouring nodes.
+        Broadcast the full route table to neighbouring nodes with the next route update.
         """
-        self.route_sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MCAST_TTL)
-        send_route_db = {'node': self.vehicle_id, 'route': self.route_table}
-        route_table_json = json.dumps(send_route_db)
-        self.route_sock.sendto(route_table_json.encode('utf-8'), (MCAST_GRP, MCAST_PORT))
+        self.route_announcer.request_snapshot()
+
+    def multicast_route_update(self, packet: bytes):
+        """
+        Multicast one route update datagram.
+        :param packet: encoded route update.
+        """
+        if self.runtime is not None:
+            self.runtime.multicast(packet)
+            return
+        if self.route_sock is None:
+            self.route_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            self.route_sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MCAST_TTL)
+        self.route_sock.sendto(packet, (MCAST_GRP, MCAST_PORT))
 
     def route_delete(self, node_list):
         """
-        Remove unreachable routes from the route table.
+        Remove unreachable routes from the route table, along with the routes through them.
         :param node_list: nodes to be removed from the route table.
         """
         if not node_list:
             return
-        self.lock.acquire()
-        for node in node_list:
-            try:
-                pop = self.route_table.pop(node)
-                logger.info(f"popped route {node} {pop}")
-            except KeyError as e:
-                pass
-        self.lock.release()
+        _, removed = self.routes.apply(lambda routes: ({}, with_dependents(routes, node_list)))
+        self.routes_removed(removed)
+
+    def routes_removed(self, removed: dict):
+        """
+        Log and announce routes removed from the route table.
+        :param removed: removed destination -> record.
+        """
+        if not removed:
+            return
+        for node, pop in removed.items():
+            self.route_expiry.discard(node)
+            logger.info(f"popped route {node} {pop}")
         logger.info(f"updated route_table {self.route_table}")
-        self.broadcast_route_table()
-
-    def peer_list_updater(self):
-        """
-        Discover neighbouring nodes using broadcast system and update the route table
-        and pair_list - maintaining the neighbours' node information.
-        """
-        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        client.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-        client.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        client.bind(("", self.broadcast_port))
-        while True:
-            data = client.recvfrom(10240)
-            decoded_data = json.loads(data[0].decode('utf-8'))
-            node_id = decoded_data['node']
-            peer_host = decoded_data['host']
-            peer_port = int(decoded_data['port'])
-            flag = [peer_host == self.pair_list[key].host and peer_port == self.pair_list[key].port for key in list(self.pair_list)]
-            if not any(flag):
-                self.lock.acquire()
-                self.pair_list[node_id] = HostConfigure(peer_host, peer_port)
-                logger.info(f"index - {node_id} {self.pair_list[node_id]}")
-                self.route_add(decoded_data)
-                self.lock.release()
+        self.route_announcer.mark_changed(list(removed))
+
+    def handle_beacon(self, decoded_data: dict):
+        """
+        Update the route table and pair_list - maintaining the neighbours' node
+        information - from a discovery beacon.
+        :param decoded_data: decoded beacon.
+        """
+        node_id = decoded_data['node']
+        if node_id == self.vehicle_id:
+            return
+        peer_host = decoded_data['host']
+        peer_port = int(decoded_data['port'])
+        if 'public_key' in decoded_data:
+            self.session_keys.add_peer_key(node_id, decoded_data['public_key'])
+        peer, is_new = self.peers.upsert(node_id, peer_host, peer_port, decoded_data.get('formats'))
+        self.peer_expiry.touch(node_id, peer.last_seen + PEER_TIMEOUT)
+        self.route_add(decoded_data)
+        if is_new:
+            logger.info(f"index - {node_id} {peer}")
             logger.info("PeerList-Starts----->")
-            logger.info([(self.pair_list[i].host, self.pair_list[i].port) for i in self.pair_list])
+            logger.info([peer.address for peer in self.pair_list.values()])
             logger.info("PeerList-Ends---->")
 
-    def broadcast_information(self):
+    def beacon(self) -> bytes:
         """
-        Broadcast self information to the neighbouring nodes.
+        Discovery beacon broadcasting self information to the neighbouring nodes.
+        :return: encoded beacon.
         """
-        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        server.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         # TODO: add custom message for infra (without gps data), can use the hasattr method
-        message = {'node': self.vehicle_id, 'host': self.host, 'port': self.port, 'send_port': self.sending_port, 'location': self.gps}
-        encode_data = json.dumps(message, indent=2).encode('utf-8')
-        while True:
-            server.sendto(encode_data, ('<broadcast>', self.broadcast_port))
-            time.sleep(5)
-
-    def information_listener(self, handler):
-        """
-        Receive sensor information from neighbouring nodes.
-        :param handler:  handler function to process the received readings.
-        """
-        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        server.bind((self.host, self.port))
-        server.listen(32)
-        # server.setblocking(False)     will try in selectors
-        while True:
-            conn, addr = server.accept()
-            conn.setblocking(False)
-            try:
-                recv_data = conn.recv(10240)
-                decrypt_data = encryption.do_decrypt(recv_data)
-                logger.info(f'decrypted data : {decrypt_data} from {addr}')
-                if 'relay' in decrypt_data.keys():
-                    record = self.route_table[decrypt_data['relay']]
-                    if record['through'] == 'self':
-                        node = record['node']
-                        decrypt_data.pop('relay')
-                    else:
-                        node = record['through']
-                    peer_host = self.pair_list[node].host
-                    peer_port = self.pair_list[node].port
-                    flag = self.send_messages(peer_host, peer_port, recv_data)
-                handler(decrypt_data)
-            except Exception as e:
-                pass
-                # logger.error(f"error receiving {e} {addr}")
-            conn.close()
+        message = {'node': self.vehicle_id, 'host': self.host, 'port': self.port, 'send_port': self.sending_port, 'location': self.gps,
+                   'public_key': self.session_keys.public_key_pem, 'formats': wire_format.SUPPORTED_FORMATS}
+        return json.dumps(message, indent=2).encode('utf-8')
+
+    def expire_soft_state(self, now: float = None):
+        """
+        Drop the peers whose beacons stopped and the routes nobody refreshed.
+        Everything expiring in the same sweep goes out as a single route update.
+        :param now: current monotonic time.
+        """
+        now = time.monotonic() if now is None else now
+        stale_peers = [node for node in self.peer_expiry.expired(now) if node in self.peers]
+        stale_routes = self.route_expiry.expired(now)
+        if stale_peers or stale_routes:
+            logger.info(f"expired peers {stale_peers} routes {stale_routes}")
+            self.drop_peers(stale_peers, stale_routes)
+
+    def process_message(self, recv_data, addr, handler):
+        """
+        Authenticate and decrypt one received frame, relay it if required and pass it to the handler.
+        Frames failing the AES-GCM tag check are dropped before any parsing; routed frames
+        for other nodes are forwarded without being opened.
+        :param recv_data: received frame.
+        :param addr: address of the remote node.
+        :param handler: handler function to process the received readings.
+        """
+        routed = None
+        if routing_header.is_routed(recv_data):
+            routed = self.route_frame(recv_data)
+            if routed is None:
+                return
+            recv_data = routing_header.inner(recv_data)
+        try:
+            opened = self.session_keys.open(recv_data)
+        except encryption.AuthenticationError as e:
+            logger.debug(f"rejected frame {e} {addr}")
+            return
+        if opened is None:
+            return
+        # only recorded once authenticated, so a forged header cannot hide a real message
+        if routed is not None and not self.seen_messages.add(*routed):
+            return
+        try:
+            message = wire_format.decode(opened[1])
+            logger.debug('decrypted data : %s from %s', message, addr)
+            if 'relay' in message.keys() and message['relay'] != self.vehicle_id:
+                if self.owner_link is not None:
+                    self.owner_link.send('relay', bytes(opened[1]))
+                else:
+                    self.relay(opened[1], message)
+            message.pop('relay', None)
+            for record in message.get('batch', (message,)):
+                handler(record)
+        except Exception as e:
+            logger.debug(f"error receiving {e} {addr}")
+
+    def route_frame(self, frame):
+        """
+        Take a routed frame: forward it as is unless this node is its destination.
+        :param frame: received routed frame.
+        :return: (origin, message id) of a frame to open here, or None.
+        """
+        try:
+            destination, hops, message_id, origin = routing_header.read(frame)
+        except routing_header.RoutingError as e:
+            logger.debug(f"bad routed frame {e}")
+            return None
+        if destination != self.vehicle_id:
+            if self.owner_link is not None:
+                self.owner_link.send('forward', frame)
+            else:
+                self.forward(frame)
+            return None
+        return origin, message_id
+
+    def forward(self, frame) -> bool:
+        """
+        Forward a routed frame to the next hop of the route to its destination, without
+        decrypting or parsing it. Frames out of hops or seen before (looping) are dropped.
+        :param frame: received routed frame.
+        :return: True if the frame was queued.
+        """
+        destination, hops, message_id, origin = routing_header.read(frame)
+        if hops <= 1 or not self.forwarded_messages.add(origin, message_id):
+            logger.debug(f"dropping message {origin}:{message_id} to {destination}, {hops} hops left")
+            return False
+        record = self.route_table.get(destination)
+        if record is None:
+            logger.debug(f"no route to {destination}, dropping message {origin}:{message_id}")
+            return False
+        next_hop = destination if record['through'] == 'self' else record['through']
+        return self.send_queue.put(next_hop, routing_header.forwarded(frame, destination, hops, message_id))
+
+    def relay(self, payload, message: dict = None):
+        """
+        Queue a received message towards its relay destination. Only used for the relay
+        field of nodes predating routed frames.
+        :param payload: decrypted payload carrying the relay field.
+        :param message: decoded payload, decoded here if not given.
+        """
+        if message is None:
+            message = wire_format.decode(payload)
+        destination = message['relay']
+        record = self.route_table.get(destination)
+        if record is None:
+            logger.debug(f"no route to {destination}, dropping relayed message")
+            return
+        if record['through'] == 'self':
+            node = destination
+            relay_data = self.session_keys.seal(
+                wire_format.encode({key: value for key, value in message.items() if key != 'relay'},
+                                   wire_format.negotiate(self.peer_formats(node))))
+        else:
+            node = record['through']
+            relay_data = self.session_keys.seal(payload)
+        self.send_queue.put(node, relay_data)
 
     def send_information(self, data):
         """
-        Send sensor readings to all neighbouring nodes using pair_list and route table.
+        Queue sensor readings for all neighbouring nodes using pair_list and route table;
+        for true broadcasts only, see send_to and geocast for replies and area messages.
+        The call returns immediately, the messages are delivered by the send_queue workers.
         :param data: sensor readings.
         """
-        time.sleep(2)
-        delNode = []
-        for peer in list(self.pair_list):
-            peer_host = self.pair_list[peer].host
-            peer_port = int(self.pair_list[peer].port)
-            if self.host == peer_host and self.port == peer_port:
+        if isinstance(data, str):
+            data = json.loads(data)
+        pending = getattr(self.pending_alerts, 'records', None)
+        if pending is not None:
+            pending.append(data)
+            return
+        if self.owner_link is not None:
+            self.owner_link.send('send', data)
+            return
+        own_address = (self.host, self.port)
+        self.queue_for(data, [node_id for node_id, peer in self.pair_list.items() if peer.address != own_address])
+
+    def send_to(self, node_id, data, flood: bool = False):
+        """
+        Queue a message for a single node, over the next hop of its route.
+        :param node_id: id of the destination node.
+        :param data: message.
+        :param flood: send the message to every peer (send_information) when there is no route to the node.
+        :return: False if there is no route to the node, None in a worker process, where
+            the owner process sends the message.
+        """
+        if isinstance(data, str):
+            data = json.loads(data)
+        if self.owner_link is not None:
+            self.owner_link.send('send_to', node_id, data, flood)
+            return None
+        if self.queue_for(data, [node_id]) > 0:
+            return True
+        if flood:
+            logger.debug(f"no route to {node_id}, flooding")
+            self.send_information(data)
+        else:
+            logger.debug(f"no route to {node_id}")
+        return False
+
+    def geocast(self, data, radius: float, origin: tuple = None) -> int:
+        """
+        Queue a message for every discovered node within a radius of a point.
+        :param data: message.
+        :param radius: radius in metres.
+        :param origin: (latitude, longitude), the node's own location by default.
+        :return: number of nodes the message was queued for.
+        """
+        if isinstance(data, str):
+            data = json.loads(data)
+        if self.owner_link is not None:
+            self.owner_link.send('geocast', data, radius, origin)
+            return 0
+        return self.queue_for(data, [node for _, node in self.nodes_within(radius, origin) if node != self.vehicle_id])
+
+    def queue_for(self, data: dict, destinations) -> int:
+        """
+        Serialize, encrypt and queue a message for some destinations. The message is
+        serialized and encrypted once per wire format and the same ciphertext is shared
+        by every destination using that format; destinations beyond the neighbours get
+        it behind a routing header, sent to the next hop of their route.
+        :param data: message.
+        :param destinations: ids of the destination nodes; those without a route are skipped.
+        :return: number of destinations the message was queued for.
+        """
+        sensor_id = data.get('senorId')
+        if 'relay' in data:
+            data = {key: value for key, value in data.items() if key != 'relay'}
+        body = json.dumps(data)
+        queued = 0
+        sealed = {}
+        route_table = self.route_table
+        for node_id in destinations:
+            record = route_table.get(node_id)
+            if record is None:
                 continue
-            node_id = self.get_node_id((peer_host, peer_port))
-            try:
-                record = self.route_table[node_id]
-            except KeyError as e:
+            coalesce_key = (sensor_id, node_id) if sensor_id is not None else None
+            next_hop = record['through']
+            if next_hop != 'self' and not self.send_routed_key(node_id, next_hop):
+                # the node cannot be given our session key: seal for the next hop, which relays it
+                self.send_queue.put(next_hop, self.session_keys.seal(relay_envelope(body, node_id)), coalesce_key)
+                queued += 1
                 continue
-            if record['through'] != 'self':
-                next_hop = record['through']
-                peer_host = self.pair_list[next_hop].host
-                peer_port = self.pair_list[next_hop].port
-                if isinstance(data, str):
-                    data = json.loads(data)
-                data.update({'relay': node_id})
-            data = json.dumps(data)
-            enc_data = encryption.do_encrypt(data)
-            logger.debug(f"normal data {data}\n encrypted data {enc_data}")
-            flag = self.send_messages(peer_host, peer_port, enc_data)
-            if not flag and len(self.pair_list) > 1:
-                logger.debug(f"key {peer}")
-                delNode.append(peer)
-        self.reorder_pairlist(delNode)
-        self.route_delete(delNode)
-        delNode.clear()
-        time.sleep(7)
+            peer_format = wire_format.negotiate(self.peer_formats(node_id))
+            enc_data = sealed.get(peer_format)
+            if enc_data is None:
+                payload = body.encode('utf-8') if peer_format == wire_format.FORMAT_JSON \
+                    else wire_format.encode(data, peer_format)
+                enc_data = sealed[peer_format] = self.session_keys.seal(payload)
+                logger.debug(f"normal data {payload}\n encrypted data {enc_data}")
+            if next_hop == 'self':
+                self.send_queue.put(node_id, enc_data, coalesce_key)
+            else:
+                routed = routing_header.wrap(node_id, MAX_HOPS, routing_header.new_message_id(), enc_data)
+                self.send_queue.put(next_hop, routed, coalesce_key)
+            queued += 1
+        return queued
+
+    def send_routed_key(self, node_id, next_hop) -> bool:
+        """
+        Hand the session key of this node to a node beyond the neighbours, as a routed key
+        exchange frame queued ahead of the messages, at most every ROUTED_KEY_INTERVAL.
+        :param node_id: id of the destination node.
+        :param next_hop: neighbour on the route to the node.
+        :return: False if the node's public key is unknown, so it cannot open our frames.
+        """
+        frame = self.session_keys.key_exchange_frame(node_id)
+        if frame is None:
+            return False
+        now = time.monotonic()
+        if now - self.routed_keys.get(node_id, -ROUTED_KEY_INTERVAL) >= ROUTED_KEY_INTERVAL:
+            self.routed_keys[node_id] = now
+            self.send_queue.put(next_hop, routing_header.wrap(node_id, MAX_HOPS, routing_header.new_message_id(), frame))
+        return True
+
+    @contextlib.contextmanager
+    def alert_batch(self):
+        """
+        Collect every send_information call made by this thread inside the block and
+        send them as a single multi-record frame per destination when the block exits.
+        """
+        if getattr(self.pending_alerts, 'records', None) is not None:
+            yield
+            return
+        records = self.pending_alerts.records = []
+        try:
+            yield
+        finally:
+            self.pending_alerts.records = None
+            if len(records) == 1:
+                self.send_information(records[0])
+            elif records:
+                self.send_information({'batch': records})
+
+    def deliver(self, node, enc_data):
+        """
+        Send one queued message to a neighbouring node; called by the send_queue workers.
+        :param node: id of the neighbouring node.
+        :param enc_data: encrypted data to send.
+        """
+        peer = self.peers.get(node)
+        if peer is None:
+            return
+        flag = self.send_messages(peer.host, peer.port, enc_data, node)
+        if not flag:
+            logger.debug(f"send to {node} failed")
+            self.remove_dead_peers()
+
+    def remove_dead_peers(self):
+        """
+        Remove the peers the connection pool has marked dead from pair_list and the route table.
+        """
+        if len(self.peers) <= 1:
+            return
+        delNode = [peer for peer in self.connection_pool.dead_peers() if peer in self.peers]
+        if delNode:
+            self.drop_peers(delNode)
+
+    def drop_peers(self, node_list, routes=()):
+        """
+        Forget neighbours, the routes through them and the given routes, with one route update.
+        :param node_list: neighbours to be removed.
+        :param routes: additional destinations to be removed from the route table.
+        """
+        if node_list:
+            self.reorder_pairlist(node_list)
+        self.route_delete(set(routes) | set(node_list))
+        for peer in node_list:
+            self.peer_expiry.discard(peer)
+            self.connection_pool.forget(peer)
+            self.session_keys.forget(peer)
+            self.routed_keys.pop(peer, None)
+            self.neighbourhood.remove(peer)
+            self.send_queue.discard(peer)
 
     def reorder_pairlist(self, delete_node):
         """
         Remove inactive nodes from pair_list.
         :param delete_node: inactive nodes.
         """
-        self.lock.acquire()
-        for node in delete_node:
-            pop = self.pair_list.pop(node)
-            logger.info(f"popped index {node} {pop}")
-        self.lock.release()
-        logger.info([(self.pair_list[i].host, self.pair_list[i].port) for i in self.pair_list])
+        for pop in self.peers.remove(delete_node):
+            logger.info(f"popped index {pop.node_id} {pop}")
+        logger.info([peer.address for peer in self.pair_list.values()])
 
-    def send_messages(self, host, port, data):
+    def send_messages(self, host, port, data, node=None):
         """
-        Send encrypted data to mentioned host and pair.
+        Send encrypted data to mentioned host and pair over the pooled connection.
         :param host: ip address of the neighbouring node.
         :param port: port number of the neighbouring node.
         :param data: encrypted data to send.
+        :param node: id of the neighbouring node, used as the pool key.
         :return: status code of the message sent.
         """
-        server_address = (host, port)
-        flag = True
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        # self.sock.setblocking(False)
-        self.sock.bind((self.host, self.sending_port))
-        self.sock.connect_ex(server_address)
-        try:
-            self.sock.send(data)
-            self.sock.close()
-            return flag
-        except Exception as e:
-            logger.debug(f'{e} {server_address}')
-            self.sock.close()
-            return False
+        key = node if node is not None else (host, int(port))
+        return self.connection_pool.send(key, host, port, data)
 
-    def deploy(self, handler):
+    def deploy(self, handler, workers: int = 0, runtime=None):
         """
-        deploy the communication modules.
+        deploy the communication modules on an asyncio node runtime: the listener
+        accepts streams right away and the beacons, expiry sweeps and route updates
+        run as periodic tasks of the runtime's event loop.
         :param handler: handler method to process received data.
+        :param workers: number of worker processes sharing the listening port and running
+            the handler, 0 to receive in this process.
+        :param runtime: NodeRuntime to run on, a new one running in a background thread by default.
         """
-        server_thread = threading.Thread(target=self.broadcast_information)
-        peer_thread = threading.Thread(target=self.peer_list_updater)
-        route_thread = threading.Thread(target=self.receive_route)
-        info_thread = threading.Thread(target=self.information_listener, args=(handler,))
-        # sensor_thread = threading.Thread(target=self.send_information, args=( sending_port,))
-
-        server_thread.start()
-        peer_thread.start()
-        # TODO: do we require this part for infra as well? If yes, we have to update the infra class with GPS data
-        route_thread.start()
-        time.sleep(15)
-        info_thread.start()
-
-        # sensor_thread.start()
+        if workers:
+            # fork before any thread exists
+            self.worker_pool = WorkerPool(self, handler, workers)
+            self.worker_pool.start()
+        if runtime is None:
+            runtime = node_runtime.NodeRuntime()
+        runtime.add(self, handler, listen=self.worker_pool is None)
+        runtime.start()
@@ -0,0 +1,296 @@
+import logging
+import socket
+import threading
+import time
+
+import framing
+
+logger = logging.getLogger('v2vnode')
+
+
+def _sendall_parts(sock: socket.socket, parts: list):
+    """
+    Write several buffers to a stream with as few system calls as possible, without joining them.
+    :param sock: connected stream socket.
+    :param parts: buffers to write in order.
+    """
+    parts = [memoryview(part).cast('B') for part in parts]
+    while parts:
+        sent = sock.sendmsg(parts)
+        while parts and sent >= len(parts[0]):
+            sent -= len(parts[0])
+            parts.pop(0)
+        if sent:
+            parts[0] = parts[0][sent:]
+
+
+class PeerHealth:
+    """
+    Delivery health of a single peer as seen by the connection pool.
+    """
+
+    def __init__(self):
+        """
+        Initializer for the health record.
+        """
+        self.failures = 0
+        self.last_success = None
+        self.last_failure = None
+        self.retry_at = 0.0
+
+    def record_success(self):
+        """
+        Reset the failure streak after a successful send.
+        """
+        self.failures = 0
+        self.last_success = time.monotonic()
+        self.retry_at = 0.0
+
+    def record_failure(self, base_backoff: float, max_backoff: float):
+        """
+        Register a failed connect/send and schedule the next reconnect attempt.
+        :param base_backoff: delay after the first failure, in seconds.
+        :param max_backoff: upper bound of the exponential backoff, in seconds.
+        """
+        self.failures += 1
+        self.last_failure = time.monotonic()
+        delay = min(max_backoff, base_backoff * (2 ** (self.failures - 1)))
+        self.retry_at = self.last_failure + delay
+
+
+class PooledConnection:
+    """
+    A long-lived framed stream to one peer.
+    """
+
+    def __init__(self, address: tuple, sock: socket.socket):
+        """
+        Initializer for the pooled connection.
+        :param address: (host, port) of the remote peer.
+        :param sock: connected stream socket.
+        """
+        self.address = address
+        self.sock = sock
+        self.last_used = time.monotonic()
+        # the handshake frame is sent when the stream is opened
+        self.handshake_at = self.last_used
+        self.lock = threading.Lock()
+
+    def close(self):
+        """
+        Close the underlying socket, ignoring errors from an already dead stream.
+        """
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class PeerConnectionPool:
+    """
+    Keyed pool of persistent, length-prefixed TCP streams to the neighbouring nodes.
+
+    Connections are opened lazily on the first send to a peer and reused for every
+    following message. Streams that stay unused for ``idle_timeout`` seconds are
+    closed, failed peers are retried with exponential backoff, and peers failing
+    ``max_failures`` times in a row are reported as dead so the router can drop them.
+    The handshake frame is sent again every ``handshake_interval`` seconds on a busy
+    stream, so a peer that could not take it the first time (or forgot it) recovers
+    without waiting for the stream to go idle.
+    """
+
+    def __init__(self, source_host: str = '', idle_timeout: float = 60.0, connect_timeout: float = 2.0,
+                 base_backoff: float = 0.5, max_backoff: float = 30.0, max_failures: int = 5, handshake=None,
+                 handshake_interval: float = 5.0):
+        """
+        Initializer for the connection pool.
+        :param source_host: local ip address the outgoing streams are bound to.
+        :param idle_timeout: seconds of inactivity after which a stream is closed.
+        :param connect_timeout: timeout of connect and send calls, in seconds.
+        :param base_backoff: reconnect delay after the first failure, in seconds.
+        :param max_backoff: upper bound of the reconnect delay, in seconds.
+        :param max_failures: consecutive failures after which a peer is considered dead.
+        :param handshake: callable(key) returning a frame to send first on every new stream, or None.
+        :param handshake_interval: seconds after which the handshake frame is sent again on an open stream.
+        """
+        self.source_host = source_host
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_failures = max_failures
+        self.handshake = handshake
+        self.handshake_interval = handshake_interval
+        self.connections = {}
+        self.health = {}
+        self.lock = threading.Lock()
+        self.last_sweep = time.monotonic()
+
+    def _open(self, key, address: tuple) -> socket.socket:
+        """
+        Open a new stream to a peer and send the handshake frame, if any.
+        The source port is left to the kernel so bursts of reconnects never collide
+        on a fixed port in TIME_WAIT.
+        :param key: peer key (node id).
+        :param address: (host, port) of the remote peer.
+        :return: connected socket.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            sock.settimeout(self.connect_timeout)
+            if self.source_host:
+                sock.bind((self.source_host, 0))
+            sock.connect(address)
+            hello = self.handshake(key) if self.handshake is not None else None
+            if hello is not None:
+                sock.sendall(framing.encode_frame(hello))
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _get_health(self, key) -> PeerHealth:
+        """
+        Return the health record of a peer, creating it if needed.
+        :param key: peer key (node id).
+        :return: PeerHealth of the peer.
+        """
+        health = self.health.get(key)
+        if health is None:
+            health = self.health.setdefault(key, PeerHealth())
+        return health
+
+    def _get_connection(self, key, address: tuple) -> PooledConnection:
+        """
+        Return the pooled connection of a peer, opening a new one when required.
+        :param key: peer key (node id).
+        :param address: (host, port) of the remote peer.
+        :return: PooledConnection to the peer.
+        """
+        with self.lock:
+            conn = self.connections.get(key)
+            if conn is not None and conn.address != address:
+                # peer re-announced itself on a different address
+                self.connections.pop(key)
+                conn.close()
+                conn = None
+        if conn is None:
+            conn = PooledConnection(address, self._open(key, address))
+            with self.lock:
+                existing = self.connections.get(key)
+                if existing is not None and existing.address == address:
+                    conn.close()
+                    conn = existing
+                else:
+                    self.connections[key] = conn
+        return conn
+
+    def send(self, key, host: str, port: int, payload) -> bool:
+        """
+        Send one framed message to a peer over its pooled stream.
+        :param key: peer key (node id).
+        :param host: ip address of the peer.
+        :param port: listening port of the peer.
+        :param payload: message bytes, or a tuple of buffers forming the message.
+        :return: True if the message was handed to the kernel, False otherwise.
+        """
+        self.evict_idle()
+        health = self._get_health(key)
+        if health.failures and time.monotonic() < health.retry_at:
+            return False
+        address = (host, int(port))
+        if isinstance(payload, tuple):
+            frame = framing.encode_frame_parts(payload)
+            write = _sendall_parts
+        else:
+            frame = framing.encode_frame(payload)
+            write = socket.socket.sendall
+        # a stale stream is only detected on write, so retry once on a fresh one
+        for attempt in range(2):
+            try:
+                conn = self._get_connection(key, address)
+            except OSError as e:
+                logger.debug(f'connect failed {e} {address}')
+                break
+            try:
+                with conn.lock:
+                    now = time.monotonic()
+                    if self.handshake is not None and now - conn.handshake_at >= self.handshake_interval:
+                        hello = self.handshake(key)
+                        if hello is not None:
+                            conn.sock.sendall(framing.encode_frame(hello))
+                        conn.handshake_at = now
+                    write(conn.sock, frame)
+                    conn.last_used = now
+                health.record_success()
+                return True
+            except OSError as e:
+                logger.debug(f'send failed {e} {address}')
+                self.close(key, conn)
+        health.record_failure(self.base_backoff, self.max_backoff)
+        return False
+
+    def close(self, key, conn: PooledConnection = None):
+        """
+        Close the pooled stream of a peer.
+        :param key: peer key (node id).
+        :param conn: only close if this is still the pooled connection.
+        """
+        with self.lock:
+            current = self.connections.get(key)
+            if current is None or (conn is not None and current is not conn):
+                return
+            self.connections.pop(key)
+        current.close()
+
+    def forget(self, key):
+        """
+        Drop every trace of a peer (connection and health).
+        :param key: peer key (node id).
+        """
+        self.close(key)
+        self.health.pop(key, None)
+
+    def evict_idle(self):
+        """
+        Close the streams that have not been used for idle_timeout seconds.
+        The sweep runs at most once per half idle period.
+        """
+        now = time.monotonic()
+        if now - self.last_sweep < self.idle_timeout / 2:
+            return
+        self.last_sweep = now
+        with self.lock:
+            idle = [key for key, conn in self.connections.items() if now - conn.last_used > self.idle_timeout]
+            closing = [self.connections.pop(key) for key in idle]
+        for conn in closing:
+            logger.debug(f'closing idle connection {conn.address}')
+            conn.close()
+
+    def is_dead(self, key) -> bool:
+        """
+        Check if a peer has exceeded the allowed number of consecutive failures.
+        :param key: peer key (node id).
+        :return: bool
+        """
+        health = self.health.get(key)
+        return health is not None and health.failures >= self.max_failures
+
+    def dead_peers(self) -> list:
+        """
+        Return the keys of every peer considered dead.
+        :return: list of peer keys.
+        """
+        return [key for key in list(self.health) if self.is_dead(key)]
+
+    def close_all(self):
+        """
+        Close every pooled stream.
+        """
+        with self.lock:
+            closing = list(self.connections.values())
+            self.connections.clear()
+        for conn in closing:
+            conn.close()
@@ -2,12 +2,14 @@
 import logging
 import argparse
 import time
-import threading
 import random
 import sensor_data_generators as sdg
+import sensor_trace
+from sensor_registry import SensorRegistry
+from rule_engine import RuleEngine
+import poi_index
 import broadcast_system as bs
 from random import randint
-import json
 
 
 logging.basicConfig(level=logging.INFO)
@@ -15,6 +17,17 @@ args_parser = argparse.ArgumentParser()
 args_parser.add_argument('--nodeid', help='a number', required=False)
 
 FUEL_LIMIT = 80
+# Weather alerts go to the nodes within this many metres of the infra.
+WEATHER_RADIUS = 2000
+
+# Rules of an infra node started without a rule file (infra_rules.json is an example of one)
+DEFAULT_RULES = {'rules': [
+    {'name': 'low-lights', 'sensor': 'LT', 'suppress': 60, 'action': 'lights_on'},
+    # vehicles repeat the low fuel alert every tick below FUEL_LIMIT
+    {'name': 'low-fuel', 'sensor': 'FLG', 'suppress': 300, 'action': 'gas_station'},
+    {'name': 'passenger-in-danger', 'sensor': 'HRS', 'when': {'outside': [60, 100]}, 'suppress': 30,
+     'action': 'hospital'},
+]}
 
 
 class InfraControls(bs.BroadcastSystem):
@@ -28,56 +41,110 @@ class InfraControls(bs.BroadcastSystem):
     Super Class:
         bs (BroadcastSystem): Abstraction for the data layer.
     """
-    def __init__(self, vehicle_id, host_address, listening_port, sending_port, latitude, longitude):
+    def __init__(self, vehicle_id, host_address, listening_port, sending_port, latitude, longitude,
+                 rules_path=None, pois_path=None):
         """
         Constructor
+
+        Args:
+            rules_path (str): JSON rule file, reloaded when it changes; DEFAULT_RULES if None.
+            pois_path (str): POI index or CSV dataset of the hospitals and gas stations.
         """
         super().__init__(vehicle_id, host_address, listening_port, sending_port, (latitude, longitude))
         self.sensors = """ list of sensors for infra--->  weather, """
         self.nodeId = vehicle_id
+        actions = {
+            'lights_on': self.turnOnLights,
+            'gas_station': self.sendGasStation,
+            'hospital': self.takeActionOnDanger,
+            'log': self.logAlert,
+        }
+        self.rules = RuleEngine(actions, DEFAULT_RULES, rules_path)
+        # built once and memory-mapped, so worker processes share its pages
+        self.pois = poi_index.load(pois_path) if pois_path is not None else None
 
     def runInfra(self):
-        """Starts the periodic updater thread
+        """Starts the periodic updater on the node runtime
         """
-        threading.Thread(target=self.periodic_updater).start()
+        self.runtime.every(10, self.weather_update)
 
     def information_processor(self, data):
         """
         Process the date received from the data layer.
 
         Args:
-            data (json string): Information recieved from the data layer.
-        """
-        logging.info("On infra--->[" + data + "]")
-        data = json.loads(data)
-        if data["senorId"] == "LT":
-            logging.info("Received LOW LIGHTS alert from vehicle[" + data["vehicleId"] + "]")
-            self.send_information({"infraNodeId": str(self.nodeId), "control": "Turn on lights"})
-            logging.info(" Successfully sent lights control signal to vehicle[" + data["vehicleId"] + "]")
-        elif data["senorId"] == "FLG":
-            logging.info("Received LOW FUEL alert from vehicle[" + data["vehicleId"] + "]")
-            self.send_information({"infraNodeId": str(self.nodeId), "destination": "Gas Station 10021", "dataType": "GPS", "lat": str(
+            data (dict): Information recieved from the data layer.
+        """
+        logging.debug("On infra--->[%s]", data)
+        self.rules.evaluate(data)
+
+    def turnOnLights(self, data, rule=None):
+        """Sends the lights control signal to a vehicle reporting low lights.
+
+        Args:
+            data (json): Data recieved from the data layer
+            rule (Rule): rule that matched.
+        """
+        logging.info("Received LOW LIGHTS alert from vehicle[" + data["vehicleId"] + "]")
+        self.reply(data, {"infraNodeId": str(self.nodeId), "control": "Turn on lights"})
+        logging.info(" Successfully sent lights control signal to vehicle[" + data["vehicleId"] + "]")
+
+    def sendGasStation(self, data, rule=None):
+        """Sends a gas station location to a vehicle low on fuel.
+
+        Args:
+            data (json): Data recieved from the data layer
+            rule (Rule): rule that matched.
+        """
+        logging.info("Received LOW FUEL alert from vehicle[" + data["vehicleId"] + "]")
+        station = self.nearestPoi('gas_station', data)
+        if station is not None:
+            self.reply(data, {"infraNodeId": str(self.nodeId), "destination": station[0], "dataType": "GPS",
+                              "lat": str(station[1]), "lon": str(station[2])})
+        else:
+            self.reply(data, {"infraNodeId": str(self.nodeId), "destination": "Gas Station 10021", "dataType": "GPS", "lat": str(
                 53.3498 - randint(0, 10)) + '", "lon" : "' + str(6.2603 - randint(0, 10))})
-            logging.info(" Successfully sent GAS STATION info to vehicle[" + data["vehicleId"] + "]")
-        elif data["senorId"] == "HRS" and ( data["senorReading"] < 60 or data["senorReading"] > 100) :
-            self.takeActionOnDanger(data)
+        logging.info(" Successfully sent GAS STATION info to vehicle[" + data["vehicleId"] + "]")
 
-    # Thread to push periodic updates to all connected nodes
-    def periodic_updater(self):
+    def reply(self, data, message):
+        """Sends a message to the vehicle that sent an alert only, or to every peer
+        if there is no route to the vehicle.
+
+        Args:
+            data (json): Data recieved from the data layer
+            message (dict): reply to send.
         """
-        Thread which periodically updates the connected nodes with 
-        necessary updates and information.
+        try:
+            vehicle = int(data["vehicleId"])
+        except (KeyError, ValueError):
+            logging.debug("Alert without a vehicle to reply to [%s]", data)
+            return
+        self.send_to(vehicle, message, flood=True)
+
+    def logAlert(self, data, rule=None):
+        """Only logs the alert that matched a rule.
+
+        Args:
+            data (json): Data recieved from the data layer
+            rule (Rule): rule that matched.
         """
-        while True:
-            predictions = ['rainy', 'sunny', 'windy', 'overcast']
-            self.send_information({"infraNodeId": str(self.nodeId), "alert": "Weather alert", "senorId": "WTR", "senorReading": random.choices(predictions)[0]})
-            time.sleep(10)
-    def takeActionOnDanger(self, data) :
+        logging.info(f"Rule [{rule.name if rule else ''}] matched {data.get('senorId')} alert "
+                     f"from vehicle[{data.get('vehicleId')}]: {data.get('senorReading')}")
+
+    def weather_update(self):
+        """
+        Sends one weather update to the nodes around the infra.
+        """
+        predictions = ['rainy', 'sunny', 'windy', 'overcast']
+        self.geocast({"infraNodeId": str(self.nodeId), "alert": "Weather alert", "senorId": "WTR", "senorReading": random.choices(predictions)[0]},
+                     WEATHER_RADIUS)
+    def takeActionOnDanger(self, data, rule=None) :
         """Decides the action to be taken on receiving 
         a passenger in danger alert.
 
         Args:
             data (json): Data recieved from the data layer
+            rule (Rule): rule that matched.
         """
         logging.info("Received PASSENGER IN DANGER alert from vehicle[" + data["vehicleId"] + "]")
         self.findNearestHospital(data)
@@ -89,20 +156,69 @@ class InfraControls(bs.BroadcastSystem):
         Args:
             data (json): Data received from the data layer.
         """
-        self.send_information({"infraNodeId": str(self.nodeId), "destination": "Hospital X14S9AS", "dataType": "GPS", "lat": str(
+        hospital = self.nearestPoi('hospital', data)
+        if hospital is not None:
+            self.reply(data, {"infraNodeId": str(self.nodeId), "destination": hospital[0], "dataType": "GPS",
+                              "lat": str(hospital[1]), "lon": str(hospital[2])})
+            return
+        self.reply(data, {"infraNodeId": str(self.nodeId), "destination": "Hospital X14S9AS", "dataType": "GPS", "lat": str(
                 55.3584 - randint(0, 10)) + '", "lon" : "' + str(5.2953 - randint(0, 10))})
+
+    def nearestPoi(self, kind, data):
+        """Finds the POI of a kind nearest to the vehicle that sent an alert.
+
+        Args:
+            kind (str): POI kind, 'hospital' or 'gas_station'.
+            data (json): Data received from the data layer.
+
+        Returns:
+            [Tuple]: (name, latitude, longitude), None without a POI index or POI of the kind.
+        """
+        if self.pois is None:
+            return None
+        location = data.get("location")
+        if location is None:
+            # alerts without a location: where the vehicle's last beacon placed it
+            try:
+                location = self.neighbourhood.location(int(data["vehicleId"]))
+            except (KeyError, ValueError):
+                location = None
+        if location is None:
+            location = self.gps
+        nearest = self.pois.nearest_cached(kind, (float(location[0]), float(location[1])))
+        if not nearest:
+            return None
+        _, name, latitude, longitude = nearest[0]
+        return name, latitude, longitude
     
 
-    def deploy(self):
+    def deploy(self, workers=0, runtime=None):
         """
-        Starts the infra threads
+        Starts the infra on the node runtime
+
+        Args:
+            workers (int): number of worker processes handling the received data, 0 for none.
+            runtime (NodeRuntime): runtime to run on, a new one by default.
         """
-        super().deploy(self.information_processor)
+        super().deploy(self.information_processor, workers, runtime)
         self.runInfra()
 
 
 class VehicleControls(bs.BroadcastSystem):
-    def __init__(self, vehicle_id, host_address, listening_port, sending_port, latitude, longitude):
+    # handler of the readings of every sensor
+    HANDLERS = {
+        'SPD': 'process_speed_data',
+        'TP': 'process_tyre_pressure_data',
+        'LT': 'process_light_sensor_data',
+        'PRX': 'process_proximity_data',
+        'GPS': 'process_gps_data',
+        'HRS': 'process_HRS_data',
+        'BRK': 'process_brake_sensor_data',
+        'FLG': 'process_fuel_guage_data',
+    }
+
+    def __init__(self, vehicle_id, host_address, listening_port, sending_port, latitude, longitude,
+                 sensor_periods=None):
         super().__init__(vehicle_id, host_address, listening_port, sending_port, (latitude, longitude))
         self.vehicle_id = vehicle_id
         self.lane = random.choices([0, 1])
@@ -116,71 +232,123 @@ class VehicleControls(bs.BroadcastSystem):
         self.position = 0
         self.sensorMaster = sdg.Sensors()
         self.sensors = self.sensorMaster.getSensors()  # [""" list of sensor objects"""]
+        # TraceWriter recording every reading processed, if any
+        self.trace = None
+        # last GPS reading of the trace being replayed, attached to the alerts instead of a live one
+        self.replayed_location = None
+        # every sensor, the speed sensor included, polled at its own period
+        sensor_periods = sensor_periods or {}
+        self.sensor_registry = SensorRegistry()
+        for sensor in self.sensors + [self.sensorMaster.s1]:
+            self.sensor_registry.register(sensor, getattr(self, self.HANDLERS[sensor.SENSOR_ID]),
+                                          sensor_periods.get(sensor.SENSOR_ID))
+
+    def runVehicle(self, trace=None, speed=1.0):
+        """
+        Runs the sensor loop of the vehicle, or replays a recorded trace instead.
+
+        Args:
+            trace (TraceReader): trace to replay; the live sensors are read if None.
+            speed (float): replay speed, 1 for real time, N for N times faster, 0 for max speed.
+        """
+        if trace is not None:
+            sensor_trace.replay(trace, {self.vehicle_id: self}, speed)
+            return
+        delay = self.sensor_tick()
+        while delay is not None:
+            time.sleep(delay)
+            delay = self.sensor_tick()
 
-    def runVehicle(self):
-        while True:
-            for sensor in self.sensors:
-                data = sensor.GET_DATA()
-                # data = sensor()
-                if data[0] == 'SPD':
-                    self.process_speed_data(data)
-                elif data[0] == 'TP':
-                    self.process_tyre_pressure_data(data)
-                elif data[0] == 'LT':
-                    self.process_light_sensor_data(data)
-                elif data[0] == 'PRX':
-                    self.process_proximity_data(data)
-                elif data[0] == 'GPS':
-                    self.process_gps_data(data)
-                elif data[0] == 'HRS':
-                    self.process_HRS_data(data)
-                elif data[0] == 'BRK':
-                    self.process_brake_sensor_data(data)
-                elif data[0] == 'FLG':
-                    self.process_fuel_guage_data(data)
-            time.sleep(1)
+    def sensor_tick(self):
+        """
+        Reads and processes the sensors that are due.
+
+        Returns:
+            [float]: seconds until the next sensor is due, None if there is no sensor to poll.
+        """
+        readings = self.sensor_registry.poll()
+        if readings:
+            self.sensor_pass(readings)
+        next_due = self.sensor_registry.next_due()
+        return max(0.0, next_due - time.monotonic()) if next_due is not None else None
+
+    def sensor_pass(self, readings=None):
+        """
+        Processes one reading of every sensor and broadcasts the resulting alerts.
+
+        Args:
+            readings (list): GET_DATA lists to process instead of reading the
+                vehicle's own sensors (e.g. from FleetSensors).
+        """
+        if readings is None:
+            readings = (sensor.GET_DATA() for sensor in self.sensors)
+        if self.trace is not None:
+            readings = list(readings)
+        # every alert raised during one pass goes out as a single frame
+        dispatch = self.sensor_registry.dispatch
+        with self.alert_batch():
+            for data in readings:
+                dispatch(data)
+        if self.trace is not None:
+            # after the locations the alerts of the pass read
+            self.trace.record(self.vehicle_id, readings)
+
+    def alert_location(self):
+        """
+        Reads the location attached to an alert, recorded in the trace if any, or
+        the replayed one when replaying a trace.
+
+        Returns:
+            [list]: GET_DATA list of the GPS sensor.
+        """
+        if self.replayed_location is not None:
+            return self.replayed_location
+        location = self.sensorMaster.gps.GET_DATA()
+        if self.trace is not None:
+            self.trace.record(self.vehicle_id, [location], sensor_trace.LOCATION)
+        return location
 
     def process_fuel_guage_data(self, data):
         self.fuel = data[1]
         if data[1] < FUEL_LIMIT:
             logging.info(f'[{self.vehicle_id}] Broadcasting low fuel alert')
-            self.send_information({"vehicleId": str(self.vehicle_id), "alert" : "Low fuel", "senorId" : "FLG", "senorReading" : str(data[1])})
+            self.send_information({"vehicleId": str(self.vehicle_id), "alert" : "Low fuel", "senorId" : "FLG", "senorReading" : data[1]})
 
     def process_brake_sensor_data(self, data):
         self.brake = data[1]
         if data[1]:
             logging.info(f'[{self.vehicle_id}] Broadcasting stopping alert')
-            self.send_information({"vehicleId": str(self.vehicle_id), "alert" : "Brake applied", "senorId" : "BRK", "senorReading" : str(data[1])})
+            self.send_information({"vehicleId": str(self.vehicle_id), "alert" : "Brake applied", "senorId" : "BRK", "senorReading" : data[1]})
 
     def process_HRS_data(self, data):
         self.BP = data[1]
         if data[1] < 60 or data[1] > 100:
-            location = self.sensorMaster.gps.GET_DATA()
+            location = self.alert_location()
             logging.info(f'[{self.vehicle_id}] Broadcasting passenger in danger alert')
-            self.send_information({"vehicleId": str(self.vehicle_id), "alert" : "Low or high heart rate", "senorId" : "HRS", "senorReading" : str(data[1]), "location" : location[1] })
+            self.send_information({"vehicleId": str(self.vehicle_id), "alert" : "Low or high heart rate", "senorId" : "HRS", "senorReading" : data[1], "location" : location[1] })
 
     def process_gps_data(self, data):
         self.GPS = data[1]
         logging.info(f'[{self.vehicle_id}] Broadcasting GPS signal')
-        self.send_information({"vehicleId": str(self.vehicle_id), "alert" : "GPS co-ordinates", "senorId" : "GPS", "senorReading" : str(data[1])})
+        self.send_information({"vehicleId": str(self.vehicle_id), "alert" : "GPS co-ordinates", "senorId" : "GPS", "senorReading" : data[1]})
 
     def process_proximity_data(self, data):
         self.proximity = data[1]
         if data[1] == True or data[2] == True or data[3] == True or data[4] == True:
             logging.info(f'[{self.vehicle_id}] Broadcasting proximity alert')
-            self.send_information({"vehicleId": str(self.vehicle_id), "alert" : "Proximity alert", "senorId" : "PRX", "senorReading" : str(data[1])})
+            self.send_information({"vehicleId": str(self.vehicle_id), "alert" : "Proximity alert", "senorId" : "PRX", "senorReading" : data[1]})
 
     def process_light_sensor_data(self, data):
         if data[1] == "LOW":
             logging.info(f'[ {self.vehicle_id}] Broadcasting low lights alert')
             print(f"sensor LOW {str(data[1])} {type(data[1])}")
-            self.send_information({"vehicleId": str(self.vehicle_id), "alert": "Low lights alert", "senorId": "LT", "senorReading": str(data[1])})
+            self.send_information({"vehicleId": str(self.vehicle_id), "alert": "Low lights alert", "senorId": "LT", "senorReading": data[1]})
 
     def process_tyre_pressure_data(self, data):
         self.tyrePressure = + data[1]
         if data[1] < 30 or data[1] > 35:
             logging.info(f'[ {self.vehicle_id}] Broadcasting tyre pressure low alert')
-            self.send_information({"vehicleId": str(self.vehicle_id), "alert": "Low or high tyre pressure alert", "senorId": "TP", "senorReading": str(data[1])})
+            self.send_information({"vehicleId": str(self.vehicle_id), "alert": "Low or high tyre pressure alert", "senorId": "TP", "senorReading": data[1]})
 
     def process_speed_data(self, data):
         self.position = self.position + data[1]
@@ -188,22 +356,27 @@ class VehicleControls(bs.BroadcastSystem):
         print("position = " + str(self.position) + ", Speed = " + str(data[1]))
         if data[1] > 80:
             logging.info(f'[{self.vehicle_id}] Broadcasting over speeding alert')
-            self.send_information({"vehicleId": str(self.vehicle_id), "alert": "Over speeding alert", "senorId": "SPD", "senorReading": str(data[1])})
+            self.send_information({"vehicleId": str(self.vehicle_id), "alert": "Over speeding alert", "senorId": "SPD", "senorReading": data[1]})
 
-    def get_vehicle_runner_thread(self):
-        return threading.Thread(target=self.runVehicle, args=( ))
+    def information_processor(self, data):
+        """
+        Process the information received from neighbouring nodes.
 
-    def information_processor(self):
-        pass
+        Args:
+            data (dict): Information recieved from the data layer.
+        """
+        logging.info(f"On vehicle [{self.vehicle_id}]--->[{data}]")
 
-    def stimulate_vehicle_run(self):
-        while True:
+    def stimulate_step(self, data=None):
+        if data is None:
             data = self.sensorMaster.s1.GET_DATA()
-            self.process_speed_data(data)
-            time.sleep(2)
+        if self.trace is not None:
+            self.trace.record(self.vehicle_id, [data], sensor_trace.SPEED_STEP)
+        self.process_speed_data(data)
 
-    def deploy(self):
-        super().deploy(self.information_listener)
-        self.get_vehicle_runner_thread().start()
-        threading.Thread(target=self.stimulate_vehicle_run, args=( )).start()
+    def deploy(self, runtime=None, simulate=True):
+        super().deploy(self.information_processor, runtime=runtime)
+        if simulate:
+            # the sensors are polled by a task of the node runtime, woken when the next one is due
+            self.runtime.timer(self.sensor_tick)
 
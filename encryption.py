@@ -1,43 +1,243 @@
 # uses pycryptodome package
 import Crypto.Cipher.AES as AES
 from Crypto.PublicKey import RSA
-from Crypto import Random
 import os, hashlib
 import string
 import random
 import base64
+import threading
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
 BLOCK_SIZE = 16
+NONCE_SIZE = 12
+TAG_SIZE = 16
+KEY = 'abcd1234efgh5678'.encode("utf8")
 padding = lambda s: s + (BLOCK_SIZE - len(s) % BLOCK_SIZE) * chr(BLOCK_SIZE - len(s) % BLOCK_SIZE)
 unpadding = lambda s: s[:-ord(s[len(s) - 1:])]
 
 
+class CipherContext:
+    """
+    Reusable AES-CBC context working on raw bytes.
+
+    The key schedule is expanded once. Instead of creating a cipher per message with
+    a fresh IV, every message is prefixed with a random block and encrypted on one
+    long-lived CBC stream: the ciphertext of that random block is an unpredictable IV
+    for the rest of the message. The output is laid out as IV + ciphertext exactly
+    like do_encrypt, just without the base64 step.
+    """
+
+    def __init__(self, key: bytes = KEY):
+        """
+        Initializer for the cipher context.
+        :param key: AES key.
+        """
+        self.key = key
+        self._encryptor = AES.new(key, AES.MODE_CBC, os.urandom(BLOCK_SIZE))
+        self._decryptor = AES.new(key, AES.MODE_ECB)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def sealed_size(length: int) -> int:
+        """
+        Size of the IV + ciphertext produced for a message.
+        :param length: length of the plain message in bytes.
+        :return: int
+        """
+        return BLOCK_SIZE + length + BLOCK_SIZE - length % BLOCK_SIZE
+
+    @staticmethod
+    def _layout(message, out: memoryview) -> int:
+        """
+        Write random block, message and PKCS#7 padding into a buffer.
+        :param message: plain message (bytes-like).
+        :param out: writable buffer of at least sealed_size(len(message)) bytes.
+        :return: number of bytes written.
+        """
+        length = len(message)
+        pad = BLOCK_SIZE - length % BLOCK_SIZE
+        end = BLOCK_SIZE + length
+        out[:BLOCK_SIZE] = os.urandom(BLOCK_SIZE)
+        out[BLOCK_SIZE:end] = message
+        out[end:end + pad] = bytes((pad,)) * pad
+        return end + pad
+
+    def encrypt_into(self, message, out, offset: int = 0) -> int:
+        """
+        Encrypt a message straight into a preallocated buffer.
+        :param message: plain message (bytes-like).
+        :param out: writable bytearray/memoryview.
+        :param offset: position in out where IV + ciphertext is written.
+        :return: number of bytes written.
+        """
+        view = memoryview(out)[offset:]
+        size = self._layout(message, view)
+        with self._lock:
+            self._encryptor.encrypt(view[:size], output=view[:size])
+        return size
+
+    def encrypt(self, message) -> bytes:
+        """
+        Encrypt a message.
+        :param message: plain message (bytes or str).
+        :return: IV + ciphertext.
+        """
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        out = bytearray(self.sealed_size(len(message)))
+        self.encrypt_into(message, out)
+        return bytes(out)
+
+    def encrypt_batch(self, messages) -> list:
+        """
+        Encrypt many messages with a single AES call into one shared buffer.
+        :param messages: iterable of plain messages (bytes or str).
+        :return: list of memoryviews, each holding the IV + ciphertext of one message.
+        """
+        messages = [m.encode('utf-8') if isinstance(m, str) else m for m in messages]
+        sizes = [self.sealed_size(len(m)) for m in messages]
+        out = bytearray(sum(sizes))
+        view = memoryview(out)
+        offset = 0
+        for message, size in zip(messages, sizes):
+            self._layout(message, view[offset:offset + size])
+            offset += size
+        with self._lock:
+            self._encryptor.encrypt(view, output=view)
+        sealed = []
+        offset = 0
+        for size in sizes:
+            sealed.append(view[offset:offset + size])
+            offset += size
+        return sealed
+
+    def decrypt(self, data) -> bytes:
+        """
+        Decrypt an IV + ciphertext message.
+        :param data: bytes-like IV + ciphertext.
+        :return: plain message bytes.
+        """
+        data = memoryview(data)
+        if len(data) < 2 * BLOCK_SIZE or len(data) % BLOCK_SIZE:
+            raise ValueError("ciphertext is not a whole number of blocks")
+        blocks = self._decryptor.decrypt(data[BLOCK_SIZE:])
+        size = len(blocks)
+        chained = int.from_bytes(blocks, 'big') ^ int.from_bytes(data[:-BLOCK_SIZE], 'big')
+        message = chained.to_bytes(size, 'big')
+        pad = message[-1]
+        if not 0 < pad <= BLOCK_SIZE:
+            raise ValueError("invalid padding")
+        return message[:-pad]
+
+
+class AuthenticationError(ValueError):
+    """
+    Raised when an AEAD message fails its tag check (forged, corrupted or wrong key).
+    """
+
+
+class AEADContext:
+    """
+    Reusable AES-GCM context bound to one session key.
+
+    Messages are laid out as nonce + ciphertext + tag. The tag is verified before
+    anything is returned, so forged or corrupted packets are rejected without
+    being parsed.
+    """
+
+    def __init__(self, key: bytes = None):
+        """
+        Initializer for the AEAD context.
+        :param key: 128/192/256 bit AES key, a fresh random 128 bit key if not given.
+        """
+        self.key = key if key is not None else AESGCM.generate_key(bit_length=128)
+        self._aead = AESGCM(self.key)
+
+    def seal(self, message, associated_data: bytes = None) -> bytes:
+        """
+        Encrypt and authenticate a message.
+        :param message: plain message (bytes or str).
+        :param associated_data: data authenticated but not encrypted (e.g. a cleartext header).
+        :return: nonce + ciphertext + tag.
+        """
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self._aead.encrypt(nonce, message, associated_data)
+
+    def open(self, data, associated_data: bytes = None) -> bytes:
+        """
+        Verify and decrypt a sealed message.
+        :param data: nonce + ciphertext + tag.
+        :param associated_data: the associated data the message was sealed with.
+        :return: plain message bytes.
+        """
+        data = memoryview(data)
+        if len(data) < NONCE_SIZE + TAG_SIZE:
+            raise AuthenticationError("message too short")
+        try:
+            return self._aead.decrypt(data[:NONCE_SIZE], data[NONCE_SIZE:], associated_data)
+        except InvalidTag:
+            raise AuthenticationError("authentication tag mismatch")
+
+
+_context = None
+
+
+def get_context() -> CipherContext:
+    """
+    Return the shared cipher context, creating it on first use.
+    :return: CipherContext
+    """
+    global _context
+    if _context is None:
+        _context = CipherContext()
+    return _context
+
+
+def encrypt_bytes(message) -> bytes:
+    """
+    Encrypt a message for the wire (raw IV + ciphertext, no base64).
+    :param message: message to be encrypted (bytes or str).
+    :return: encrypted message.
+    """
+    return get_context().encrypt(message)
+
+
+def decrypt_bytes(data) -> bytes:
+    """
+    Decrypt a raw message received from the wire.
+    :param data: IV + ciphertext.
+    :return: decrypted message bytes.
+    """
+    return get_context().decrypt(data)
+
+
+def encrypt_batch(messages) -> list:
+    """
+    Encrypt many messages in one call.
+    :param messages: iterable of messages (bytes or str).
+    :return: list of memoryviews holding IV + ciphertext of each message.
+    """
+    return get_context().encrypt_batch(messages)
+
+
 def do_encrypt(message):
     """
     encrypt a message using AES encryption.
+    Compatibility wrapper returning the base64 encoded IV + ciphertext.
     :param message: message to be encrypted.
     :return: encrypted message.
     """
-    # IV = hashlib.md5(os.urandom(128)).hexdigest()[:16]
-    IV = Random.new().read(AES.block_size)
-    cipher = AES.new('abcd1234efgh5678'.encode("utf8"), AES.MODE_CBC, IV)
-    message = padding(message)
-    # ciphertext = cipher.encrypt(message)
-    encrypted_message = cipher.encrypt(message.encode("utf-8"))
-    ciphertext = base64.b64encode(IV + encrypted_message)
-    return ciphertext
+    return base64.b64encode(encrypt_bytes(message))
 
 
 def do_decrypt(ciphertext):
     """
     Decrypt the received message using AES encryption.
+    Compatibility wrapper for base64 encoded IV + ciphertext.
     :param ciphertext: encrypted message to decrypt.
     :return: decrypted message.
     """
-    enc = base64.b64decode(ciphertext)
-    iv = enc[:16]
-    # IV = hashlib.md5(os.urandom(128)).hexdigest()[:16]
-    cipher = AES.new('abcd1234efgh5678'.encode("utf8"), AES.MODE_CBC, iv)
-    message = unpadding(cipher.decrypt(enc[16:]))
-    # message = unpadding(cipher.decrypt(ciphertext))
-    return message.decode("utf8")
+    return decrypt_bytes(base64.b64decode(ciphertext)).decode("utf8")
@@ -0,0 +1,129 @@
+import argparse
+import logging
+import math
+import random
+import socket
+import threading
+
+import node_runtime
+import sensor_trace
+from vehicle import Vehicle, app, sensor_period
+
+METRES_PER_DEGREE = 111320.0
+
+
+def spread_location(latitude, longitude, radius, rng):
+    """
+    Random location within a radius of a point.
+
+    Args:
+        latitude (float): latitude of the centre.
+        longitude (float): longitude of the centre.
+        radius (float): radius in metres.
+        rng (random.Random): random generator.
+
+    Returns:
+        [Tuple]: (latitude, longitude)
+    """
+    distance = radius * math.sqrt(rng.random())
+    angle = rng.uniform(0, 2 * math.pi)
+    dlat = distance * math.cos(angle) / METRES_PER_DEGREE
+    dlon = distance * math.sin(angle) / (METRES_PER_DEGREE * max(0.01, math.cos(math.radians(latitude))))
+    return latitude + dlat, longitude + dlon
+
+
+def simulate(runtime, vehicles, seed=None):
+    """
+    Drive the sensors of the whole fleet from one FleetSensors instead of one set
+    of scalar sensors per vehicle.
+
+    Args:
+        runtime (NodeRuntime): runtime the vehicles are deployed on.
+        vehicles (list): deployed Vehicle instances.
+        seed (int): seed of the sensor readings, random if None.
+    """
+    # imported here so numpy is only needed for --vectorized
+    from fleet_sensors import FleetSensors
+
+    sensors = FleetSensors(len(vehicles), seed)
+
+    def sensor_pass():
+        readings = sensors.step()
+        for index, vehicle in enumerate(vehicles):
+            vehicle.sensor_pass(readings.vehicle(index))
+
+    def speed_step():
+        for vehicle, speed in zip(vehicles, sensors.step_speed().tolist()):
+            vehicle.stimulate_step(['SPD', speed])
+
+    runtime.every(1, sensor_pass)
+    runtime.every(2, speed_step)
+
+
+def main():
+    my_parser = argparse.ArgumentParser(description='run a fleet of simulated vehicles in one process')
+    my_parser.add_argument('--vehicles', help='number of vehicles', type=int, required=True)
+    my_parser.add_argument('--first_vehicle_id', help='id of the first vehicle', type=int, default=1000)
+    my_parser.add_argument('--first_port', help='listening port of the first vehicle', type=int, default=40000)
+    my_parser.add_argument('--latitude', help='latitude of the fleet centre', type=float, required=True)
+    my_parser.add_argument('--longitude', help='longitude of the fleet centre', type=float, required=True)
+    my_parser.add_argument('--spread', help='radius (m) the vehicles are scattered in', type=float, default=15.0)
+    my_parser.add_argument('--seed', help='seed of the vehicle placement', type=int, required=False)
+    my_parser.add_argument('--isolate', help='vehicles of the fleet only pair with outside nodes (e.g. an infra '
+                                             'under load test), not with each other', action='store_true')
+    my_parser.add_argument('--vectorized', help='simulate the sensors of all the vehicles with NumPy arrays '
+                                                '(the sensor control API does not apply to them)',
+                           action='store_true')
+    my_parser.add_argument('--record', help='append every sensor reading of the fleet to this trace file',
+                           required=False)
+    my_parser.add_argument('--replay', help='replay the sensor readings of this trace file instead of '
+                                            'simulating them', required=False)
+    my_parser.add_argument('--replay_speed', help='replay speed: 1 real time, N N times faster, 0 max speed',
+                           type=float, default=1.0)
+    my_parser.add_argument('--sensor_period', help='sampling period of a sensor as SENSOR_ID=SECONDS, e.g. '
+                                                   'PRX=0.05 or FLG=10; may be repeated', type=sensor_period,
+                           action='append', default=[])
+    my_parser.add_argument('--api_port', help='api_port', type=int, required=False)
+    my_parser.add_argument('--log_level', help='log level', default='WARNING')
+
+    args = my_parser.parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
+    logging.getLogger('v2vnode').setLevel(args.log_level.upper())
+    hostname = socket.gethostname()
+    host = socket.gethostbyname(hostname)
+    rng = random.Random(args.seed)
+    if args.seed is not None:
+        # the scalar sensors draw from the global generator
+        random.seed(args.seed)
+    trace = sensor_trace.TraceWriter(args.record) if args.record else None
+    # every vehicle runs on the same event loop and shares its discovery, multicast
+    # and sender threads; only the listening port is per vehicle
+    runtime = node_runtime.NodeRuntime(isolate=args.isolate)
+    vehicles = []
+    for index in range(args.vehicles):
+        vehicle_id = args.first_vehicle_id + index
+        port = args.first_port + index
+        latitude, longitude = spread_location(args.latitude, args.longitude, args.spread, rng)
+        vehicle = Vehicle(vehicle_id, host, port, port, latitude, longitude, dict(args.sensor_period))
+        vehicle.trace = trace
+        vehicle.deploy(runtime, simulate=not (args.vectorized or args.replay))
+        vehicles.append(vehicle)
+    if args.replay:
+        vehicles = {vehicle.vehicle_id: vehicle for vehicle in vehicles}
+        threading.Thread(target=sensor_trace.replay, args=(sensor_trace.TraceReader(args.replay), vehicles,
+                                                           args.replay_speed), daemon=True).start()
+    elif args.vectorized:
+        simulate(runtime, vehicles, args.seed)
+    print("Fleet-", args.vehicles, "vehicles from", args.first_vehicle_id)
+    try:
+        if args.api_port is not None:
+            app.run(host='localhost', port=args.api_port)
+        else:
+            runtime.thread.join()
+    finally:
+        if trace is not None:
+            trace.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+from datetime import datetime
+
+import numpy as np
+
+# speed sensor FLAG values
+DEFAULT = 0
+INCREASE = 1
+DECREASE = 2
+FLAGS = {'DEFAULT': DEFAULT, 'INCREASE': INCREASE, 'DECREASE': DECREASE}
+
+INITIAL_LAT = 53.3498
+INITIAL_LONG = 6.2603
+LIGHT_FROM = datetime(2020, 5, 13, 8, 00, 00).time()
+LIGHT_TO = datetime(2020, 5, 13, 17, 00, 00).time()
+
+
+class FleetSensors:
+    """
+    Sensors of a whole fleet of vehicles, advanced in vectorized steps.
+
+    Every sensor of sensor_data_generators keeps its state here as one NumPy array
+    with an entry per vehicle, and every step draws the random numbers of all the
+    vehicles at once. The rules are the ones of the scalar sensors, draw for draw:
+    same inclusive randint ranges, same thresholds and state machines. Seed it to
+    get a reproducible fleet.
+    """
+
+    def __init__(self, vehicles, seed=None):
+        """
+        Constructor for the fleet sensors.
+
+        Args:
+            vehicles (int): number of vehicles.
+            seed (int): seed of the random generator, random if None.
+        """
+        self.vehicles = vehicles
+        self.rng = np.random.default_rng(seed)
+        n = vehicles
+        # PressureSensor
+        self.pressure = self._initial_value(((30, 35), (25, 30), (35, 40), (15, 25)))
+        # SpeedSensor and the per vehicle SensorControls
+        self.initial_speed = self.randint(40, 80, n)
+        self.speed = np.zeros(n, dtype=np.int64)
+        self.speed_ticks = np.zeros(n, dtype=np.int64)
+        self.speed_flag = np.full(n, DEFAULT, dtype=np.int8)
+        self.control_flag = np.full(n, DEFAULT, dtype=np.int8)
+        self.brake_applied = np.zeros(n, dtype=bool)
+        self.brake_lock = np.zeros(n, dtype=bool)
+        # BrakeSensor
+        self.brake_ticks = np.zeros(n, dtype=np.int64)
+        # FuelSensor
+        self.fuel = self.randint(40, 80, n)
+        self.fuel_ticks = np.zeros(n, dtype=np.int64)
+        # ProximitySensor: left, right, front, behind
+        self.proximity = np.zeros((n, 4), dtype=bool)
+        # HeartRateSensor
+        self.heart_rate = self._initial_value(((60, 100), (40, 60), (100, 120), (0, 40)))
+        # GPSSensor
+        self.latitude = INITIAL_LAT + self.randint(0, 10, n) / 10
+        self.longitude = INITIAL_LONG + self.randint(0, 10, n) / 10
+
+    def randint(self, low, high, size):
+        """
+        Vectorized random.randint: integers in [low, high], both inclusive.
+        """
+        return self.rng.integers(low, high, size=size, endpoint=True)
+
+    def _initial_value(self, ranges):
+        """
+        The 97/1/1/1 split of the initial tyre pressure and heart rate:
+        randint(0, 100) <= 97 picks the normal range, 98, 99 and 100 the others.
+
+        Args:
+            ranges (tuple): (low, high) of the normal, 98, 99 and 100 cases.
+
+        Returns:
+            [ndarray]: initial values.
+        """
+        selector = self.randint(0, 100, self.vehicles)
+        case = np.select([selector <= 97, selector == 98, selector == 99], [0, 1, 2], 3)
+        lows = np.array([low for low, _ in ranges])
+        highs = np.array([high for _, high in ranges])
+        return self.rng.integers(lows[case], highs[case], endpoint=True)
+
+    def step_pressure(self):
+        """Advances the tyre pressure: -1 or +1 with a 1/10001 chance each."""
+        draw = self.randint(0, 10000, self.vehicles)
+        self.pressure += (draw == 10000).astype(np.int64) - (draw == 9999)
+        return self.pressure
+
+    def step_speed(self):
+        """Advances the speed sensor FLAG/TICKS state machine."""
+        n = self.vehicles
+        idle = self.speed_ticks == 0
+        self.speed_flag[idle] = self.control_flag[idle]
+        draw = self.randint(0, 100, n)
+        self.speed_flag[self.brake_applied] = DECREASE
+        flag = self.speed_flag
+        steady = (draw <= 33) & (flag == DEFAULT)
+        increase = ~steady & ((((33 < draw) & (draw <= 66)) & (flag == DEFAULT)) | (flag == INCREASE))
+        decrease = ~steady & ~increase
+        change = self.randint(1, 10, n)
+        grow = increase & (self.initial_speed < 200)
+        self.initial_speed[grow] += change[grow]
+        self.initial_speed[decrease] -= change[decrease]
+        np.maximum(self.initial_speed, 0, out=self.initial_speed)
+        self.speed[:] = self.initial_speed
+        ticking = (increase & (flag == INCREASE)) | (decrease & (flag == DECREASE))
+        self.speed_ticks[ticking] += 1
+        done = ticking & (self.speed_ticks == 5)
+        self.speed_ticks[done] = 0
+        self.speed_flag[done] = DEFAULT
+        return self.speed
+
+    def step_brake(self):
+        """Toggles the unlocked brakes every 4 ticks."""
+        due = self.brake_ticks == 4
+        self.brake_applied[due & ~self.brake_lock] ^= True
+        self.brake_ticks[due] = 0
+        self.brake_ticks += 1
+        return self.brake_applied
+
+    def step_fuel(self):
+        """Burns 1% of fuel every 50 ticks."""
+        self.fuel -= (self.fuel_ticks % 50 == 0)
+        self.fuel_ticks += 1
+        return self.fuel
+
+    def step_proximity(self):
+        """Flips each proximity reading when randint(0, 100) >= 67."""
+        self.proximity ^= self.randint(0, 100, (self.vehicles, 4)) >= 67
+        return self.proximity
+
+    def step_heart_rate(self):
+        """Keeps, lowers or raises the heart rate by 1 with the 34/33/34 split."""
+        draw = self.randint(0, 100, self.vehicles)
+        self.heart_rate += (draw > 66).astype(np.int64) - ((33 < draw) & (draw <= 66))
+        return self.heart_rate
+
+    def step_gps(self):
+        """Moves every vehicle by randint(0, 10) / 1000 degrees on each axis."""
+        self.latitude += self.randint(0, 10, self.vehicles) / 1000
+        self.longitude += self.randint(0, 10, self.vehicles) / 1000
+        return self.latitude, self.longitude
+
+    def light(self, now=None):
+        """
+        Light level, the same for every vehicle.
+
+        Returns:
+            [str]: 'HIGH' between 8:00 and 17:00, 'LOW' otherwise.
+        """
+        now = now if now is not None else datetime.now()
+        return 'HIGH' if LIGHT_FROM <= now.time() <= LIGHT_TO else 'LOW'
+
+    def step(self):
+        """
+        Advances every sensor of Sensors.getSensors by one tick, in the same order.
+
+        Returns:
+            [FleetReadings]: readings of the tick.
+        """
+        return FleetReadings(self.step_pressure().copy(), self.light(), self.step_fuel().copy(),
+                             self.step_proximity().copy(), self.step_brake().copy(),
+                             self.step_heart_rate().copy(), *[axis.copy() for axis in self.step_gps()])
+
+    def set_speed(self, value, vehicles=slice(None)):
+        """Equivalent of Sensors.setSpeedSensor for some vehicles."""
+        self.speed_flag[vehicles] = FLAGS[value]
+
+    def apply_brake(self, value, vehicles=slice(None)):
+        """Equivalent of Sensors.applyBrake for some vehicles."""
+        self.brake_applied[vehicles] = value == 'A'
+        self.brake_lock[vehicles] = value == 'A'
+
+    def refill_fuel(self, percent, vehicles=slice(None)):
+        """Equivalent of FuelSensor.REFILL_FUEL for some vehicles."""
+        self.fuel[vehicles] = np.minimum(self.fuel[vehicles] + percent, 100)
+
+
+class FleetReadings:
+    """
+    Readings of one tick of FleetSensors, as arrays indexed by vehicle.
+    """
+
+    def __init__(self, pressure, light, fuel, proximity, brake, heart_rate, latitude, longitude):
+        self.pressure = pressure
+        self.light = light
+        self.fuel = fuel
+        self.proximity = proximity
+        self.brake = brake
+        self.heart_rate = heart_rate
+        self.latitude = latitude
+        self.longitude = longitude
+        self._lists = None
+
+    def __len__(self):
+        return len(self.pressure)
+
+    def vehicle(self, index):
+        """
+        Readings of one vehicle in the GET_DATA format of the scalar sensors.
+
+        Args:
+            index (int): vehicle index.
+
+        Returns:
+            [List]: one GET_DATA list per sensor, in the order of Sensors.getSensors.
+        """
+        if self._lists is None:
+            # one conversion to Python scalars per tick, not per vehicle
+            self._lists = (self.pressure.tolist(), self.fuel.tolist(), self.proximity.tolist(),
+                           self.brake.tolist(), self.heart_rate.tolist(), self.latitude.tolist(),
+                           self.longitude.tolist())
+        pressure, fuel, proximity, brake, heart_rate, latitude, longitude = self._lists
+        return [['TP', pressure[index]], ['LT', self.light], ['FLG', fuel[index]],
+                ['PRX'] + proximity[index], ['BRK', brake[index]], ['HRS', heart_rate[index]],
+                ['GPS', (latitude[index], longitude[index])]]
@@ -0,0 +1,171 @@
+import logging
+import selectors
+import socket
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import framing
+
+logger = logging.getLogger('v2vnode')
+
+
+class PeerStream:
+    """
+    Per connection state of the frame server.
+    """
+
+    def __init__(self, addr: tuple):
+        """
+        Initializer for the stream state.
+        :param addr: address of the remote node.
+        """
+        self.addr = addr
+        self.decoder = framing.FrameDecoder()
+        self.pending = deque()
+        self.scheduled = False
+        self.lock = threading.Lock()
+
+
+class FrameServer:
+    """
+    Selector based TCP server multiplexing every inbound peer stream on one thread.
+
+    Each connection gets its own FrameDecoder, so partial reads are buffered until
+    a frame is complete and a slow sender never holds up the others. Complete
+    frames are handed to a small worker pool, keeping decryption and the node
+    handler off the accept/read path. Frames of one connection are handled in the
+    order they were received, different connections are handled in parallel.
+    """
+
+    def __init__(self, host: str, port: int, on_frame, backlog: int = 128, workers: int = 4,
+                 recv_size: int = 65536, server_socket: socket.socket = None):
+        """
+        Initializer for the frame server.
+        :param host: ip address to listen on.
+        :param port: port number to listen on.
+        :param on_frame: callable(payload, addr) invoked for every complete frame.
+        :param backlog: listen backlog of the server socket.
+        :param workers: number of threads running on_frame.
+        :param recv_size: size of each non-blocking recv call.
+        :param server_socket: already bound listening socket to use instead of creating one.
+        """
+        self.host = host
+        self.port = port
+        self.on_frame = on_frame
+        self.backlog = backlog
+        self.recv_size = recv_size
+        self.server = server_socket
+        self.selector = selectors.DefaultSelector()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='frame-handler')
+        self.running = False
+
+    def _listen(self):
+        """
+        Create (if required) and register the non-blocking listening socket.
+        """
+        if self.server is None:
+            self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server.bind((self.host, self.port))
+            self.server.listen(self.backlog)
+        self.server.setblocking(False)
+        self.selector.register(self.server, selectors.EVENT_READ, None)
+
+    def _accept(self):
+        """
+        Accept every pending connection on the listening socket.
+        """
+        while True:
+            try:
+                conn, addr = self.server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            conn.setblocking(False)
+            self.selector.register(conn, selectors.EVENT_READ, PeerStream(addr))
+
+    def _read(self, conn, stream: PeerStream):
+        """
+        Drain a readable connection and dispatch the frames it completed.
+        :param conn: readable connection.
+        :param stream: PeerStream of the connection.
+        """
+        try:
+            chunk = conn.recv(self.recv_size)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            logger.debug(f"connection error {e} {stream.addr}")
+            chunk = b''
+        if not chunk:
+            self._drop(conn)
+            return
+        try:
+            frames = stream.decoder.feed(chunk)
+        except framing.FrameError as e:
+            logger.debug(f"dropping corrupt stream {e} {stream.addr}")
+            self._drop(conn)
+            return
+        if not frames:
+            return
+        with stream.lock:
+            stream.pending.extend(frames)
+            if stream.scheduled:
+                return
+            stream.scheduled = True
+        self.executor.submit(self._dispatch, stream)
+
+    def _dispatch(self, stream: PeerStream):
+        """
+        Run the frame callback on every pending frame of a connection, in order,
+        logging instead of propagating its errors.
+        :param stream: PeerStream of the connection.
+        """
+        while True:
+            with stream.lock:
+                if not stream.pending:
+                    stream.scheduled = False
+                    return
+                frame = stream.pending.popleft()
+            try:
+                self.on_frame(frame, stream.addr)
+            except Exception as e:
+                logger.debug(f"error handling frame {e} {stream.addr}")
+
+    def _drop(self, conn):
+        """
+        Unregister and close a connection.
+        :param conn: connection to close.
+        """
+        try:
+            self.selector.unregister(conn)
+        except (KeyError, ValueError):
+            pass
+        conn.close()
+
+    def serve_forever(self, poll_interval: float = 0.5):
+        """
+        Run the event loop until stop() is called.
+        :param poll_interval: maximum time to block in select, in seconds.
+        """
+        self._listen()
+        self.running = True
+        try:
+            while self.running:
+                for key, _ in self.selector.select(timeout=poll_interval):
+                    if key.data is None:
+                        self._accept()
+                    else:
+                        self._read(key.fileobj, key.data)
+        finally:
+            for key in list(self.selector.get_map().values()):
+                self.selector.unregister(key.fileobj)
+                key.fileobj.close()
+            self.selector.close()
+            self.executor.shutdown(wait=False)
+
+    def stop(self):
+        """
+        Ask the event loop to exit after the current iteration.
+        """
+        self.running = False
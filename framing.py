@@ -0,0 +1,76 @@
+import struct
+
+# Every message on a V2V stream is prefixed with its length as a 4 byte
+# big-endian unsigned integer, so a single long-lived TCP connection can carry
+# any number of messages back to back.
+FRAME_HEADER = struct.Struct('!I')
+MAX_FRAME_SIZE = 4 * 1024 * 1024
+
+
+class FrameError(Exception):
+    """
+    Raised when a stream carries a frame that cannot be decoded.
+    """
+
+
+def encode_frame(payload) -> bytes:
+    """
+    Prefix a payload with its length.
+    :param payload: bytes (or str) to be framed.
+    :return: framed bytes ready to be written to a stream.
+    """
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FrameError(f"frame of {len(payload)} bytes exceeds {MAX_FRAME_SIZE}")
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def encode_frame_parts(parts) -> list:
+    """
+    Length prefix a payload made of several buffers without joining them.
+    :param parts: sequence of bytes-like objects forming the payload.
+    :return: list of buffers to write to the stream in order (e.g. with sendmsg).
+    """
+    length = sum(len(part) for part in parts)
+    if length > MAX_FRAME_SIZE:
+        raise FrameError(f"frame of {length} bytes exceeds {MAX_FRAME_SIZE}")
+    return [FRAME_HEADER.pack(length), *parts]
+
+
+class FrameDecoder:
+    """
+    Incremental decoder turning arbitrary chunks read from a stream into
+    complete frames.
+    """
+
+    def __init__(self, max_frame_size: int = MAX_FRAME_SIZE):
+        """
+        Initializer for the decoder.
+        :param max_frame_size: largest payload accepted before the stream is treated as corrupt.
+        """
+        self.buffer = bytearray()
+        self.max_frame_size = max_frame_size
+
+    def feed(self, chunk) -> list:
+        """
+        Append a chunk read from the stream and return the frames it completed.
+        :param chunk: bytes read from the socket.
+        :return: list of complete frame payloads (bytes), possibly empty.
+        """
+        self.buffer += chunk
+        frames = []
+        offset = 0
+        header_size = FRAME_HEADER.size
+        while len(self.buffer) - offset >= header_size:
+            (length,) = FRAME_HEADER.unpack_from(self.buffer, offset)
+            if length > self.max_frame_size:
+                raise FrameError(f"frame of {length} bytes exceeds {self.max_frame_size}")
+            end = offset + header_size + length
+            if len(self.buffer) < end:
+                break
+            frames.append(bytes(self.buffer[offset + header_size:end]))
+            offset = end
+        if offset:
+            del self.buffer[:offset]
+        return frames
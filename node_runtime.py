@@ -0,0 +1,353 @@
+import asyncio
+import collections
+import json
+import logging
+import socket
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import broadcast_system as bs
+import framing
+from send_queue import OutboundQueue
+
+logger = logging.getLogger('v2vnode')
+
+# Frames a stream may have waiting for the frame executor before reading from it pauses.
+MAX_PENDING_FRAMES = 256
+
+
+class NodeSendQueue:
+    """
+    One node's view of the runtime's shared outbound queue, with the interface of
+    the OutboundQueue it replaces. Destinations are namespaced by node so every
+    node keeps its own per-peer ordering, rate limits and coalescing.
+    """
+
+    def __init__(self, queue: OutboundQueue, system):
+        """
+        Initializer for the node queue.
+        :param queue: shared OutboundQueue.
+        :param system: BroadcastSystem owning the messages.
+        """
+        self.queue = queue
+        self.system = system
+
+    def put(self, destination, payload, key=None) -> bool:
+        return self.queue.put((self.system, destination), payload, key)
+
+    def discard(self, destination):
+        self.queue.discard((self.system, destination))
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class DiscoveryProtocol(asyncio.DatagramProtocol):
+    """
+    Discovery beacons, parsed once and handed to every node of the runtime.
+    """
+
+    def __init__(self, runtime):
+        self.runtime = runtime
+
+    def datagram_received(self, data, addr):
+        try:
+            beacon = json.loads(data.decode('utf-8'))
+        except ValueError as e:
+            logger.debug(f"bad beacon from {addr} {e}")
+            return
+        if self.runtime.isolate and beacon.get('node') in self.runtime.node_ids:
+            return
+        for system in self.runtime.nodes:
+            try:
+                system.handle_beacon(beacon)
+            except Exception as e:
+                logger.debug(f"beacon handling failed {e} {addr}")
+
+
+class RouteProtocol(asyncio.DatagramProtocol):
+    """
+    Multicast route updates, handed to every node of the runtime.
+    """
+
+    def __init__(self, runtime):
+        self.runtime = runtime
+
+    def datagram_received(self, data, addr):
+        for system in self.runtime.nodes:
+            system.handle_route_packet(data, addr)
+
+
+class FrameProtocol(asyncio.Protocol):
+    """
+    One inbound peer stream: frames are decoded on the event loop and processed in
+    arrival order on the runtime's frame executor, so decryption, key unwraps and
+    handlers never block the loop every node of the runtime shares.
+    """
+
+    def __init__(self, runtime, system, handler):
+        self.runtime = runtime
+        self.system = system
+        self.handler = handler
+        self.decoder = framing.FrameDecoder()
+        self.transport = None
+        self.addr = None
+        self.frames = collections.deque()
+        # a drain of this stream's frames is running on the executor
+        self.draining = False
+        self.paused = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.addr = transport.get_extra_info('peername')
+
+    def data_received(self, data):
+        try:
+            frames = self.decoder.feed(data)
+        except framing.FrameError as e:
+            logger.debug(f"dropping corrupt stream {e} {self.addr}")
+            self.transport.close()
+            return
+        if not frames:
+            return
+        self.frames.extend(frames)
+        if len(self.frames) > MAX_PENDING_FRAMES and not self.paused:
+            self.paused = True
+            self.transport.pause_reading()
+        if not self.draining:
+            self.draining = True
+            self.runtime.loop.run_in_executor(self.runtime.executor, self._drain)
+
+    def _drain(self):
+        """
+        Process the waiting frames of the stream; runs on the frame executor.
+        """
+        while self.frames:
+            frame = self.frames.popleft()
+            try:
+                self.system.process_message(frame, self.addr, self.handler)
+            except Exception as e:
+                logger.warning(f"error processing frame {e} {self.addr}")
+        self.runtime.loop.call_soon_threadsafe(self._drained)
+
+    def _drained(self):
+        if self.frames:
+            # received after the drain's last check
+            self.runtime.loop.run_in_executor(self.runtime.executor, self._drain)
+            return
+        self.draining = False
+        if self.paused:
+            self.paused = False
+            self.transport.resume_reading()
+
+
+class NodeRuntime:
+    """
+    A single asyncio event loop running any number of nodes.
+
+    Discovery and route multicast use one socket each for the whole runtime, every
+    node gets a TCP listener and its beacons, expiry sweeps and route announcements
+    run as periodic tasks, and outbound messages of all nodes share one
+    OutboundQueue. Adding a node costs no thread.
+    """
+
+    def __init__(self, send_workers: int = 4, send_queue_size: int = 1024, send_rate: float = 50.0,
+                 coalesce_window: float = 0.05, isolate: bool = False, frame_workers: int = 4):
+        """
+        Initializer for the runtime.
+        :param send_workers: threads delivering the outbound messages of all nodes.
+        :param send_queue_size: maximum number of messages waiting to be sent per destination.
+        :param send_rate: messages per second allowed towards each neighbour.
+        :param coalesce_window: seconds an alert waits to be replaced by a newer reading of the same sensor.
+        :param isolate: nodes of this runtime ignore each other's beacons and only pair with outside nodes.
+        :param frame_workers: threads decrypting and handling the received frames of all nodes.
+        """
+        self.nodes = []
+        self.node_ids = set()
+        self.isolate = isolate
+        self.pending = []
+        self.pending_tasks = []
+        self.loop = None
+        self.thread = None
+        self.ready = threading.Event()
+        # exception that stopped the runtime from starting, raised by start()
+        self.error = None
+        self.executor = ThreadPoolExecutor(max_workers=frame_workers, thread_name_prefix='v2v-frames')
+        self.discovery = {}
+        self.route_transport = None
+        self.send_queue = OutboundQueue(self._deliver, maxsize=send_queue_size, workers=send_workers,
+                                        rate=send_rate, coalesce_window=coalesce_window)
+
+    @staticmethod
+    def _deliver(destination, payload):
+        system, node = destination
+        system.deliver(node, payload)
+
+    def add(self, system, handler, listen: bool = True):
+        """
+        Run a node on this runtime; may be called before or after the loop started.
+        :param system: BroadcastSystem to run.
+        :param handler: handler function to process the received readings.
+        :param listen: accept peer streams on the node's port (False when worker processes do).
+        """
+        # load the identity now rather than on the event loop
+        system.session_keys.public_key_pem
+        system.send_queue = NodeSendQueue(self.send_queue, system)
+        system.runtime = self
+        if self.loop is not None and self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._start_node(system, handler, listen), self.loop).result()
+        else:
+            self.pending.append((system, handler, listen))
+
+    def every(self, interval: float, callback):
+        """
+        Call a function periodically on the event loop, starting right away.
+        :param interval: seconds between two calls.
+        :param callback: function without arguments; its errors are logged.
+        """
+        self._spawn(self._every(interval, callback))
+
+    def timer(self, callback):
+        """
+        Call a function on the event loop, starting right away, then again after the
+        number of seconds it returns each time, until it returns None.
+        :param callback: function without arguments returning the delay; its errors are logged.
+        """
+        self._spawn(self._timer(callback))
+
+    def _spawn(self, coroutine):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.create_task, coroutine)
+        else:
+            self.pending_tasks.append(coroutine)
+
+    async def _every(self, interval: float, callback):
+        while True:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"periodic task {getattr(callback, '__name__', callback)} failed {e}")
+            await asyncio.sleep(interval)
+
+    async def _timer(self, callback):
+        while True:
+            try:
+                delay = callback()
+            except Exception as e:
+                logger.warning(f"timer {getattr(callback, '__name__', callback)} failed {e}")
+                # the callback never told when to call it again
+                delay = 1.0
+            if delay is None:
+                return
+            await asyncio.sleep(delay)
+
+    async def _open_discovery(self, port: int):
+        """
+        Bind the shared discovery socket of a broadcast port.
+        :param port: broadcast port.
+        :return: datagram transport.
+        """
+        transport = self.discovery.get(port)
+        if transport is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            sock.bind(('', port))
+            transport, _ = await self.loop.create_datagram_endpoint(lambda: DiscoveryProtocol(self), sock=sock)
+            self.discovery[port] = transport
+        return transport
+
+    async def _open_routes(self, group: str, port: int):
+        """
+        Join the route multicast group once for the whole runtime.
+        :param group: multicast group.
+        :param port: multicast port.
+        """
+        if self.route_transport is not None:
+            return
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('', port))
+        mreq = struct.pack("4sl", socket.inet_aton(group), socket.INADDR_ANY)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, bs.MCAST_TTL)
+        self.route_transport, _ = await self.loop.create_datagram_endpoint(lambda: RouteProtocol(self), sock=sock)
+
+    def multicast(self, packet: bytes):
+        """
+        Send a route update datagram through the shared multicast socket.
+        :param packet: encoded route update.
+        """
+        self.route_transport.sendto(packet, (bs.MCAST_GRP, bs.MCAST_PORT))
+
+    async def _start_node(self, system, handler, listen: bool):
+        """
+        Open the node's endpoints and start its periodic tasks.
+        :param system: BroadcastSystem to run.
+        :param handler: handler function to process the received readings.
+        :param listen: accept peer streams on the node's port.
+        """
+        discovery = await self._open_discovery(system.broadcast_port)
+        await self._open_routes(bs.MCAST_GRP, bs.MCAST_PORT)
+        if listen:
+            await self.loop.create_server(lambda: FrameProtocol(self, system, handler), system.host, system.port,
+                                          reuse_address=True)
+        self.nodes.append(system)
+        self.node_ids.add(system.vehicle_id)
+        beacon = system.beacon()
+
+        def beacon_tick():
+            discovery.sendto(beacon, ('<broadcast>', system.broadcast_port))
+            system.expire_soft_state()
+
+        self.loop.create_task(self._every(bs.BEACON_INTERVAL, beacon_tick))
+        self.loop.create_task(self._every(system.route_announcer.interval, system.route_announcer.tick))
+        logger.info(f"node {system.vehicle_id} running on {system.host}:{system.port}")
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        try:
+            for system, handler, listen in self.pending:
+                await self._start_node(system, handler, listen)
+        except Exception as e:
+            logger.error(f"runtime failed to start {e}")
+            self.error = e
+            self.ready.set()
+            raise
+        for coroutine in self.pending_tasks:
+            self.loop.create_task(coroutine)
+        self.pending, self.pending_tasks = [], []
+        self.ready.set()
+        await asyncio.Event().wait()
+
+    def run_forever(self):
+        """
+        Run the event loop in the calling thread.
+        """
+        self.send_queue.start()
+        asyncio.run(self._main())
+
+    def start(self):
+        """
+        Run the event loop in a background thread and wait until every node added so far is up.
+        Raises the error that kept a node from starting, e.g. its port being in use.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run_thread, name='v2v-runtime', daemon=True)
+            self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+
+    def _run_thread(self):
+        try:
+            self.run_forever()
+        except Exception as e:
+            # _main reported it already if it failed before being ready
+            if self.error is None:
+                self.error = e
+            self.ready.set()
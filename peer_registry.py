@@ -0,0 +1,149 @@
+import threading
+import time
+
+
+class Peer:
+    """
+    Record of a neighbouring node.
+    """
+    __slots__ = ('node_id', 'host', 'port', 'formats', 'last_seen')
+
+    def __init__(self, node_id, host: str, port: int, formats=None):
+        """
+        Initializer for the peer record.
+        :param node_id: id of the peer.
+        :param host: ip address of the peer.
+        :param port: listening port of the peer.
+        :param formats: wire formats announced by the peer.
+        """
+        self.node_id = node_id
+        self.host = host
+        self.port = port
+        self.formats = formats
+        self.last_seen = time.monotonic()
+
+    @property
+    def address(self) -> tuple:
+        return self.host, self.port
+
+    def __repr__(self):
+        return f"Peer({self.node_id!r}, {self.host!r}, {self.port!r})"
+
+
+class PeerRegistry:
+    """
+    Neighbour table indexed both by node id and by (host, port).
+
+    Writers serialize on a lock and publish new dicts (copy-on-write); readers grab
+    the current dict without locking and always see a consistent snapshot, so the
+    send path never scans or locks the table. Refreshing a known peer, the common
+    case on every discovery beacon, touches its record in place and copies nothing.
+    """
+
+    def __init__(self):
+        """
+        Initializer for the registry.
+        """
+        # (node id -> Peer, (host, port) -> node id), replaced as a whole by writers
+        self._state = ({}, {})
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> dict:
+        """
+        Current node id -> Peer mapping. Must not be mutated by the caller.
+        :return: dict
+        """
+        return self._state[0]
+
+    def get(self, node_id):
+        """
+        Peer record of a node.
+        :param node_id: id of the peer.
+        :return: Peer or None.
+        """
+        return self._state[0].get(node_id)
+
+    def node_for(self, host: str, port: int):
+        """
+        Node id announced on an address.
+        :param host: ip address.
+        :param port: listening port.
+        :return: node id or None.
+        """
+        return self._state[1].get((host, int(port)))
+
+    def upsert(self, node_id, host: str, port: int, formats=None) -> tuple:
+        """
+        Insert a peer or refresh it from a discovery beacon.
+        :param node_id: id of the peer.
+        :param host: ip address of the peer.
+        :param port: listening port of the peer.
+        :param formats: wire formats announced by the peer.
+        :return: (Peer, True if the address was not known before)
+        """
+        port = int(port)
+        address = (host, port)
+        peer = self._state[0].get(node_id)
+        if peer is not None and peer.address == address:
+            peer.last_seen = time.monotonic()
+            peer.formats = formats
+            return peer, False
+        with self._lock:
+            peers = dict(self._state[0])
+            by_address = dict(self._state[1])
+            previous = peers.get(node_id)
+            if previous is not None:
+                by_address.pop(previous.address, None)
+            previous_node = by_address.get(address)
+            if previous_node is not None and previous_node != node_id:
+                # the address now belongs to another node id (e.g. restarted node)
+                peers.pop(previous_node, None)
+            peer = Peer(node_id, host, port, formats)
+            peers[node_id] = peer
+            by_address[address] = node_id
+            is_new = previous_node is None
+            self._state = (peers, by_address)
+        return peer, is_new
+
+    def remove(self, node_ids) -> list:
+        """
+        Remove peers from the registry.
+        :param node_ids: ids of the peers to remove.
+        :return: list of the removed Peer records.
+        """
+        with self._lock:
+            peers = dict(self._state[0])
+            by_address = dict(self._state[1])
+            removed = []
+            for node_id in node_ids:
+                peer = peers.pop(node_id, None)
+                if peer is not None:
+                    if by_address.get(peer.address) == node_id:
+                        del by_address[peer.address]
+                    removed.append(peer)
+            if removed:
+                self._state = (peers, by_address)
+        return removed
+
+    def install(self, records):
+        """
+        Replace the whole registry with peers published by another process.
+        :param records: iterable of (node id, host, port, formats).
+        """
+        peers = {}
+        by_address = {}
+        for node_id, host, port, formats in records:
+            peer = Peer(node_id, host, port, formats)
+            peers[node_id] = peer
+            by_address[peer.address] = node_id
+        with self._lock:
+            self._state = (peers, by_address)
+
+    def __contains__(self, node_id) -> bool:
+        return node_id in self._state[0]
+
+    def __len__(self) -> int:
+        return len(self._state[0])
+
+    def __iter__(self):
+        return iter(self._state[0])
@@ -0,0 +1,286 @@
+import csv
+import functools
+import heapq
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+# Prebuilt index of points of interest (hospitals, gas stations...), memory-mapped
+# as is so an infra node restarts without parsing or sorting anything.
+#
+# Every POI is stored as a unit vector on the sphere, so the straight line distance
+# between two vectors orders POIs exactly like the great circle distance. The POIs of
+# a kind form an implicit KD-tree over those vectors: in a range the median element
+# is the node, split on axis depth % 3, and the halves before and after it are its
+# subtrees, so the tree needs no pointers.
+#
+# File layout, in native byte order (the index is built on the machine using it):
+#     magic (4s) | version (B) | byte order mark (I) | POI count (I) | kind count (H)
+#     kinds: (name length (B) | name | first POI (I) | POI count (I))...
+#     padding to 8 bytes
+#     x, y, z, latitude, longitude: one array of doubles each
+#     name offsets (I), POI count + 1 of them
+#     names, utf-8
+POI_MAGIC = b'V2VP'
+POI_VERSION = 1
+BYTE_ORDER_MARK = 0x01020304
+HEADER = struct.Struct('=4sBIIH')
+KIND = struct.Struct('=II')
+
+EARTH_RADIUS = 6371008.8
+# Results cached per geohash cell; precision 7 cells are about 150 m wide.
+GEOHASH_PRECISION = 7
+CACHE_SIZE = 65536
+
+
+class PoiIndexError(Exception):
+    """
+    Raised for a file that is not a POI index of this machine.
+    """
+
+
+def to_vector(latitude: float, longitude: float) -> tuple:
+    """
+    Unit vector of a coordinate.
+    :param latitude: latitude in degrees.
+    :param longitude: longitude in degrees.
+    :return: (x, y, z)
+    """
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+
+def chord_to_metres(squared_chord: float) -> float:
+    """
+    Great circle distance of two unit vectors from their squared straight line distance.
+    :param squared_chord: squared distance between the vectors.
+    :return: distance in metres.
+    """
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(squared_chord) / 2))
+
+
+def geohash_cell(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> tuple:
+    """
+    Cell of a coordinate in the grid of the geohashes of a precision. A geohash of
+    n characters interleaves 5n bits, so its cells form a regular grid of 2 ** ceil(5n / 2)
+    longitude by 2 ** floor(5n / 2) latitude steps; the cell's row and column are the
+    geohash without the interleaving and base32 encoding.
+    :param latitude: latitude in degrees.
+    :param longitude: longitude in degrees.
+    :param precision: geohash length.
+    :return: (row, column)
+    """
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    row = min(int((latitude + 90.0) / 180.0 * (1 << lat_bits)), (1 << lat_bits) - 1)
+    column = min(int((longitude + 180.0) / 360.0 * (1 << lon_bits)), (1 << lon_bits) - 1)
+    return row, column
+
+
+def cell_centre(row: int, column: int, precision: int = GEOHASH_PRECISION) -> tuple:
+    """
+    Centre of a geohash grid cell.
+    :param row: row of the cell.
+    :param column: column of the cell.
+    :param precision: geohash length.
+    :return: (latitude, longitude) in degrees.
+    """
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    return (row + 0.5) * 180.0 / (1 << lat_bits) - 90.0, (column + 0.5) * 360.0 / (1 << lon_bits) - 180.0
+
+
+def read_csv(path: str) -> list:
+    """
+    Read a POI dataset.
+    :param path: CSV file with a kind,name,latitude,longitude header.
+    :return: list of (kind, name, latitude, longitude).
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        return [(row['kind'], row['name'], float(row['latitude']), float(row['longitude']))
+                for row in csv.DictReader(file)]
+
+
+def _arrange(points: list, depth: int, out: list):
+    """
+    Lay points out as an implicit KD-tree.
+    :param points: (vector, poi) tuples.
+    :param depth: depth of the subtree.
+    :param out: list the points are appended to.
+    """
+    if not points:
+        return
+    axis = depth % 3
+    points.sort(key=lambda point: point[0][axis])
+    middle = len(points) // 2
+    _arrange(points[:middle], depth + 1, out)
+    out.append(points[middle])
+    _arrange(points[middle + 1:], depth + 1, out)
+
+
+def build(pois, path: str):
+    """
+    Build an index file.
+    :param pois: iterable of (kind, name, latitude, longitude).
+    :param path: index file to write.
+    """
+    by_kind = {}
+    for kind, name, latitude, longitude in pois:
+        by_kind.setdefault(kind, []).append((to_vector(latitude, longitude), (name, latitude, longitude)))
+    ordered = []
+    kinds = []
+    for kind in sorted(by_kind):
+        first = len(ordered)
+        _arrange(by_kind[kind], 0, ordered)
+        kinds.append((kind, first, len(ordered) - first))
+    columns = [array('d') for _ in range(5)]
+    offsets = array('I', [0])
+    names = bytearray()
+    for vector, (name, latitude, longitude) in ordered:
+        for column, value in zip(columns, vector + (latitude, longitude)):
+            column.append(value)
+        names += name.encode('utf-8')
+        offsets.append(len(names))
+    header = bytearray(HEADER.pack(POI_MAGIC, POI_VERSION, BYTE_ORDER_MARK, len(ordered), len(kinds)))
+    for kind, first, count in kinds:
+        encoded = kind.encode('utf-8')
+        header += struct.pack('=B', len(encoded)) + encoded + KIND.pack(first, count)
+    header += bytes(-len(header) % 8)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(header)
+        for column in columns:
+            file.write(column.tobytes())
+        file.write(offsets.tobytes())
+        file.write(names)
+    os.replace(temporary, path)
+
+
+class PoiIndex:
+    """
+    K-nearest POI queries over a memory-mapped index file.
+    """
+
+    def __init__(self, path: str, cache_size: int = CACHE_SIZE):
+        """
+        Initializer for the index.
+        :param path: index file written by build.
+        :param cache_size: geohash cells whose results are cached.
+        """
+        self.path = path
+        with open(path, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, mark, count, kind_count = HEADER.unpack_from(self.buffer, 0)
+        except struct.error:
+            raise PoiIndexError(f"{path} is not a POI index")
+        if magic != POI_MAGIC or version != POI_VERSION or mark != BYTE_ORDER_MARK:
+            raise PoiIndexError(f"{path} is not a version {POI_VERSION} POI index of a {sys.byteorder} endian machine")
+        offset = HEADER.size
+        self.kinds = {}
+        for _ in range(kind_count):
+            length = self.buffer[offset]
+            kind = bytes(self.buffer[offset + 1:offset + 1 + length]).decode('utf-8')
+            offset += 1 + length
+            self.kinds[kind] = KIND.unpack_from(self.buffer, offset)
+            offset += KIND.size
+        offset += -offset % 8
+        view = memoryview(self.buffer)
+        self.x, self.y, self.z, self.latitude, self.longitude = (
+            view[offset + index * count * 8:offset + (index + 1) * count * 8].cast('d') for index in range(5))
+        offset += 5 * count * 8
+        self.offsets = view[offset:offset + (count + 1) * 4].cast('I')
+        self.names = view[offset + (count + 1) * 4:]
+        self.count = count
+        self.cached = functools.lru_cache(maxsize=cache_size)(self._cell_nearest)
+
+    def name(self, index: int) -> str:
+        """
+        :param index: POI index.
+        :return: name of the POI.
+        """
+        return bytes(self.names[self.offsets[index]:self.offsets[index + 1]]).decode('utf-8')
+
+    def nearest(self, kind: str, location: tuple, k: int = 1) -> list:
+        """
+        Exact k nearest POIs of a kind.
+        :param kind: POI kind, e.g. 'hospital'.
+        :param location: (latitude, longitude) in degrees.
+        :param k: number of POIs.
+        :return: list of (distance in metres, name, latitude, longitude), nearest first.
+        """
+        if kind not in self.kinds or k < 1:
+            return []
+        first, count = self.kinds[kind]
+        qx, qy, qz = to_vector(location[0], location[1])
+        xs, ys, zs = self.x, self.y, self.z
+        best = []  # max-heap of (-squared distance, index)
+        worst = math.inf
+        # (low, high, depth, squared distance of the splitting plane that led here)
+        stack = [(first, first + count, 0, 0.0)]
+        while stack:
+            low, high, depth, plane = stack.pop()
+            if plane >= worst:
+                continue
+            while low < high:
+                middle = (low + high) // 2
+                dx = qx - xs[middle]
+                dy = qy - ys[middle]
+                dz = qz - zs[middle]
+                squared = dx * dx + dy * dy + dz * dz
+                if len(best) < k:
+                    heapq.heappush(best, (-squared, middle))
+                    if len(best) == k:
+                        worst = -best[0][0]
+                elif squared < worst:
+                    heapq.heapreplace(best, (-squared, middle))
+                    worst = -best[0][0]
+                axis = depth % 3
+                difference = dx if axis == 0 else dy if axis == 1 else dz
+                depth += 1
+                # descend on the side of the query, come back to the other one if still worth it
+                if difference > 0:
+                    stack.append((low, middle, depth, difference * difference))
+                    low = middle + 1
+                else:
+                    stack.append((middle + 1, high, depth, difference * difference))
+                    high = middle
+        return [(chord_to_metres(-squared), self.name(index), self.latitude[index], self.longitude[index])
+                for squared, index in sorted(best, reverse=True)]
+
+    def _cell_nearest(self, kind: str, row: int, column: int, k: int) -> list:
+        return self.nearest(kind, cell_centre(row, column), k)
+
+    def nearest_cached(self, kind: str, location: tuple, k: int = 1) -> list:
+        """
+        K nearest POIs of the geohash cell of a location, computed once per cell. Good
+        enough to direct a vehicle; distances are those from the centre of the cell.
+        :param kind: POI kind, e.g. 'hospital'.
+        :param location: (latitude, longitude) in degrees.
+        :param k: number of POIs.
+        :return: list of (distance in metres, name, latitude, longitude), nearest first.
+        """
+        row, column = geohash_cell(location[0], location[1])
+        return self.cached(kind, row, column, k)
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def load(path: str) -> PoiIndex:
+    """
+    Open a POI index, building it first when given a CSV dataset: the index is kept
+    next to the dataset as <path>.idx and rebuilt only when the dataset is newer.
+    :param path: index file or CSV dataset.
+    :return: PoiIndex.
+    """
+    if not path.endswith('.csv'):
+        return PoiIndex(path)
+    index_path = path + '.idx'
+    if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(path):
+        build(read_csv(path), index_path)
+    return PoiIndex(index_path)
@@ -0,0 +1,99 @@
+import threading
+
+
+def with_dependents(routes: dict, nodes, keep=()) -> set:
+    """
+    Destinations that become unreachable when some destinations are removed: the
+    destinations themselves and, transitively, every route through them.
+    :param routes: routing table snapshot.
+    :param nodes: destinations being removed.
+    :param keep: destinations getting a new route in the same change.
+    :return: set of destinations to remove.
+    """
+    gone = set(nodes)
+    frontier = gone
+    while frontier:
+        frontier = {node for node, record in routes.items()
+                    if record['through'] in frontier and node not in gone and node not in keep}
+        gone |= frontier
+    return gone
+
+
+class RouteTable:
+    """
+    Versioned, copy-on-write routing table: destination -> {'hop', 'through'}.
+
+    Readers take the current snapshot without locking; it is never modified once
+    published, and neither are its records, so a sender iterating it always sees one
+    consistent version of the table. Writers serialize on a lock, compute their
+    change against the current version and publish a new dict only if something
+    changed. Nothing but dict work happens under the lock.
+    """
+
+    def __init__(self):
+        """
+        Initializer for the route table.
+        """
+        # (version, destination -> record), replaced as a whole by writers
+        self._state = (0, {})
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> dict:
+        """
+        Current destination -> record mapping. Must not be mutated by the caller.
+        :return: dict
+        """
+        return self._state[1]
+
+    @property
+    def version(self) -> int:
+        """
+        Number of changes published so far.
+        """
+        return self._state[0]
+
+    def get(self, node):
+        """
+        Route record of a destination.
+        :param node: destination node id.
+        :return: {'hop', 'through'} or None.
+        """
+        return self._state[1].get(node)
+
+    def apply(self, compute) -> tuple:
+        """
+        Atomically change the table.
+        :param compute: callable(routes) returning (updates, removals) from the current
+            snapshot: a dict of destination -> new record and an iterable of destinations
+            to delete. It runs under the writer lock and must not block.
+        :return: (updates applied, dict of the removed destination -> record)
+        """
+        with self._lock:
+            version, routes = self._state
+            updates, removals = compute(routes)
+            removals = [node for node in removals if node in routes or node in updates]
+            if not updates and not removals:
+                return {}, {}
+            new_routes = dict(routes)
+            new_routes.update(updates)
+            removed = {node: new_routes.pop(node) for node in removals if node in new_routes}
+            self._state = (version + 1, new_routes)
+        return updates, removed
+
+    def install(self, version: int, routes: dict):
+        """
+        Replace the whole table with a snapshot published by another process.
+        :param version: version of the snapshot.
+        :param routes: destination -> record.
+        """
+        with self._lock:
+            self._state = (version, routes)
+
+    def __contains__(self, node) -> bool:
+        return node in self._state[1]
+
+    def __len__(self) -> int:
+        return len(self._state[1])
+
+    def __iter__(self):
+        return iter(self._state[1])
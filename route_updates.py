@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger('v2vnode')
+
+FULL = 'full'
+DELTA = 'delta'
+# Largest route update datagram; kept under the 10240 byte receive buffers.
+MAX_DATAGRAM = 8192
+# Seconds an incomplete fragmented update is kept waiting for its missing fragments.
+FRAGMENT_TIMEOUT = 5.0
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, separators=(',', ':')).encode('utf-8')
+
+
+class RouteAnnouncer:
+    """
+    Sender side of the route table propagation.
+
+    Route changes are only marked here; the periodic tick coalesces every
+    change made during ``interval`` seconds into one sequence-numbered delta
+    (changed entries plus removed destinations) and sends a full snapshot every
+    ``snapshot_interval`` seconds so receivers that missed a delta converge. Updates
+    bigger than MAX_DATAGRAM are split into fragments sharing the same sequence number.
+    """
+
+    def __init__(self, node_id, table_source, send, interval: float = 0.5, snapshot_interval: float = 30.0):
+        """
+        Initializer for the announcer.
+        :param node_id: id of the local node.
+        :param table_source: callable returning the current route table (node -> {'hop', 'through'}).
+        :param send: callable(bytes) multicasting one datagram.
+        :param interval: minimum seconds between two updates.
+        :param snapshot_interval: seconds between two full snapshots.
+        """
+        self.node_id = node_id
+        self.table_source = table_source
+        self.send = send
+        self.interval = interval
+        self.snapshot_interval = snapshot_interval
+        # a new epoch on every start tells receivers to drop the previous sequence numbers
+        self.epoch = int.from_bytes(os.urandom(4), 'big')
+        self.seq = 0
+        self.changed = set()
+        self.snapshot_due = True
+        self.last_snapshot = 0.0
+        self.lock = threading.Lock()
+
+    def mark_changed(self, nodes):
+        """
+        Record route entries that were added, changed or removed.
+        :param nodes: destinations whose route changed.
+        """
+        with self.lock:
+            self.changed.update(nodes)
+
+    def request_snapshot(self):
+        """
+        Send a full snapshot with the next update.
+        """
+        with self.lock:
+            self.snapshot_due = True
+
+    def build(self, full: bool, changed=()) -> list:
+        """
+        Build the datagrams of one update.
+        :param full: full snapshot if True, delta of the changed destinations otherwise.
+        :param changed: destinations of the delta.
+        :return: list of datagrams.
+        """
+        table = self.table_source()
+        if full:
+            routes = [[node, record['hop']] for node, record in list(table.items())]
+            removed = []
+        else:
+            routes, removed = [], []
+            for node in changed:
+                record = table.get(node)
+                if record is None:
+                    removed.append(node)
+                else:
+                    routes.append([node, record['hop']])
+        self.seq += 1
+        base = {'node': self.node_id, 'epoch': self.epoch, 'seq': self.seq, 'type': FULL if full else DELTA}
+        packet = _encode(dict(base, route=routes, removed=removed, frag=[0, 1]))
+        if len(packet) <= MAX_DATAGRAM:
+            return [packet]
+        # split the entries so every fragment fits, then number the fragments
+        overhead = len(_encode(dict(base, route=[], removed=[], frag=[0, 0]))) + 16
+        entries = [('route', entry) for entry in routes] + [('removed', node) for node in removed]
+        chunks, chunk, size = [], {'route': [], 'removed': []}, overhead
+        for key, entry in entries:
+            entry_size = len(_encode(entry)) + 1
+            if size + entry_size > MAX_DATAGRAM and (chunk['route'] or chunk['removed']):
+                chunks.append(chunk)
+                chunk, size = {'route': [], 'removed': []}, overhead
+            chunk[key].append(entry)
+            size += entry_size
+        chunks.append(chunk)
+        return [_encode(dict(base, route=chunk['route'], removed=chunk['removed'], frag=[index, len(chunks)]))
+                for index, chunk in enumerate(chunks)]
+
+    def flush(self):
+        """
+        Send the pending update, if any, right away.
+        """
+        with self.lock:
+            full = self.snapshot_due
+            changed = self.changed
+            if not full and not changed:
+                return
+            self.changed = set()
+            self.snapshot_due = False
+        if full:
+            self.last_snapshot = time.monotonic()
+        for packet in self.build(full, changed):
+            self.send(packet)
+
+    def tick(self, now: float = None):
+        """
+        Periodic entry point: flush the pending changes, and a full snapshot every
+        snapshot_interval. Calling it every interval seconds bounds the update rate.
+        :param now: current monotonic time.
+        """
+        now = time.monotonic() if now is None else now
+        if now - self.last_snapshot >= self.snapshot_interval:
+            self.request_snapshot()
+        try:
+            self.flush()
+        except OSError as e:
+            logger.debug(f"route update failed {e}")
+
+
+class RouteUpdate:
+    """
+    A complete (reassembled) route update received from a neighbour.
+    """
+    __slots__ = ('node', 'full', 'routes', 'removed')
+
+    def __init__(self, node, full: bool, routes: list, removed: list):
+        self.node = node
+        self.full = full
+        self.routes = routes
+        self.removed = removed
+
+
+class RouteUpdateReceiver:
+    """
+    Receiver side of the route table propagation: drops stale or duplicate updates
+    and reassembles fragmented ones.
+    """
+
+    def __init__(self):
+        """
+        Initializer for the receiver.
+        """
+        self.last_seq = {}
+        self.fragments = {}
+
+    def receive(self, packet: bytes):
+        """
+        Process one datagram.
+        :param packet: received datagram.
+        :return: RouteUpdate once an update is complete and fresh, None otherwise.
+        """
+        message = json.loads(packet)
+        node = message['node']
+        epoch, seq = message['epoch'], message['seq']
+        last = self.last_seq.get(node)
+        if last is not None and last[0] == epoch and seq <= last[1]:
+            return None
+        index, count = message['frag']
+        if count > 1:
+            key = (node, epoch, seq)
+            now = time.monotonic()
+            for stale in [k for k, v in self.fragments.items() if now - v[0] > FRAGMENT_TIMEOUT]:
+                del self.fragments[stale]
+            received = self.fragments.setdefault(key, (now, {}))[1]
+            received[index] = message
+            if len(received) < count:
+                return None
+            del self.fragments[key]
+            parts = [received[i] for i in range(count)]
+        else:
+            parts = [message]
+        self.last_seq[node] = (epoch, seq)
+        routes = [entry for part in parts for entry in part['route']]
+        removed = [entry for part in parts for entry in part['removed']]
+        return RouteUpdate(node, message['type'] == FULL, routes, removed)
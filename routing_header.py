@@ -0,0 +1,123 @@
+import collections
+import os
+import struct
+import threading
+
+from session_keys import FRAME_HEADER
+
+# Multi-hop messages travel as a sealed frame of their origin (see session_keys.py)
+# behind a cleartext routing header: frame type, destination node id, hops left and
+# message id. Relays read the header, forward the frame to the next hop of their
+# route towards the destination and never decrypt or parse the payload; only the
+# destination opens the inner frame, with the session key the origin sent it (itself
+# a routed key exchange frame). The header is not authenticated, as the hop count
+# changes on every hop, so message ids are random: a node off the path cannot send
+# headers ahead with the ids of an origin's next frames and have the relays drop the
+# genuine ones as loops. A forged header can still misdirect or drop the frame it
+# travels with, which a relay could do anyway; the payload stays authenticated end to end.
+ROUTE_HEADER = struct.Struct('!BiBI')
+ROUTED = 3
+# Messages remembered per node to drop the copies coming back around a loop.
+SEEN_MESSAGES = 4096
+
+
+class RoutingError(Exception):
+    """
+    Raised for a frame that is not a well formed routed frame.
+    """
+
+
+def is_routed(frame) -> bool:
+    """
+    :param frame: received frame.
+    :return: True if the frame carries a routing header.
+    """
+    return len(frame) > 0 and frame[0] == ROUTED
+
+
+def wrap(destination: int, hops: int, message_id: int, frame) -> bytes:
+    """
+    Put a routing header in front of a sealed frame.
+    :param destination: id of the destination node.
+    :param hops: hops the frame may still travel.
+    :param message_id: random id of the message (taken modulo 2 ** 32).
+    :param frame: sealed or key exchange frame of the origin.
+    :return: routed frame bytes.
+    """
+    return ROUTE_HEADER.pack(ROUTED, destination, hops, message_id & 0xFFFFFFFF) + frame
+
+
+def read(frame) -> tuple:
+    """
+    Read the routing header of a routed frame and the origin from the frame inside.
+    :param frame: routed frame.
+    :return: (destination, hops left, message id, origin node id)
+    """
+    if len(frame) < ROUTE_HEADER.size + FRAME_HEADER.size:
+        raise RoutingError("routed frame too short")
+    frame_type, destination, hops, message_id = ROUTE_HEADER.unpack_from(frame)
+    if frame_type != ROUTED:
+        raise RoutingError(f"not a routed frame {frame_type}")
+    _, origin, _ = FRAME_HEADER.unpack_from(frame, ROUTE_HEADER.size)
+    return destination, hops, message_id, origin
+
+
+def inner(frame) -> memoryview:
+    """
+    :param frame: routed frame.
+    :return: the origin's frame, without copying it.
+    """
+    return memoryview(frame)[ROUTE_HEADER.size:]
+
+
+def forwarded(frame, destination: int, hops: int, message_id: int) -> tuple:
+    """
+    The frame to send to the next hop: a new header with one hop less and a view of
+    the unchanged rest of the received frame, written out together with sendmsg.
+    :param frame: received routed frame.
+    :param destination: id of the destination node.
+    :param hops: hops left in the received frame.
+    :param message_id: id of the message.
+    :return: (header bytes, memoryview of the origin's frame)
+    """
+    return ROUTE_HEADER.pack(ROUTED, destination, hops - 1, message_id), inner(frame)
+
+
+def new_message_id() -> int:
+    """
+    :return: a random 32 bit message id, which no other node can predict; a restarted
+        node does not reuse the ids its neighbours still remember either.
+    """
+    return int.from_bytes(os.urandom(4), 'big')
+
+
+class SeenMessages:
+    """
+    (origin, message id) of the latest routed frames a node forwarded, or received
+    and authenticated, oldest forgotten first.
+    """
+
+    def __init__(self, size: int = SEEN_MESSAGES):
+        """
+        Initializer for the set.
+        :param size: messages remembered.
+        """
+        self.size = size
+        self.messages = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, origin: int, message_id: int) -> bool:
+        """
+        Remember a message.
+        :param origin: id of the origin node.
+        :param message_id: id of the message.
+        :return: False if the message was already seen.
+        """
+        key = (origin, message_id)
+        with self.lock:
+            if key in self.messages:
+                return False
+            self.messages[key] = None
+            if len(self.messages) > self.size:
+                self.messages.popitem(last=False)
+            return True
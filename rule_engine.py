@@ -0,0 +1,228 @@
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+from vehicle_state import VehicleStateStore
+
+logger = logging.getLogger('v2vnode')
+
+# Seconds between two checks of the rule file for changes.
+RELOAD_INTERVAL = 1.0
+
+AGGREGATES = {
+    'mean': lambda values: sum(values) / len(values),
+    'min': min,
+    'max': max,
+    'sum': sum,
+    'count': len,
+}
+
+
+class RuleError(Exception):
+    """
+    Raised for an invalid rule configuration.
+    """
+
+
+def _condition(when):
+    """
+    Compiles the threshold part of a rule.
+
+    Args:
+        when (dict): any of below, above, outside ([low, high]) and equals; all must hold.
+
+    Returns:
+        [callable]: predicate on a value.
+    """
+    checks = []
+    for key, bound in when.items():
+        if key == 'below':
+            checks.append(lambda value, bound=bound: value < bound)
+        elif key == 'above':
+            checks.append(lambda value, bound=bound: value > bound)
+        elif key == 'outside':
+            low, high = bound
+            checks.append(lambda value, low=low, high=high: value < low or value > high)
+        elif key == 'equals':
+            checks.append(lambda value, bound=bound: value == bound)
+        else:
+            raise RuleError(f"unknown condition {key}")
+    if not checks:
+        return lambda value: True
+    if len(checks) == 1:
+        return checks[0]
+    return lambda value: all(check(value) for check in checks)
+
+
+class Rule:
+    """
+    One compiled rule: a condition on the readings of a sensor and the action to take.
+    """
+    __slots__ = ('name', 'sensor_id', 'condition', 'window', 'aggregate', 'suppress', 'action')
+
+    def __init__(self, name, sensor_id, condition, window, aggregate, suppress, action):
+        self.name = name
+        self.sensor_id = sensor_id
+        self.condition = condition
+        self.window = window
+        self.aggregate = aggregate
+        self.suppress = suppress
+        self.action = action
+
+    def matches(self, data, history, now):
+        """
+        Args:
+            data (dict): received message.
+            history (deque): (time, value) of the recent readings of the sender, this one included.
+            now (float): current monotonic time.
+
+        Returns:
+            [bool]: whether the condition holds.
+        """
+        try:
+            if self.window is None:
+                return self.condition(data['senorReading'])
+            since = now - self.window
+            # copied in one go, other threads may append to the ring buffer meanwhile
+            values = [value for at, value in list(history) if at >= since]
+            return bool(values) and self.condition(self.aggregate(values))
+        except (KeyError, TypeError, ValueError):
+            return False
+
+
+def compile_rules(config, actions):
+    """
+    Compiles a rule configuration into a dispatch table.
+
+    Args:
+        config (dict): {"rules": [rule, ...]}, each rule a dict with sensor, action and
+            optionally name, when (on senorReading), window (seconds), aggregate
+            (mean, min, max, sum or count of the sender's readings over the window) and
+            suppress (seconds during which the rule does not act again for the same vehicle).
+        actions (dict): callables taking (data, rule), by action name.
+
+    Returns:
+        [dict]: tuple of Rule by sensor id, in configuration order.
+    """
+    table = collections.defaultdict(list)
+    try:
+        for index, spec in enumerate(config['rules']):
+            sensor_id = spec['sensor']
+            name = spec.get('name', f"{sensor_id}-{index}")
+            action = actions.get(spec['action'])
+            if action is None:
+                raise RuleError(f"rule {name}: unknown action {spec['action']}")
+            window = spec.get('window')
+            aggregate = None
+            if window is not None:
+                window = float(window)
+                aggregate = AGGREGATES.get(spec.get('aggregate', 'mean'))
+                if window <= 0 or aggregate is None:
+                    raise RuleError(f"rule {name}: invalid window or aggregate")
+            elif 'aggregate' in spec:
+                raise RuleError(f"rule {name}: aggregate without window")
+            suppress = spec.get('suppress')
+            if suppress is not None:
+                suppress = float(suppress)
+            condition = _condition(spec.get('when', {}))
+            table[sensor_id].append(Rule(name, sensor_id, condition, window, aggregate, suppress, action))
+    except (KeyError, TypeError, ValueError) as e:
+        raise RuleError(f"invalid rule configuration: {e!r}")
+    return {sensor_id: tuple(rules) for sensor_id, rules in table.items()}
+
+
+class RuleEngine:
+    """
+    Evaluates the received messages against rules keyed by sensor id.
+
+    Rules are compiled once into a table, so a message only costs the rules of its
+    sensor. When the rules come from a file, the file is checked for changes at
+    most every RELOAD_INTERVAL and recompiled; an invalid file keeps the previous rules.
+    Readings and actions are remembered per vehicle in a VehicleStateStore, which
+    drops duplicate alerts and answers window and suppress conditions.
+    """
+
+    def __init__(self, actions, rules=None, path=None, state=None):
+        """
+        Constructor for the rule engine.
+
+        Args:
+            actions (dict): callables taking (data, rule), by action name.
+            rules (dict): configuration used when there is no file.
+            path (str): JSON rule file, reloaded when it changes.
+            state (VehicleStateStore): per vehicle state, a new store if None.
+        """
+        self.actions = actions
+        self.path = path
+        self.mtime = None
+        self.checked = time.monotonic()
+        self.lock = threading.Lock()
+        self.state = state if state is not None else VehicleStateStore()
+        if path is not None:
+            self.load()
+        else:
+            self.install(compile_rules(rules or {'rules': []}, actions))
+
+    def install(self, table):
+        """
+        Replaces the rules with a compiled table.
+
+        Args:
+            table (dict): tuple of Rule by sensor id.
+        """
+        # one assignment, so concurrent evaluations see either the old or the new rules
+        self.table = table
+
+    def load(self):
+        """
+        Loads and compiles the rule file.
+        """
+        self.mtime = os.stat(self.path).st_mtime
+        with open(self.path) as file:
+            config = json.load(file)
+        self.install(compile_rules(config, self.actions))
+        logger.info(f"loaded {sum(len(rules) for rules in self.table.values())} rules from {self.path}")
+
+    def reload(self):
+        """
+        Recompiles the rule file if it changed since it was loaded.
+        """
+        with self.lock:
+            self.checked = time.monotonic()
+            try:
+                if os.stat(self.path).st_mtime != self.mtime:
+                    self.load()
+            except (OSError, ValueError, RuleError) as e:
+                logger.warning(f"keeping the previous rules, {self.path} could not be loaded {e}")
+
+    def evaluate(self, data):
+        """
+        Takes the action of every rule of the message's sensor that matches and
+        did not act for the same vehicle within its suppress window.
+
+        Args:
+            data (dict): received message.
+
+        Returns:
+            [int]: number of actions taken.
+        """
+        now = time.monotonic()
+        if self.path is not None and now - self.checked >= RELOAD_INTERVAL:
+            self.reload()
+        rules = self.table.get(data.get('senorId'))
+        if not rules:
+            return 0
+        vehicle_id = data.get('vehicleId', data.get('infraNodeId'))
+        history = self.state.observe(vehicle_id, data['senorId'], data.get('senorReading'), now)
+        if history is None:
+            return 0
+        taken = 0
+        for rule in rules:
+            if rule.matches(data, history, now) and (
+                    rule.suppress is None or self.state.act(vehicle_id, rule.name, rule.suppress, now)):
+                rule.action(data, rule)
+                taken += 1
+        return taken
@@ -2,55 +2,272 @@
 
 # Public Private Key cryptography
 
+import os
+import tempfile
+import threading
 
-
-# Generate key
-from cryptography.hazmat.backends import default_backend
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.asymmetric import rsa
 
-private_key = rsa.generate_private_key(
-    public_exponent=65537,
-    key_size=2048,
-    backend=default_backend()
+KEY_SIZE = 2048
+PUBLIC_EXPONENT = 65537
+# Directory holding the node identities, overridable for multiple checkouts on one Pi.
+KEY_DIR = os.environ.get('V2V_KEY_DIR', os.path.join(os.path.expanduser('~'), '.v2v', 'keys'))
+
+OAEP = padding.OAEP(
+    mgf=padding.MGF1(algorithm=hashes.SHA256()),
+    algorithm=hashes.SHA256(),
+    label=None
+)
+PSS = padding.PSS(
+    mgf=padding.MGF1(hashes.SHA256()),
+    salt_length=padding.PSS.MAX_LENGTH
 )
-public_key = private_key.public_key()
 
-print(public_key)
 
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.asymmetric import padding
+def generate_private_key():
+    """
+    Generate a new RSA private key.
+    :return: RSA private key.
+    """
+    return rsa.generate_private_key(public_exponent=PUBLIC_EXPONENT, key_size=KEY_SIZE)
+
+
+def public_key_to_pem(public_key) -> str:
+    """
+    Serialize a public key as PEM.
+    :param public_key: RSA public key.
+    :return: PEM string.
+    """
+    return public_key.public_bytes(serialization.Encoding.PEM,
+                                   serialization.PublicFormat.SubjectPublicKeyInfo).decode('ascii')
+
+
+class KeyStore:
+    """
+    On-disk identity of a node.
+
+    The RSA private key is loaded (read once) from a PEM file the first time it is
+    needed, and generated and saved only if the file does not exist, so a node keeps
+    the same identity across restarts and importing this module costs nothing.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initializer for the key store.
+        :param path: PEM file of the private key.
+        """
+        self.path = path
+        self._private_key = None
+        self._public_key_pem = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_node(cls, node_id, key_dir: str = None):
+        """
+        Key store of a node in the key directory.
+        :param node_id: id of the vehicle/infra node.
+        :param key_dir: directory of the key files, KEY_DIR by default.
+        :return: KeyStore
+        """
+        return cls(os.path.join(key_dir or KEY_DIR, f'node-{node_id}.pem'))
+
+    def _load(self):
+        """
+        Read the private key from disk, generating and saving a new one if missing.
+        A new key is written and synced to a temporary file first, then linked into
+        place, so the key file is never seen partly written and never overwritten.
+        :return: RSA private key.
+        """
+        try:
+            with open(self.path, 'rb') as key_file:
+                return serialization.load_pem_private_key(key_file.read(), password=None)
+        except FileNotFoundError:
+            pass
+        private_key = generate_private_key()
+        pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                        serialization.NoEncryption())
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as key_file:
+                key_file.write(pem)
+                key_file.flush()
+                os.fsync(key_file.fileno())
+            os.link(temporary, self.path)
+        except FileExistsError:
+            # another instance of the same node saved its key first
+            return self._load()
+        finally:
+            os.unlink(temporary)
+        directory_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+        return private_key
+
+    @property
+    def private_key(self):
+        """
+        RSA private key of the node, loaded on first access.
+        """
+        if self._private_key is None:
+            with self._lock:
+                if self._private_key is None:
+                    self._private_key = self._load()
+        return self._private_key
+
+    @property
+    def public_key(self):
+        """
+        RSA public key of the node.
+        """
+        return self.private_key.public_key()
+
+    @property
+    def public_key_pem(self) -> str:
+        """
+        PEM encoded public key of the node, as announced to the peers.
+        """
+        if self._public_key_pem is None:
+            self._public_key_pem = public_key_to_pem(self.public_key)
+        return self._public_key_pem
+
+
+class PublicKeyDirectory:
+    """
+    Cache of the peers' public keys, keyed by node id.
+    A PEM is only parsed again when the peer announces a different key.
+    """
+
+    def __init__(self):
+        """
+        Initializer for the directory.
+        """
+        self.keys = {}
+        self._lock = threading.Lock()
+
+    def add(self, node_id, pem: str) -> bool:
+        """
+        Register the public key announced by a peer.
+        :param node_id: id of the peer.
+        :param pem: PEM encoded public key.
+        :return: True if the key is new or changed.
+        """
+        known = self.keys.get(node_id)
+        if known is not None and known[0] == pem:
+            return False
+        public_key = serialization.load_pem_public_key(pem.encode('ascii'))
+        with self._lock:
+            self.keys[node_id] = (pem, public_key)
+        return True
+
+    def get(self, node_id):
+        """
+        Public key of a peer.
+        :param node_id: id of the peer.
+        :return: RSA public key or None if unknown.
+        """
+        known = self.keys.get(node_id)
+        return known[1] if known is not None else None
+
+    def pems(self) -> dict:
+        """
+        :return: node id -> PEM of every known key, e.g. to publish them to another process.
+        """
+        return {node_id: known[0] for node_id, known in list(self.keys.items())}
+
+    def remove(self, node_id):
+        """
+        Forget the key of a peer.
+        :param node_id: id of the peer.
+        """
+        with self._lock:
+            self.keys.pop(node_id, None)
+
+
+def encrypt(public_key, message):
+    """
+    Encrypt a message with RSA-OAEP.
+    :param public_key: RSA public key of the receiver.
+    :param message: str or bytes message.
+    :return: encrypted bytes.
+    """
+    byte_message = str.encode(message) if isinstance(message, str) else message
+    return public_key.encrypt(byte_message, OAEP)
+
+
+def decrypt(private_key, encrypted_message):
+    """
+    Decrypt a message encrypted with encrypt().
+    :param private_key: RSA private key of the receiver.
+    :param encrypted_message: encrypted bytes.
+    :return: decrypted str.
+    """
+    return private_key.decrypt(encrypted_message, OAEP).decode()
+
+
+def wrap_key(public_key, key):
+    """
+    Encrypt a symmetric session key for a peer with RSA-OAEP.
+    :param public_key: RSA public key of the peer.
+    :param key: session key bytes.
+    :return: wrapped key bytes.
+    """
+    return public_key.encrypt(key, OAEP)
+
+
+def sign(private_key, message: bytes) -> bytes:
+    """
+    Sign a message with RSA-PSS.
+    :param private_key: own RSA private key.
+    :param message: bytes to sign.
+    :return: signature bytes.
+    """
+    return private_key.sign(message, PSS, hashes.SHA256())
+
+
+def verify(public_key, signature: bytes, message: bytes) -> bool:
+    """
+    Check a signature made with sign().
+    :param public_key: RSA public key of the signer.
+    :param signature: signature bytes.
+    :param message: signed bytes.
+    :return: True if the signature is valid.
+    """
+    try:
+        public_key.verify(signature, message, PSS, hashes.SHA256())
+    except InvalidSignature:
+        return False
+    return True
+
+
+def unwrap_key(private_key, wrapped_key):
+    """
+    Decrypt a session key wrapped with wrap_key.
+    :param private_key: own RSA private key.
+    :param wrapped_key: wrapped key bytes.
+    :return: session key bytes.
+    """
+    return private_key.decrypt(wrapped_key, OAEP)
+
+
+if __name__ == '__main__':
+    private_key = generate_private_key()
+    public_key = private_key.public_key()
+    print(public_key_to_pem(public_key))
+
+    message = 'Hello There'
+    print(message)
+
+    encrypted_message = encrypt(public_key, message)
+    print("Encrypted: ", encrypted_message)
+
+    decrypted_message = decrypt(private_key, encrypted_message)
 
-def encrypt(public_key,message):
-    byte_message=str.encode(message)
-    encrypted_message = public_key.encrypt(
-        byte_message,
-        padding.OAEP(
-            mgf=padding.MGF1(algorithm=hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None
-        )
-    )
-
-    return encrypted_message
-
-def decrypt(private_key,encrypted_message):
-    bytes_decrypted_message = private_key.decrypt(
-        encrypted_message,
-        padding.OAEP(
-            mgf=padding.MGF1(algorithm=hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None
-        )
-    )
-    str_decrypted_message = bytes_decrypted_message.decode()
-    return str_decrypted_message
-
-message='Hello There'
-print(message)
-
-encrypted_message=encrypt(public_key,message)
-print("Encrypted: ",encrypted_message)
-
-decrypted_message=decrypt(private_key,encrypted_message)
-
-print("Decrypted: ",decrypted_message)
+    print("Decrypted: ", decrypted_message)
@@ -0,0 +1,266 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger('v2vnode')
+
+# Seconds between two sweeps of the token buckets of idle destinations.
+BUCKET_SWEEP_INTERVAL = 10.0
+
+
+class TokenBucket:
+    """
+    Token bucket limiting the message rate towards one destination.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """
+        Initializer for the token bucket.
+        :param rate: tokens added per second.
+        :param burst: maximum number of tokens held.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def reserve(self, now: float) -> float:
+        """
+        Take a token if one is available.
+        :param now: current monotonic time.
+        :return: 0 if a token was taken, otherwise seconds until the next one is available.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        """
+        :param now: current monotonic time.
+        :return: True if the bucket has refilled, i.e. it is as good as a new one.
+        """
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class OutboundItem:
+    """
+    A payload waiting in the outbound queue.
+    """
+    __slots__ = ('payload', 'ready_at')
+
+    def __init__(self, payload, ready_at: float):
+        self.payload = payload
+        self.ready_at = ready_at
+
+
+class OutboundQueue:
+    """
+    Bounded outbound message queue drained by dedicated sender threads.
+
+    Messages are queued per destination and delivered in order, one in-flight message
+    per destination, so a slow peer only delays its own traffic. Every destination is
+    rate limited by a token bucket. Messages put with a coalescing key are held for
+    ``coalesce_window`` seconds, and a newer message with the same key replaces the
+    pending one instead of being queued behind it.
+    """
+
+    def __init__(self, deliver, maxsize: int = 1024, workers: int = 4, rate: float = 50.0,
+                 burst: int = 20, coalesce_window: float = 0.05):
+        """
+        Initializer for the outbound queue.
+        :param deliver: callable(destination, payload) performing the actual send.
+        :param maxsize: maximum number of pending messages across all destinations.
+        :param workers: number of sender threads.
+        :param rate: messages per second allowed towards each destination.
+        :param burst: messages that can be sent back to back to one destination.
+        :param coalesce_window: seconds a message waits for a newer one with the same key.
+        """
+        self.deliver = deliver
+        self.maxsize = maxsize
+        self.workers = workers
+        self.rate = rate
+        self.burst = burst
+        self.coalesce_window = coalesce_window
+        self.queues = {}
+        self.buckets = {}
+        self.ready = []
+        # destination -> sequence number of its live entry in ready; other entries are stale
+        self.scheduled = {}
+        self.in_flight = set()
+        self.swept = time.monotonic()
+        self.size = 0
+        self.dropped = 0
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.threads = []
+        self.running = False
+
+    def put(self, destination, payload, key=None) -> bool:
+        """
+        Queue a payload for a destination without blocking.
+        :param destination: destination key (node id of the next hop).
+        :param payload: message to deliver.
+        :param key: coalescing key, a pending payload with the same key is replaced.
+        :return: False if the queue is full and the payload was dropped.
+        """
+        now = time.monotonic()
+        with self.condition:
+            queue = self.queues.get(destination)
+            if queue is None:
+                queue = self.queues[destination] = OrderedDict()
+            if key is not None and key in queue:
+                queue[key].payload = payload
+                return True
+            if self.size >= self.maxsize:
+                self.dropped += 1
+                logger.debug(f"outbound queue full, dropping message to {destination}")
+                return False
+            if key is None:
+                key = ('seq', next(self.sequence))
+                ready_at = now
+            else:
+                ready_at = now + self.coalesce_window
+            queue[key] = OutboundItem(payload, ready_at)
+            self.size += 1
+            if destination not in self.in_flight and destination not in self.scheduled:
+                self._schedule(destination, ready_at)
+            self.condition.notify()
+        return True
+
+    def _schedule(self, destination, at: float):
+        """
+        Schedule a destination to be serviced at the given time, replacing its previous
+        schedule if any. Caller holds the condition.
+        :param destination: destination key.
+        :param at: monotonic time at which the destination is due.
+        """
+        sequence = self.scheduled[destination] = next(self.sequence)
+        heapq.heappush(self.ready, (at, sequence, destination))
+
+    def _next(self):
+        """
+        Block until a message is due and allowed by its destination's rate limit.
+        :return: (destination, payload) or None once the queue is stopped.
+        """
+        with self.condition:
+            while self.running:
+                if not self.ready:
+                    self.condition.wait()
+                    continue
+                at, sequence, destination = self.ready[0]
+                if self.scheduled.get(destination) != sequence:
+                    # left behind by discard or a newer schedule
+                    heapq.heappop(self.ready)
+                    continue
+                now = time.monotonic()
+                if at > now:
+                    self.condition.wait(at - now)
+                    continue
+                heapq.heappop(self.ready)
+                del self.scheduled[destination]
+                queue = self.queues.get(destination)
+                if not queue:
+                    self.queues.pop(destination, None)
+                    continue
+                item = next(iter(queue.values()))
+                if item.ready_at > now:
+                    self._schedule(destination, item.ready_at)
+                    continue
+                bucket = self.buckets.get(destination)
+                if bucket is None:
+                    bucket = self.buckets[destination] = TokenBucket(self.rate, self.burst)
+                wait = bucket.reserve(now)
+                if wait:
+                    self._schedule(destination, now + wait)
+                    continue
+                queue.popitem(last=False)
+                self.size -= 1
+                self.in_flight.add(destination)
+                return destination, item.payload
+        return None
+
+    def _done(self, destination):
+        """
+        Release a destination after delivery and reschedule its remaining messages.
+        :param destination: destination key.
+        """
+        with self.condition:
+            self.in_flight.discard(destination)
+            queue = self.queues.get(destination)
+            if queue:
+                self._schedule(destination, next(iter(queue.values())).ready_at)
+                self.condition.notify()
+                return
+            if queue is not None:
+                del self.queues[destination]
+            now = time.monotonic()
+            if now - self.swept >= BUCKET_SWEEP_INTERVAL:
+                self._sweep_buckets(now)
+
+    def _sweep_buckets(self, now: float):
+        """
+        Forget the token buckets of idle destinations that have refilled; a new bucket
+        would be the same. Caller holds the condition.
+        :param now: current monotonic time.
+        """
+        self.swept = now
+        idle = [destination for destination, bucket in self.buckets.items()
+                if bucket.is_full(now) and destination not in self.queues and destination not in self.in_flight]
+        for destination in idle:
+            del self.buckets[destination]
+
+    def _worker(self):
+        """
+        Sender thread: deliver due messages until the queue is stopped.
+        """
+        while True:
+            task = self._next()
+            if task is None:
+                return
+            destination, payload = task
+            try:
+                self.deliver(destination, payload)
+            except Exception as e:
+                logger.debug(f"error delivering to {destination} {e}")
+            finally:
+                self._done(destination)
+
+    def discard(self, destination):
+        """
+        Drop every pending message of a destination.
+        :param destination: destination key.
+        """
+        with self.condition:
+            queue = self.queues.pop(destination, None)
+            if queue:
+                self.size -= len(queue)
+            # its entries in ready are skipped from now on
+            self.scheduled.pop(destination, None)
+            self.buckets.pop(destination, None)
+
+    def start(self):
+        """
+        Start the sender threads.
+        """
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.threads = [threading.Thread(target=self._worker, name=f'sender-{i}', daemon=True)
+                        for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Stop the sender threads; pending messages are left in the queue.
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
@@ -9,7 +9,8 @@ from datetime import datetime
 class SensorControls:
     """
     Class to hold the control variables across
-    multiple sensors.
+    multiple sensors. Every vehicle gets its own instance
+    (see Sensors); getInstance returns a process wide default.
     """
     __instance = None
     FLAG = 'DEFAULT'
@@ -36,6 +37,9 @@ class PressureSensor:
     """
     Class for pressure sensor.
     """
+    SENSOR_ID = 'TP'
+    PERIOD = 1.0  # default seconds between two readings
+
 
     def __init__(self):
         """
@@ -93,10 +97,17 @@ class SpeedSensor:
     """
     Class for Odometer readings. 
     """
-    def __init__(self):
+    SENSOR_ID = 'SPD'
+    PERIOD = 2.0  # default seconds between two readings
+
+    def __init__(self, controls=None):
         """
         Constructor for the SpeedSensor class
+
+        Args:
+            controls (SensorControls): control variables of the vehicle, the default instance if None.
         """
+        self.controls = controls if controls is not None else SensorControls.getInstance()
         self.INITIAL_SPEED = randint(40, 80)
         self.SPEED = 0
         self.TICKS = 0
@@ -119,12 +130,12 @@ class SpeedSensor:
         """
         if self.TICKS == 0:
             # Azin
-            self.FLAG = SensorControls.getInstance().FLAG
+            self.FLAG = self.controls.FLAG
 
         randvalue2 = randint(0, 100)
 
         # Azin
-        if SensorControls.getInstance().BRAKE_APPLIED:
+        if self.controls.BRAKE_APPLIED:
             self.FLAG = 'DECREASE'
 
         if randvalue2 <= 33 and self.FLAG == 'DEFAULT':  # return same as initial value
@@ -163,6 +174,9 @@ class SpeedSensor:
 class LightSensor():
     """Class for LightSensor
     """
+    SENSOR_ID = 'LT'
+    PERIOD = 1.0  # default seconds between two readings
+
     def __init__(self):
         """
         Constructor for Light sensor. Senses the indesity of visible lights.
@@ -192,6 +206,9 @@ class LightSensor():
 class FuelSensor:
     """Class for Fuel sensor and its associated methods.
     """
+    SENSOR_ID = 'FLG'
+    PERIOD = 1.0  # default seconds between two readings
+
 
     def __init__(self):
         """Constructor for Fuel Sensor
@@ -223,6 +240,9 @@ class FuelSensor:
 class ProximitySensor:
     """Class for the Proximity sensor, which detects proximity variations
     """
+    SENSOR_ID = 'PRX'
+    PERIOD = 1.0  # default seconds between two readings
+
     def __init__(self):
         """Constructor to the proximity class
         """
@@ -273,15 +293,22 @@ class ProximitySensor:
 class BrakeSensor:
     """Class for the brake sensor. 
     """
-    def __init__(self):
+    SENSOR_ID = 'BRK'
+    PERIOD = 1.0  # default seconds between two readings
+
+    def __init__(self, controls=None):
         """Constructor for brake sensor.
+
+        Args:
+            controls (SensorControls): control variables of the vehicle, the default instance if None.
         """
+        self.controls = controls if controls is not None else SensorControls.getInstance()
         self.TICKS = 0
 
     def ApplyBrake(self):
         """To explicitly apply the brakes.
         """
-        SensorControls.getInstance().BRAKE_APPLIED = True
+        self.controls.BRAKE_APPLIED = True
         self.TICKS = 0
 
     def GET_DATA(self):
@@ -292,19 +319,22 @@ class BrakeSensor:
         """
         # Azin
         if self.TICKS == 4:
-            if not SensorControls.getInstance().BRAKE_LOCK:
-                SensorControls.getInstance().BRAKE_APPLIED = not SensorControls.getInstance().BRAKE_APPLIED
+            if not self.controls.BRAKE_LOCK:
+                self.controls.BRAKE_APPLIED = not self.controls.BRAKE_APPLIED
             self.TICKS = 0
 
         self.TICKS += 1
 
-        return ['BRK', SensorControls.getInstance().BRAKE_APPLIED]
+        return ['BRK', self.controls.BRAKE_APPLIED]
 
 
 class HeartRateSensor:
     """
     Class for heartrate monitor sensor.
     """
+    SENSOR_ID = 'HRS'
+    PERIOD = 1.0  # default seconds between two readings
+
     def __init__(self):
         """constructor for heart rate monitor
         """
@@ -355,6 +385,9 @@ class HeartRateSensor:
 class GPSSensor:
     """Class for GPS sensor
     """
+    SENSOR_ID = 'GPS'
+    PERIOD = 1.0  # default seconds between two readings
+
     def __init__(self):
         """Constructor for GPS sensor.
         """
@@ -373,13 +406,21 @@ class GPSSensor:
         self.INITIAL_LAT += randint(0, 10) / 1000
         self.INITIAL_LONG += randint(0, 10) / 1000
 
-        return ['GPS', "(" + str(self.INITIAL_LAT) + "," + str(self.INITIAL_LONG) + ")"]
+        return ['GPS', (self.INITIAL_LAT, self.INITIAL_LONG)]
 
 
 class Sensors:
 
     """Master class to hold all the sensors of the vehicle.
     """
+    def __init__(self, controls=None):
+        """Constructor for the sensors of one vehicle.
+
+        Args:
+            controls (SensorControls): control variables of the vehicle, a new instance if None.
+        """
+        self.controls = controls if controls is not None else SensorControls()
+
     def getSensors(self):
         """Method to initialise all the sensor of the vehicle.
 
@@ -387,11 +428,11 @@ class Sensors:
             [List]: List of sensor objects
         """
         self.p1 = PressureSensor()
-        self.s1 = SpeedSensor()
+        self.s1 = SpeedSensor(self.controls)
         self.l1 = LightSensor()
         self.f1 = FuelSensor()
         self.px1 = ProximitySensor()
-        self.b1 = BrakeSensor()
+        self.b1 = BrakeSensor(self.controls)
         self.hrs = HeartRateSensor()
         self.gps = GPSSensor()
 
@@ -424,10 +465,10 @@ class Sensors:
             value (str): Control value
         """
         if value == 'A':
-            SensorControls.getInstance().BRAKE_APPLIED = True
-            SensorControls.getInstance().BRAKE_LOCK = True
+            self.controls.BRAKE_APPLIED = True
+            self.controls.BRAKE_LOCK = True
         else:
-            SensorControls.getInstance().BRAKE_APPLIED = False
-            SensorControls.getInstance().BRAKE_LOCK = False
+            self.controls.BRAKE_APPLIED = False
+            self.controls.BRAKE_LOCK = False
 
 
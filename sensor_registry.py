@@ -0,0 +1,85 @@
+import time
+
+from soft_state import ExpiryHeap
+
+
+class SensorRegistry:
+    """
+    Sensors of a vehicle with their handlers and sampling periods.
+
+    The next reading time of every sensor is kept in a heap, so a poll only reads
+    the sensors that are due and costs nothing for the others, and readings are
+    dispatched to their handler through a table keyed by sensor id.
+    """
+
+    def __init__(self):
+        """
+        Constructor for an empty registry.
+        """
+        self.sensors = {}
+        self.handlers = {}
+        self.schedule = ExpiryHeap()
+
+    def register(self, sensor, handler, period=None, start=None):
+        """
+        Adds a sensor, or replaces the one with the same id.
+
+        Args:
+            sensor: sensor object with SENSOR_ID, PERIOD and GET_DATA.
+            handler (callable): function processing the GET_DATA list of the sensor.
+            period (float): seconds between two readings, the sensor's PERIOD if None.
+            start (float): monotonic time of the first reading, right away if None.
+        """
+        period = period if period is not None else sensor.PERIOD
+        if period <= 0:
+            raise ValueError(f"sampling period of {sensor.SENSOR_ID} must be positive")
+        self.sensors[sensor.SENSOR_ID] = (sensor, period)
+        self.handlers[sensor.SENSOR_ID] = handler
+        self.schedule.touch(sensor.SENSOR_ID, start if start is not None else time.monotonic())
+
+    def unregister(self, sensor_id):
+        """
+        Stops polling a sensor.
+
+        Args:
+            sensor_id (str): id of the sensor.
+        """
+        self.sensors.pop(sensor_id, None)
+        self.handlers.pop(sensor_id, None)
+        self.schedule.discard(sensor_id)
+
+    def poll(self, now=None):
+        """
+        Reads the sensors that are due and schedules their next reading.
+
+        Args:
+            now (float): current monotonic time, time.monotonic() if None.
+
+        Returns:
+            [List]: GET_DATA lists of the due sensors, earliest first.
+        """
+        now = now if now is not None else time.monotonic()
+        readings = []
+        for sensor_id in self.schedule.expired(now):
+            sensor, period = self.sensors[sensor_id]
+            readings.append(sensor.GET_DATA())
+            self.schedule.touch(sensor_id, now + period)
+        return readings
+
+    def next_due(self):
+        """
+        Returns:
+            [float]: monotonic time of the next reading, None if no sensor is registered.
+        """
+        return self.schedule.next_deadline()
+
+    def dispatch(self, data):
+        """
+        Hands a reading to the handler of its sensor; readings of unknown sensors are ignored.
+
+        Args:
+            data (list): GET_DATA list.
+        """
+        handler = self.handlers.get(data[0])
+        if handler is not None:
+            handler(data)
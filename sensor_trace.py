@@ -0,0 +1,218 @@
+import mmap
+import os
+import struct
+import threading
+import time
+
+import wire_format
+
+# Append-only binary log of sensor readings.
+#
+# The file starts with a header, then holds one entry per sensor pass or speed step
+# of a vehicle, and one per location read for an alert, all in network byte order:
+#     magic (4s) | version (B)
+#     time (d) | vehicle id (i) | kind (B) | count (B) | (sensor code (B) | readings)...
+# Sensor codes are the ones of wire_format, the readings are the values of the
+# GET_DATA list of the sensor in the layout of TRACE_LAYOUTS.
+TRACE_MAGIC = b'V2VT'
+TRACE_VERSION = 1
+FILE_HEADER = struct.Struct('!4sB')
+ENTRY_HEADER = struct.Struct('!diBB')
+CODE = struct.Struct('!B')
+
+# Seconds the recorded entries may stay in the write buffer.
+FLUSH_INTERVAL = 1.0
+
+# entry kinds
+SENSOR_PASS = 0
+SPEED_STEP = 1
+# GPS reading attached to the alerts of the sensor pass recorded right after it
+LOCATION = 2
+
+TRACE_LAYOUTS = {
+    'SPD': 'h',
+    'TP': 'h',
+    'LT': 'B',
+    'FLG': 'h',
+    'PRX': '????',
+    'BRK': '?',
+    'HRS': 'h',
+    'GPS': 'dd',
+}
+
+
+class TraceLayout:
+    """
+    Encoding of the GET_DATA list of one sensor.
+    """
+
+    def __init__(self, sensor_id, layout):
+        self.sensor_id = sensor_id
+        self.code = wire_format.BY_SENSOR[sensor_id].code
+        self.layout = struct.Struct('!' + layout)
+
+    def pack(self, data):
+        if self.sensor_id == 'LT':
+            values = (wire_format.LIGHT_LEVELS.index(data[1]),)
+        elif self.sensor_id == 'GPS':
+            values = tuple(data[1])
+        else:
+            values = data[1:]
+        return CODE.pack(self.code) + self.layout.pack(*values)
+
+    def unpack(self, buffer, offset):
+        values = self.layout.unpack_from(buffer, offset)
+        if self.sensor_id == 'LT':
+            return [self.sensor_id, wire_format.LIGHT_LEVELS[values[0]]]
+        if self.sensor_id == 'GPS':
+            return [self.sensor_id, values]
+        return [self.sensor_id, *values]
+
+
+BY_SENSOR = {sensor_id: TraceLayout(sensor_id, layout) for sensor_id, layout in TRACE_LAYOUTS.items()}
+BY_CODE = {layout.code: layout for layout in BY_SENSOR.values()}
+
+
+class TraceError(Exception):
+    """
+    Raised for a file that is not a sensor trace.
+    """
+
+
+class TraceWriter:
+    """
+    Appends the readings of one or more vehicles to a trace file.
+    """
+
+    def __init__(self, path):
+        """
+        Constructor for the trace writer; appends to the file if it exists.
+
+        Args:
+            path (str): path of the trace file.
+        """
+        self.path = path
+        self.file = open(path, 'ab')
+        self.lock = threading.Lock()
+        self.flushed = time.monotonic()
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION))
+
+    def record(self, vehicle_id, readings, kind=SENSOR_PASS, now=None):
+        """
+        Appends one sensor pass or speed step of a vehicle.
+
+        Args:
+            vehicle_id (int): id of the vehicle.
+            readings (list): GET_DATA lists of the pass.
+            kind (int): SENSOR_PASS, SPEED_STEP or LOCATION.
+            now (float): time of the readings, time.time() if None.
+        """
+        now = now if now is not None else time.time()
+        body = b''.join(BY_SENSOR[data[0]].pack(data) for data in readings)
+        entry = ENTRY_HEADER.pack(now, vehicle_id, kind, len(readings)) + body
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(entry)
+            if time.monotonic() - self.flushed >= FLUSH_INTERVAL:
+                self.file.flush()
+                self.flushed = time.monotonic()
+
+    def flush(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.flush()
+
+    def close(self):
+        """
+        Flushes the buffered entries and closes the file; later records are ignored.
+        """
+        with self.lock:
+            self.file.close()
+
+
+class TraceReader:
+    """
+    Reads a trace file through a memory map.
+    """
+
+    def __init__(self, path):
+        """
+        Constructor for the trace reader.
+
+        Args:
+            path (str): path of the trace file.
+        """
+        self.path = path
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < FILE_HEADER.size:
+                raise TraceError(f"{path} is not a sensor trace")
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = FILE_HEADER.unpack_from(self.buffer, 0)
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            self.buffer.close()
+            raise TraceError(f"{path} is not a version {TRACE_VERSION} sensor trace")
+
+    def __iter__(self):
+        """
+        Yields the entries of the trace in the order they were recorded; an entry
+        cut short by a crash of the writer ends the trace.
+
+        Returns:
+            [Tuple]: (time, vehicle id, kind, readings)
+        """
+        buffer = self.buffer
+        offset = FILE_HEADER.size
+        end = len(buffer)
+        while offset + ENTRY_HEADER.size <= end:
+            now, vehicle_id, kind, count = ENTRY_HEADER.unpack_from(buffer, offset)
+            position = offset + ENTRY_HEADER.size
+            readings = []
+            try:
+                for _ in range(count):
+                    layout = BY_CODE[buffer[position]]
+                    readings.append(layout.unpack(buffer, position + 1))
+                    position += 1 + layout.layout.size
+            except (KeyError, IndexError, struct.error):
+                return
+            offset = position
+            yield now, vehicle_id, kind, readings
+
+    def close(self):
+        self.buffer.close()
+
+
+def replay(trace, vehicles, speed=1.0):
+    """
+    Feeds the entries of a trace to the vehicles that recorded them.
+
+    Args:
+        trace (TraceReader): trace to replay.
+        vehicles (dict): VehicleControls by vehicle id; entries of other vehicles are skipped.
+        speed (float): 1 replays in real time, N N times faster, 0 as fast as possible.
+
+    Returns:
+        [int]: number of entries replayed.
+    """
+    replayed = 0
+    start = first = None
+    for now, vehicle_id, kind, readings in trace:
+        vehicle = vehicles.get(vehicle_id)
+        if vehicle is None:
+            continue
+        if speed:
+            if first is None:
+                start, first = time.monotonic(), now
+            delay = start + (now - first) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        if kind == SPEED_STEP:
+            vehicle.stimulate_step(readings[0])
+        elif kind == LOCATION:
+            vehicle.replayed_location = readings[0]
+        else:
+            vehicle.sensor_pass(readings)
+        replayed += 1
+    return replayed
@@ -0,0 +1,202 @@
+import logging
+import os
+import struct
+import threading
+import time
+
+import encryption
+import security
+from send_queue import TokenBucket
+
+logger = logging.getLogger('v2vnode')
+
+# Cleartext header of every V2V frame: frame type, sender node id, session key id.
+# The header is authenticated as GCM associated data.
+FRAME_HEADER = struct.Struct('!BiI')
+KEY_EXCHANGE = 1
+SEALED = 2
+# A key exchange frame is header | wrapped key | signature; the sender signs the header,
+# the recipient's id and the wrapped key with its RSA key.
+RECIPIENT = struct.Struct('!i')
+# Minimum delay between two key exchange frames checked for the same claimed sender,
+# so a flood of bogus frames cannot pin the CPU on signature checks.
+UNWRAP_INTERVAL = 1.0
+# Key exchange frames unwrapped per second (and burst) over all senders; only frames
+# with a good signature are charged, so forged frames cannot starve genuine ones.
+UNWRAP_RATE = 50.0
+UNWRAP_BURST = 50
+# Senders whose last unwrap time is kept before the stale ones are pruned.
+MAX_UNWRAP_SENDERS = 1024
+
+
+class SessionKeyManager:
+    """
+    Per peer AES-GCM session keys negotiated with the RSA helpers in security.py.
+
+    Every node owns one random send key. It is wrapped once per peer with the peer's
+    RSA public key (learned from the discovery beacon), signed with the node's own RSA
+    key and sent as a key exchange frame when a stream to the peer is opened (and again
+    every few seconds while it stays open, see connection_pool.py), so the
+    asymmetric cost is paid once per peer rather than per message and one sealed
+    payload can still be shared by every direct neighbour. Received keys are only
+    accepted from senders whose public key is known and whose signature checks out,
+    are unwrapped once and cached by (sender, key id); the older keys of a sender are
+    dropped once a frame authenticates with its new one, so a replayed key exchange
+    cannot knock out a live session.
+    """
+
+    def __init__(self, node_id: int, key_store: security.KeyStore = None):
+        """
+        Initializer for the session key manager.
+        :param node_id: id of the local node.
+        :param key_store: identity of the node, the node's file in security.KEY_DIR by default.
+        """
+        self.node_id = node_id
+        self.key_store = key_store if key_store is not None else security.KeyStore.for_node(node_id)
+        self.key_id = int.from_bytes(os.urandom(4), 'big')
+        self.send_context = encryption.AEADContext()
+        self.header = FRAME_HEADER.pack(SEALED, node_id, self.key_id)
+        self.peer_keys = security.PublicKeyDirectory()
+        self.exchange_frames = {}
+        self.inbound = {}
+        # sender -> key id its latest authenticated frame used
+        self.current = {}
+        self.last_unwrap = {}
+        self.unwrap_budget = TokenBucket(UNWRAP_RATE, UNWRAP_BURST)
+        self.lock = threading.Lock()
+
+    @property
+    def public_key_pem(self) -> str:
+        """
+        PEM encoded public key of the node, announced in the discovery beacon.
+        """
+        return self.key_store.public_key_pem
+
+    def add_peer_key(self, node_id: int, pem: str):
+        """
+        Register (or refresh) the RSA public key announced by a peer.
+        :param node_id: id of the peer.
+        :param pem: PEM encoded public key from the discovery beacon.
+        """
+        if self.peer_keys.add(node_id, pem):
+            with self.lock:
+                self.exchange_frames.pop(node_id, None)
+
+    def key_exchange_frame(self, node_id: int):
+        """
+        Return the frame handing the local send key to a peer, wrapping it on first use.
+        :param node_id: id of the peer.
+        :return: frame bytes, or None if the peer's public key is unknown.
+        """
+        frame = self.exchange_frames.get(node_id)
+        if frame is not None:
+            return frame
+        public_key = self.peer_keys.get(node_id)
+        if public_key is None:
+            logger.debug(f"no public key for node {node_id}")
+            return None
+        header = FRAME_HEADER.pack(KEY_EXCHANGE, self.node_id, self.key_id)
+        wrapped = security.wrap_key(public_key, self.send_context.key)
+        signature = security.sign(self.key_store.private_key, header + RECIPIENT.pack(node_id) + wrapped)
+        frame = header + wrapped + signature
+        with self.lock:
+            self.exchange_frames[node_id] = frame
+        return frame
+
+    def seal(self, message) -> bytes:
+        """
+        Seal a message with the local send key.
+        :param message: plain message (bytes or str).
+        :return: frame bytes (header + nonce + ciphertext + tag).
+        """
+        return self.header + self.send_context.seal(message, self.header)
+
+    def open(self, frame):
+        """
+        Process a received frame.
+        Key exchange frames install the sender's session key once their signature is
+        checked; sealed frames are authenticated and decrypted with the cached key of
+        their sender.
+        :param frame: received frame bytes.
+        :return: (sender node id, plain message bytes) for sealed frames, None for key exchanges.
+        """
+        frame = memoryview(frame)
+        if len(frame) < FRAME_HEADER.size:
+            raise encryption.AuthenticationError("frame too short")
+        frame_type, sender, key_id = FRAME_HEADER.unpack_from(frame)
+        if frame_type == SEALED:
+            context = self.inbound.get((sender, key_id))
+            if context is None:
+                raise encryption.AuthenticationError(f"no session with node {sender}")
+            header = frame[:FRAME_HEADER.size].tobytes()
+            message = context.open(frame[FRAME_HEADER.size:], header)
+            if self.current.get(sender) != key_id:
+                self._retire(sender, key_id)
+            return sender, message
+        if frame_type == KEY_EXCHANGE:
+            self._install(sender, key_id, frame[:FRAME_HEADER.size].tobytes(), frame[FRAME_HEADER.size:])
+            return None
+        raise encryption.AuthenticationError(f"unknown frame type {frame_type}")
+
+    def _install(self, sender: int, key_id: int, header: bytes, body):
+        """
+        Check, unwrap and cache the session key of a peer.
+        :param sender: id of the peer.
+        :param key_id: id of the peer's session key.
+        :param header: frame header.
+        :param body: RSA-OAEP wrapped key followed by the sender's signature.
+        """
+        public_key = self.peer_keys.get(sender)
+        if public_key is None:
+            raise encryption.AuthenticationError(f"key exchange from unknown node {sender}")
+        if (sender, key_id) in self.inbound:
+            return
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_unwrap.get(sender, -UNWRAP_INTERVAL) < UNWRAP_INTERVAL:
+                raise encryption.AuthenticationError(f"key exchange from node {sender} rate limited")
+            self.last_unwrap[sender] = now
+            if len(self.last_unwrap) > MAX_UNWRAP_SENDERS:
+                self.last_unwrap = {node: at for node, at in self.last_unwrap.items()
+                                    if now - at < UNWRAP_INTERVAL}
+        private_key = self.key_store.private_key
+        wrapped_size = private_key.key_size // 8
+        wrapped_key = bytes(body[:wrapped_size])
+        signature = bytes(body[wrapped_size:])
+        if not security.verify(public_key, signature, header + RECIPIENT.pack(self.node_id) + wrapped_key):
+            raise encryption.AuthenticationError(f"bad key exchange signature from node {sender}")
+        with self.lock:
+            if self.unwrap_budget.reserve(now) > 0:
+                raise encryption.AuthenticationError(f"key exchange from node {sender} rate limited")
+        try:
+            key = security.unwrap_key(private_key, wrapped_key)
+        except ValueError:
+            raise encryption.AuthenticationError(f"bad key exchange from node {sender}")
+        with self.lock:
+            self.inbound[(sender, key_id)] = encryption.AEADContext(key)
+        logger.info(f"session key installed for node {sender}")
+
+    def _retire(self, sender: int, key_id: int):
+        """
+        Drop the other keys of a peer once a frame authenticated with one of its keys;
+        a peer only uses its latest key.
+        :param sender: id of the peer.
+        :param key_id: id of the key the frame used.
+        """
+        with self.lock:
+            self.current[sender] = key_id
+            for stale in [k for k in self.inbound if k[0] == sender and k[1] != key_id]:
+                self.inbound.pop(stale)
+
+    def forget(self, node_id: int):
+        """
+        Drop every session state of a peer.
+        :param node_id: id of the peer.
+        """
+        self.peer_keys.remove(node_id)
+        with self.lock:
+            self.exchange_frames.pop(node_id, None)
+            self.current.pop(node_id, None)
+            self.last_unwrap.pop(node_id, None)
+            for stale in [k for k in self.inbound if k[0] == node_id]:
+                self.inbound.pop(stale)
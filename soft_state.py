@@ -0,0 +1,79 @@
+import heapq
+import itertools
+import threading
+
+
+class ExpiryHeap:
+    """
+    Deadlines of soft-state entries (peers, routes) kept in a min-heap.
+
+    Refreshing an entry pushes its new deadline and leaves the old heap item in place;
+    stale items are skipped when they reach the top, so both touch and expiry are
+    O(log n) and nothing is ever searched or re-heapified.
+    """
+
+    def __init__(self):
+        """
+        Initializer for the expiry heap.
+        """
+        self.deadlines = {}
+        self.heap = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def touch(self, key, deadline: float):
+        """
+        Set or refresh the deadline of an entry.
+        :param key: entry key.
+        :param deadline: monotonic time after which the entry expires.
+        """
+        with self.lock:
+            self.deadlines[key] = deadline
+            heapq.heappush(self.heap, (deadline, next(self.counter), key))
+
+    def discard(self, key):
+        """
+        Stop tracking an entry.
+        :param key: entry key.
+        """
+        with self.lock:
+            self.deadlines.pop(key, None)
+
+    def expired(self, now: float) -> list:
+        """
+        Pop every entry whose deadline has passed.
+        :param now: current monotonic time.
+        :return: list of expired keys.
+        """
+        expired = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                deadline, _, key = heapq.heappop(self.heap)
+                if self.deadlines.get(key) == deadline:
+                    del self.deadlines[key]
+                    expired.append(key)
+        return expired
+
+    def next_deadline(self):
+        """
+        Earliest deadline of the tracked entries.
+        :return: monotonic time or None if no entry is tracked.
+        """
+        with self.lock:
+            while self.heap and self.deadlines.get(self.heap[0][2]) != self.heap[0][0]:
+                heapq.heappop(self.heap)
+            return self.heap[0][0] if self.heap else None
+
+    def deadline(self, key):
+        """
+        Current deadline of an entry.
+        :param key: entry key.
+        :return: monotonic time or None if the entry is not tracked.
+        """
+        return self.deadlines.get(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self.deadlines
+
+    def __len__(self) -> int:
+        return len(self.deadlines)
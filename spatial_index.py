@@ -0,0 +1,196 @@
+import math
+import threading
+
+import geopy.distance
+
+EARTH_RADIUS = 6371008.8
+METRES_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+# The equirectangular approximation on a sphere is within a fraction of a percent of the
+# geodesic distance at neighbourhood scale; closer to the threshold than this, the exact
+# geodesic decides.
+APPROXIMATION_MARGIN = 0.01
+MIN_COS_LATITUDE = 0.01
+
+
+def fast_distance(origin: tuple, target: tuple) -> float:
+    """
+    Equirectangular distance between two coordinates, accurate for short ranges.
+    :param origin: (latitude, longitude) in degrees.
+    :param target: (latitude, longitude) in degrees.
+    :return: distance in metres.
+    """
+    lat1, lon1 = origin
+    lat2, lon2 = target
+    dlon = (lon2 - lon1 + 180) % 360 - 180
+    x = dlon * math.cos(math.radians((lat1 + lat2) / 2))
+    y = lat2 - lat1
+    return METRES_PER_DEGREE * math.hypot(x, y)
+
+
+def within_radius(origin: tuple, target: tuple, radius: float):
+    """
+    Check if a coordinate lies within a radius of another.
+    The cheap approximation decides unless the point is close to the boundary, in
+    which case the geodesic distance is computed.
+    :param origin: (latitude, longitude) in degrees.
+    :param target: (latitude, longitude) in degrees.
+    :param radius: radius in metres.
+    :return: distance in metres if within the radius, None otherwise.
+    """
+    distance = fast_distance(origin, target)
+    margin = max(1.0, radius * APPROXIMATION_MARGIN)
+    if distance < radius - margin:
+        return distance
+    if distance > radius + margin:
+        return None
+    distance = geopy.distance.geodesic(origin, target).meters
+    return distance if distance < radius else None
+
+
+class GridIndex:
+    """
+    Bucket index of node locations on a grid of roughly square cells.
+
+    Rows are cell_size metres of latitude; within a row the longitude step is
+    widened by 1 / cos(latitude) so cells stay about cell_size metres wide. A range
+    query only visits the cells overlapping the query circle and filters their nodes
+    with within_radius.
+    """
+
+    def __init__(self, cell_size: float = 50.0):
+        """
+        Initializer for the grid index.
+        :param cell_size: edge of a cell in metres, about the usual query radius.
+        """
+        self.cell_size = cell_size
+        self.lat_step = cell_size / METRES_PER_DEGREE
+        self.cells = {}
+        self.locations = {}
+        # bumped on every change, so a copy is only published when it is stale
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def _lon_step(self, row: int) -> float:
+        """
+        Longitude step of a grid row.
+        :param row: row index.
+        :return: step in degrees.
+        """
+        # use the latitude of the row edge closest to the pole so cells never shrink below cell_size
+        edge = max(abs(row * self.lat_step), abs((row + 1) * self.lat_step))
+        return self.lat_step / max(MIN_COS_LATITUDE, math.cos(math.radians(min(edge, 90.0))))
+
+    def _cell(self, location: tuple) -> tuple:
+        """
+        Cell of a coordinate.
+        :param location: (latitude, longitude) in degrees.
+        :return: (row, column)
+        """
+        row = math.floor(location[0] / self.lat_step)
+        return row, math.floor(location[1] / self._lon_step(row))
+
+    def update(self, node, location: tuple):
+        """
+        Insert a node or move it to a new location.
+        :param node: node id.
+        :param location: (latitude, longitude) in degrees.
+        """
+        location = (float(location[0]), float(location[1]))
+        cell = self._cell(location)
+        with self.lock:
+            previous = self.locations.get(node)
+            if previous == location:
+                return
+            self.version += 1
+            if previous is not None:
+                old_cell = self._cell(previous)
+                if old_cell != cell:
+                    self._discard(node, old_cell)
+            self.locations[node] = location
+            self.cells.setdefault(cell, set()).add(node)
+
+    def _discard(self, node, cell: tuple):
+        """
+        Remove a node from a cell. Caller holds the lock.
+        :param node: node id.
+        :param cell: (row, column)
+        """
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.discard(node)
+            if not bucket:
+                del self.cells[cell]
+
+    def remove(self, node):
+        """
+        Remove a node from the index.
+        :param node: node id.
+        """
+        with self.lock:
+            location = self.locations.pop(node, None)
+            if location is not None:
+                self.version += 1
+                self._discard(node, self._cell(location))
+
+    def snapshot(self) -> tuple:
+        """
+        Copy of the node locations, e.g. to publish them to another process.
+        :return: (version, {node: (latitude, longitude)})
+        """
+        with self.lock:
+            return self.version, dict(self.locations)
+
+    def install(self, version: int, locations: dict):
+        """
+        Replace every location with a published copy.
+        :param version: version of the copy.
+        :param locations: node -> (latitude, longitude).
+        """
+        cells = {}
+        for node, location in locations.items():
+            cells.setdefault(self._cell(location), set()).add(node)
+        with self.lock:
+            self.version = version
+            self.locations = dict(locations)
+            self.cells = cells
+
+    def location(self, node):
+        """
+        Last known location of a node.
+        :param node: node id.
+        :return: (latitude, longitude) or None.
+        """
+        return self.locations.get(node)
+
+    def within(self, origin: tuple, radius: float) -> list:
+        """
+        Range query: every node within radius metres of a point.
+        :param origin: (latitude, longitude) in degrees.
+        :param radius: radius in metres.
+        :return: list of (distance, node) sorted by distance.
+        """
+        lat_span = radius / METRES_PER_DEGREE
+        first_row = math.floor((origin[0] - lat_span) / self.lat_step)
+        last_row = math.floor((origin[0] + lat_span) / self.lat_step)
+        candidates = []
+        with self.lock:
+            for row in range(first_row, last_row + 1):
+                lon_step = self._lon_step(row)
+                edge = max(abs(row * self.lat_step), abs((row + 1) * self.lat_step))
+                lon_span = lat_span / max(MIN_COS_LATITUDE, math.cos(math.radians(min(edge, 90.0))))
+                first_column = math.floor((origin[1] - lon_span) / lon_step)
+                last_column = math.floor((origin[1] + lon_span) / lon_step)
+                for column in range(first_column, last_column + 1):
+                    bucket = self.cells.get((row, column))
+                    if bucket:
+                        candidates.extend((node, self.locations[node]) for node in bucket)
+        found = []
+        for node, location in candidates:
+            distance = within_radius(origin, location, radius)
+            if distance is not None:
+                found.append((distance, node))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def __len__(self):
+        return len(self.locations)
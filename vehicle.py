@@ -1,5 +1,7 @@
 import control as ctrl
+import sensor_trace
 import argparse
+import random
 import socket
 import threading
 import time
@@ -9,8 +11,11 @@ app = Flask(__name__)
 
 
 @app.route('/vehicle/sensor_controls/speed/<string:value>')
-def speedControl(value):
-    vehicle = Vehicle.getInstance()
+@app.route('/vehicle/<int:vehicle_id>/sensor_controls/speed/<string:value>')
+def speedControl(value, vehicle_id=None):
+    vehicle = Vehicle.getInstance(vehicle_id)
+    if vehicle is None:
+        return "Unknown vehicle", 404
     if value == "D":
         vehicle.sensorMaster.setSpeedSensor("DECREASE")
     elif value == "I":
@@ -21,33 +26,68 @@ def speedControl(value):
 
 
 @app.route('/vehicle/sensor_controls/brake/<string:value>')
-def brakeControl(value):
-    vehicle = Vehicle.getInstance()
+@app.route('/vehicle/<int:vehicle_id>/sensor_controls/brake/<string:value>')
+def brakeControl(value, vehicle_id=None):
+    vehicle = Vehicle.getInstance(vehicle_id)
+    if vehicle is None:
+        return "Unknown vehicle", 404
     vehicle.sensorMaster.applyBrake(value)
     return "Signal generated"
 
 
 class Vehicle(ctrl.VehicleControls):
     __instance = None
+    # every vehicle of the process, by id (several when run by fleet.py)
+    instances = {}
 
     @staticmethod
-    def getInstance():
-        return Vehicle.__instance
-
-    def __init__(self, vehicle_id, host_address, listening_port, sending_port, latitude, longitude):
-        super().__init__(vehicle_id, host_address, listening_port, sending_port, latitude, longitude)
-        Vehicle.__instance = self
-
-    def deploy(self):
-        return super().deploy()
+    def getInstance(vehicle_id=None):
+        if vehicle_id is None:
+            return Vehicle.__instance
+        return Vehicle.instances.get(vehicle_id)
+
+    def __init__(self, vehicle_id, host_address, listening_port, sending_port, latitude, longitude,
+                 sensor_periods=None):
+        super().__init__(vehicle_id, host_address, listening_port, sending_port, latitude, longitude,
+                         sensor_periods)
+        if Vehicle.__instance is None:
+            Vehicle.__instance = self
+        Vehicle.instances[vehicle_id] = self
+
+    def deploy(self, runtime=None, simulate=True):
+        return super().deploy(runtime, simulate)
+
+
+def sensor_period(value):
+    """
+    Parses a --sensor_period argument.
+
+    Args:
+        value (str): SENSOR_ID=SECONDS, e.g. PRX=0.05
+
+    Returns:
+        [Tuple]: (sensor id, seconds)
+    """
+    sensor_id, _, seconds = value.partition('=')
+    if sensor_id not in ctrl.VehicleControls.HANDLERS:
+        raise argparse.ArgumentTypeError(f"unknown sensor {sensor_id}")
+    try:
+        period = float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid period {seconds!r}")
+    if period <= 0:
+        raise argparse.ArgumentTypeError(f"period of {sensor_id} must be positive")
+    return sensor_id, period
 
 
 class Infra(ctrl.InfraControls):
-    def __init__(self, vehicle_id, host_address, listening_port, sending_port, latitude, longitude):
-        super().__init__(vehicle_id, host_address, listening_port, sending_port, latitude, longitude)
+    def __init__(self, vehicle_id, host_address, listening_port, sending_port, latitude, longitude,
+                 rules_path=None, pois_path=None):
+        super().__init__(vehicle_id, host_address, listening_port, sending_port, latitude, longitude,
+                         rules_path, pois_path)
 
-    def deploy(self):
-        return super().deploy()
+    def deploy(self, workers=0):
+        return super().deploy(workers)
 
 
 def main():
@@ -59,24 +99,52 @@ def main():
     my_parser.add_argument('--vehicle_id', help='vehicle_id', required=True)
     my_parser.add_argument('--node_type', help='node_type', required=False)
     my_parser.add_argument('--api_port', help='api_port', required=False)
+    my_parser.add_argument('--workers', help='worker processes receiving for an infra node', type=int, default=0)
+    my_parser.add_argument('--rules', help='JSON alert rule file of an infra node, reloaded when it changes',
+                           required=False)
+    my_parser.add_argument('--pois', help='hospitals and gas stations of an infra node: a kind,name,latitude,'
+                                          'longitude CSV file (indexed once into FILE.idx) or a prebuilt index',
+                           required=False)
+    my_parser.add_argument('--seed', help='seed of the simulated sensors', type=int, required=False)
+    my_parser.add_argument('--record', help='append every sensor reading to this trace file', required=False)
+    my_parser.add_argument('--replay', help='replay the sensor readings of this trace file', required=False)
+    my_parser.add_argument('--replay_speed', help='replay speed: 1 real time, N N times faster, 0 max speed',
+                           type=float, default=1.0)
+    my_parser.add_argument('--sensor_period', help='sampling period of a sensor as SENSOR_ID=SECONDS, e.g. '
+                                                   'PRX=0.05 or FLG=10; may be repeated', type=sensor_period,
+                           action='append', default=[])
 
     args = my_parser.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
     hostname = socket.gethostname()
     host = socket.gethostbyname(hostname)
     is_infra = False
+    trace = None
     latitude = float(args.latitude)
     longitude = float(args.longitude)
     if args.node_type is not None:
         is_infra = args.node_type == 'I' or args.node_type == "i"
     if not is_infra:
         print("Vehicle-", args.vehicle_id)
-        get_vehicle = Vehicle(int(args.vehicle_id), host, int(args.listen_port), int(args.sending_port), latitude, longitude)
-        get_vehicle.deploy()
+        get_vehicle = Vehicle(int(args.vehicle_id), host, int(args.listen_port), int(args.sending_port), latitude, longitude,
+                              dict(args.sensor_period))
+        if args.record:
+            trace = get_vehicle.trace = sensor_trace.TraceWriter(args.record)
+        get_vehicle.deploy(simulate=args.replay is None)
+        if args.replay:
+            threading.Thread(target=get_vehicle.runVehicle,
+                             args=(sensor_trace.TraceReader(args.replay), args.replay_speed), daemon=True).start()
     else:
         print("isInfra-", args.vehicle_id)
-        get_infra = Infra(int(args.vehicle_id), host, int(args.listen_port), int(args.sending_port), latitude, longitude)
-        get_infra.deploy()
-    app.run(host='localhost', port=int(args.api_port))
+        get_infra = Infra(int(args.vehicle_id), host, int(args.listen_port), int(args.sending_port), latitude, longitude,
+                          args.rules, args.pois)
+        get_infra.deploy(args.workers)
+    try:
+        app.run(host='localhost', port=int(args.api_port))
+    finally:
+        if trace is not None:
+            trace.close()
 
 
 if __name__ == '__main__':
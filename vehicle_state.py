@@ -0,0 +1,123 @@
+import collections
+import threading
+import time
+
+# Vehicles kept by an infra node; the least recently heard from is evicted first.
+MAX_VEHICLES = 10000
+# Recent readings kept per vehicle and sensor.
+READINGS_PER_SENSOR = 64
+# Seconds without a message after which a vehicle is considered gone.
+VEHICLE_TIMEOUT = 300
+# A reading equal to the previous one of the same sensor within this many seconds
+# is the same alert delivered twice (e.g. over two relays).
+DEDUP_WINDOW = 0.2
+
+
+class VehicleState:
+    """
+    What an infra node remembers of one vehicle.
+    """
+    __slots__ = ('readings', 'actions', 'last_seen')
+
+    def __init__(self):
+        # ring buffer of (time, value) by sensor id
+        self.readings = {}
+        # time of the last action by key
+        self.actions = {}
+        self.last_seen = 0.0
+
+
+class VehicleStateStore:
+    """
+    Recent readings and last actions of the vehicles an infra node hears from.
+
+    Vehicles are kept in least recently used order: one that has not been heard
+    from for VEHICLE_TIMEOUT, or the oldest one when the store is full, is
+    dropped, so memory stays bounded however many vehicles pass by.
+    """
+
+    def __init__(self, max_vehicles=MAX_VEHICLES, readings_per_sensor=READINGS_PER_SENSOR,
+                 timeout=VEHICLE_TIMEOUT, dedup_window=DEDUP_WINDOW):
+        """
+        Constructor for an empty store.
+
+        Args:
+            max_vehicles (int): vehicles kept at most.
+            readings_per_sensor (int): length of the ring buffer of each sensor.
+            timeout (float): seconds of silence after which a vehicle is dropped.
+            dedup_window (float): seconds within which an equal reading is a duplicate.
+        """
+        self.max_vehicles = max_vehicles
+        self.readings_per_sensor = readings_per_sensor
+        self.timeout = timeout
+        self.dedup_window = dedup_window
+        self.vehicles = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def observe(self, vehicle_id, sensor_id, value, now=None):
+        """
+        Records a reading of a vehicle.
+
+        Args:
+            vehicle_id (str): id of the vehicle.
+            sensor_id (str): id of the sensor.
+            value: reading.
+            now (float): monotonic time of the reading, time.monotonic() if None.
+
+        Returns:
+            [deque]: (time, value) of the recent readings of the sensor, or None if
+            the reading duplicates the previous one.
+        """
+        now = now if now is not None else time.monotonic()
+        with self.lock:
+            state = self.vehicles.get(vehicle_id)
+            if state is None:
+                state = self.vehicles[vehicle_id] = VehicleState()
+            else:
+                self.vehicles.move_to_end(vehicle_id)
+            state.last_seen = now
+            self._evict(now)
+            readings = state.readings.get(sensor_id)
+            if readings is None:
+                readings = state.readings[sensor_id] = collections.deque(maxlen=self.readings_per_sensor)
+            elif readings and readings[-1][1] == value and now - readings[-1][0] < self.dedup_window:
+                return None
+            readings.append((now, value))
+            return readings
+
+    def act(self, vehicle_id, key, window, now=None):
+        """
+        Claims an action for a vehicle unless it was already taken within the window.
+
+        Args:
+            vehicle_id (str): id of the vehicle.
+            key (str): action key, e.g. the rule name.
+            window (float): suppression window in seconds.
+            now (float): current monotonic time, time.monotonic() if None.
+
+        Returns:
+            [bool]: True if the action should be taken now.
+        """
+        now = now if now is not None else time.monotonic()
+        with self.lock:
+            state = self.vehicles.get(vehicle_id)
+            if state is None:
+                return True
+            last = state.actions.get(key)
+            if last is not None and now - last < window:
+                return False
+            state.actions[key] = now
+            return True
+
+    def _evict(self, now):
+        while self.vehicles:
+            vehicle_id, oldest = next(iter(self.vehicles.items()))
+            if len(self.vehicles) <= self.max_vehicles and now - oldest.last_seen < self.timeout:
+                return
+            del self.vehicles[vehicle_id]
+
+    def __contains__(self, vehicle_id):
+        return vehicle_id in self.vehicles
+
+    def __len__(self):
+        return len(self.vehicles)
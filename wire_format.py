@@ -0,0 +1,227 @@
+import json
+import struct
+
+# Binary encoding of the known sensor alerts.
+#
+# A record is a fixed header followed by the sensor specific readings, all in
+# network byte order:
+#     version (B) | sensor code (B) | flags (B) | node id (i) | readings...
+# Anything that does not fit a known layout exactly (other sensors, infra replies,
+# unexpected fields) is sent as JSON instead, so both encodings can be mixed freely.
+# JSON payloads always start with '{', which is never a valid version byte.
+#
+# Several alerts produced in the same tick travel as one batch, {"batch": [...]}.
+# In binary it is a batch tag and record count followed by length-prefixed
+# records, each of them binary or JSON:
+#     batch tag (B) | count (H) | (length (H) | record)...
+WIRE_VERSION = 1
+BATCH_TAG = 0xB1
+FORMAT_BINARY = 'bin1'
+FORMAT_JSON = 'json'
+SUPPORTED_FORMATS = [FORMAT_BINARY, FORMAT_JSON]
+
+HEADER = struct.Struct('!BBBi')
+BATCH_HEADER = struct.Struct('!BH')
+RECORD_LENGTH = struct.Struct('!H')
+# flags
+FROM_INFRA = 0x01
+
+LIGHT_LEVELS = ['LOW', 'HIGH']
+WEATHER = ['rainy', 'sunny', 'windy', 'overcast']
+
+
+class RecordType:
+    """
+    Fixed layout of one sensor alert.
+    """
+    __slots__ = ('sensor_id', 'code', 'layout', 'alert', 'fields', 'pack', 'unpack')
+
+    def __init__(self, sensor_id: str, code: int, layout: str, alert: str, fields: tuple, pack, unpack):
+        """
+        Initializer for the record type.
+        :param sensor_id: sensor id used in the alert ("senorId").
+        :param code: one byte code of the sensor on the wire.
+        :param layout: struct format of the readings.
+        :param alert: alert text implied by the record.
+        :param fields: alert keys carried by the readings besides senorReading.
+        :param pack: callable(message) returning the tuple of readings.
+        :param unpack: callable(values) returning the alert fields.
+        """
+        self.sensor_id = sensor_id
+        self.code = code
+        self.layout = struct.Struct('!' + layout)
+        self.alert = alert
+        self.fields = fields
+        self.pack = pack
+        self.unpack = unpack
+
+
+def _scalar(message):
+    return (message['senorReading'],)
+
+
+def _scalar_reading(values):
+    return {'senorReading': values[0]}
+
+
+def _flag_reading(values):
+    return {'senorReading': bool(values[0])}
+
+
+RECORD_TYPES = [
+    RecordType('SPD', 1, 'h', "Over speeding alert", (), _scalar, _scalar_reading),
+    RecordType('TP', 2, 'h', "Low or high tyre pressure alert", (), _scalar, _scalar_reading),
+    RecordType('LT', 3, 'B', "Low lights alert", (),
+               lambda m: (LIGHT_LEVELS.index(m['senorReading']),),
+               lambda v: {'senorReading': LIGHT_LEVELS[v[0]]}),
+    RecordType('PRX', 4, '?', "Proximity alert", (), _scalar, _flag_reading),
+    RecordType('GPS', 5, 'dd', "GPS co-ordinates", (),
+               lambda m: tuple(m['senorReading']),
+               lambda v: {'senorReading': [v[0], v[1]]}),
+    RecordType('HRS', 6, 'hdd', "Low or high heart rate", ('location',),
+               lambda m: (m['senorReading'],) + tuple(m['location']),
+               lambda v: {'senorReading': v[0], 'location': [v[1], v[2]]}),
+    RecordType('BRK', 7, '?', "Brake applied", (), _scalar, _flag_reading),
+    RecordType('FLG', 8, 'h', "Low fuel", (), _scalar, _scalar_reading),
+    RecordType('WTR', 9, 'B', "Weather alert", (),
+               lambda m: (WEATHER.index(m['senorReading']),),
+               lambda v: {'senorReading': WEATHER[v[0]]}),
+]
+BY_SENSOR = {record.sensor_id: record for record in RECORD_TYPES}
+BY_CODE = {record.code: record for record in RECORD_TYPES}
+
+
+def _node_field(message):
+    """
+    Return the origin key of an alert and whether it comes from an infra node.
+    :param message: alert dict.
+    :return: (key, from_infra) or None if the origin cannot be encoded.
+    """
+    if 'vehicleId' in message:
+        return 'vehicleId', False
+    if 'infraNodeId' in message:
+        return 'infraNodeId', True
+    return None
+
+
+def encode_binary(message: dict):
+    """
+    Encode an alert as a fixed layout binary record.
+    :param message: alert dict.
+    :return: record bytes, or None if the message has no exact binary representation.
+    """
+    record = BY_SENSOR.get(message.get('senorId'))
+    origin = _node_field(message)
+    if record is None or origin is None or message.get('alert') != record.alert:
+        return None
+    node_key, from_infra = origin
+    if len(message) != 4 + len(record.fields) or any(field not in message for field in record.fields):
+        return None
+    node = message[node_key]
+    try:
+        node_id = int(node)
+        if str(node_id) != node:
+            return None
+        readings = record.layout.pack(*record.pack(message))
+        header = HEADER.pack(WIRE_VERSION, record.code, FROM_INFRA if from_infra else 0, node_id)
+    except (KeyError, TypeError, ValueError, struct.error):
+        return None
+    # '?' packs any truthy value, make sure the readings survive the round trip unchanged
+    expected = {key: list(message[key]) if isinstance(message[key], tuple) else message[key]
+                for key in ('senorReading',) + record.fields}
+    if record.unpack(record.layout.unpack(readings)) != expected:
+        return None
+    return header + readings
+
+
+def decode_binary(payload) -> dict:
+    """
+    Decode a binary record into the alert dict it was built from.
+    :param payload: record bytes.
+    :return: alert dict.
+    """
+    version, code, flags, node_id = HEADER.unpack_from(payload)
+    if version != WIRE_VERSION:
+        raise ValueError(f"unsupported wire version {version}")
+    record = BY_CODE[code]
+    message = {'infraNodeId' if flags & FROM_INFRA else 'vehicleId': str(node_id),
+               'alert': record.alert, 'senorId': record.sensor_id}
+    message.update(record.unpack(record.layout.unpack_from(payload, HEADER.size)))
+    return message
+
+
+def encode_batch(records: list, wire_format: str = FORMAT_JSON) -> bytes:
+    """
+    Encode several alerts as one batch payload.
+    :param records: list of alert dicts.
+    :param wire_format: FORMAT_BINARY or FORMAT_JSON.
+    :return: payload bytes.
+    """
+    if wire_format != FORMAT_BINARY:
+        return json.dumps({'batch': records}).encode('utf-8')
+    parts = [BATCH_HEADER.pack(BATCH_TAG, len(records))]
+    for record in records:
+        payload = encode(record, wire_format)
+        parts.append(RECORD_LENGTH.pack(len(payload)))
+        parts.append(payload)
+    return b''.join(parts)
+
+
+def decode_batch(payload) -> dict:
+    """
+    Decode a binary batch payload.
+    :param payload: payload bytes.
+    :return: {"batch": [alert dicts]}
+    """
+    payload = memoryview(payload)
+    _, count = BATCH_HEADER.unpack_from(payload)
+    offset = BATCH_HEADER.size
+    records = []
+    for _ in range(count):
+        (length,) = RECORD_LENGTH.unpack_from(payload, offset)
+        offset += RECORD_LENGTH.size
+        records.append(decode(payload[offset:offset + length]))
+        offset += length
+    return {'batch': records}
+
+
+def encode(message: dict, wire_format: str = FORMAT_JSON) -> bytes:
+    """
+    Encode a message in the requested format, falling back to JSON.
+    :param message: message dict.
+    :param wire_format: FORMAT_BINARY or FORMAT_JSON.
+    :return: payload bytes.
+    """
+    if wire_format == FORMAT_BINARY:
+        if len(message) == 1 and 'batch' in message:
+            return encode_batch(message['batch'], wire_format)
+        payload = encode_binary(message)
+        if payload is not None:
+            return payload
+    return json.dumps(message).encode('utf-8')
+
+
+def decode(payload) -> dict:
+    """
+    Decode a payload produced by encode, whatever its format.
+    :param payload: payload bytes.
+    :return: message dict.
+    """
+    if payload[0] == WIRE_VERSION:
+        return decode_binary(payload)
+    if payload[0] == BATCH_TAG:
+        return decode_batch(payload)
+    return json.loads(bytes(payload).decode('utf-8'))
+
+
+def negotiate(peer_formats) -> str:
+    """
+    Pick the format to use towards a peer from the formats it announced.
+    :param peer_formats: formats announced by the peer, None for peers that announced nothing.
+    :return: FORMAT_BINARY or FORMAT_JSON.
+    """
+    if peer_formats:
+        for wire_format in SUPPORTED_FORMATS:
+            if wire_format in peer_formats:
+                return wire_format
+    return FORMAT_JSON
@@ -0,0 +1,257 @@
+import logging
+import multiprocessing
+import socket
+import threading
+import time
+import zlib
+
+from frame_server import FrameServer
+
+logger = logging.getLogger('v2vnode')
+
+# Seconds between two checks for a new routing state to publish to the workers.
+PUBLISH_INTERVAL = 0.5
+
+
+class OwnerLink:
+    """
+    Worker end of the pipe to the owner process. Shared by the frame handler threads.
+    """
+
+    def __init__(self, conn):
+        """
+        Initializer for the link.
+        :param conn: multiprocessing connection to the owner.
+        """
+        self.conn = conn
+        self.lock = threading.Lock()
+
+    def send(self, *message):
+        """
+        Hand a request over to the owner process.
+        :param message: request tuple, ('send', data), ('send_to', node_id, data, flood),
+            ('geocast', data, radius, origin), ('forward', routed frame), ('relay', payload)
+            or ('handle', worker index, record).
+        """
+        with self.lock:
+            self.conn.send(message)
+
+
+def _listener(host: str, port: int, backlog: int = 128) -> socket.socket:
+    """
+    Listening socket sharing its port with the other workers; the kernel spreads
+    the incoming connections across them.
+    :param host: ip address to listen on.
+    :param port: port number to listen on.
+    :param backlog: listen backlog.
+    :return: bound, listening socket.
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server.bind((host, port))
+    server.listen(backlog)
+    return server
+
+
+def worker_for(record: dict, workers: int) -> int:
+    """
+    Worker handling the records of a node: always the same one, so the per-vehicle
+    state of the handler (rule windows, suppression, duplicates) lives in one process.
+    :param record: received reading.
+    :param workers: number of worker processes.
+    :return: worker index, or None for a record naming no node.
+    """
+    node = record.get('vehicleId', record.get('infraNodeId'))
+    if node is None:
+        return None
+    return zlib.crc32(str(node).encode('utf-8')) % workers
+
+
+def run_worker(system, handler, conn, index: int, workers: int):
+    """
+    Entry point of a worker process: decrypt the frames of the connections the kernel
+    assigns to this worker's listener, and handle the records of the nodes assigned
+    to this worker; the others are handed to their worker through the owner.
+    :param system: BroadcastSystem forked from the owner.
+    :param handler: handler function to process the received readings.
+    :param conn: multiprocessing connection to the owner.
+    :param index: index of this worker.
+    :param workers: number of worker processes.
+    """
+    system.owner_link = OwnerLink(conn)
+
+    def dispatch(record):
+        target = worker_for(record, workers)
+        if target is None or target == index:
+            handler(record)
+        else:
+            system.owner_link.send('handle', target, record)
+
+    server = FrameServer(system.host, system.port,
+                         lambda recv_data, addr: system.process_message(recv_data, addr, dispatch),
+                         server_socket=_listener(system.host, system.port))
+    threading.Thread(target=_receive_state, args=(system, handler, conn, server), daemon=True).start()
+    server.serve_forever()
+
+
+def _receive_state(system, handler, conn, server):
+    """
+    Install every routing state published by the owner and handle the records other
+    workers received for the nodes of this worker.
+    :param system: worker BroadcastSystem.
+    :param handler: handler function to process the received readings.
+    :param conn: multiprocessing connection to the owner.
+    :param server: FrameServer of the worker, stopped when the owner exits.
+    """
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            logger.info("owner process exited")
+            server.stop()
+            return
+        if message[0] == 'handle':
+            try:
+                handler(message[1])
+            except Exception as e:
+                logger.debug(f"error handling record {e}")
+            continue
+        _, version, routes, peers, public_keys, neighbourhood = message
+        system.routes.install(version, routes)
+        system.peers.install(peers)
+        for node_id, pem in public_keys.items():
+            system.session_keys.add_peer_key(node_id, pem)
+        if neighbourhood is not None:
+            system.neighbourhood.install(*neighbourhood)
+
+
+class WorkerPool:
+    """
+    Shards inbound traffic of a node across worker processes.
+
+    Each worker owns an SO_REUSEPORT listener on the node's port, so decryption,
+    parsing and the handler run on every core instead of under one GIL. The owner
+    process keeps discovery, routing and all outbound traffic: it publishes its
+    routing state and the node locations to the workers over their pipes whenever
+    they change, and the workers hand the messages they send or relay back to it.
+    Every vehicle's records are handled by one worker (worker_for), whichever worker
+    received them.
+    """
+
+    def __init__(self, system, handler, workers: int):
+        """
+        Initializer for the worker pool.
+        :param system: owner BroadcastSystem.
+        :param handler: handler function to process the received readings.
+        :param workers: number of worker processes.
+        """
+        self.system = system
+        self.handler = handler
+        self.workers = workers
+        # worker index -> connection, the workers still running
+        self.conns = {}
+        self.processes = []
+        self.lock = threading.Lock()
+        # held while writing to a worker's pipe, which several threads share
+        self.send_lock = threading.Lock()
+
+    def start(self):
+        """
+        Fork the workers, then start the owner side threads.
+        Must be called before the node starts any other thread.
+        """
+        # load the identity once so the workers inherit it instead of reading it again
+        self.system.session_keys.key_store.private_key
+        context = multiprocessing.get_context('fork')
+        for index in range(self.workers):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=run_worker,
+                                      args=(self.system, self.handler, child_conn, index, self.workers),
+                                      name=f'v2v-worker-{index}', daemon=True)
+            process.start()
+            child_conn.close()
+            self.conns[index] = parent_conn
+            self.processes.append(process)
+        logger.info(f"started {self.workers} workers on port {self.system.port}")
+        for index, conn in self.conns.items():
+            threading.Thread(target=self._serve_worker, args=(index, conn), daemon=True).start()
+        threading.Thread(target=self._publish, daemon=True).start()
+
+    def _serve_worker(self, index: int, conn):
+        """
+        Carry out the sends and relays requested by one worker.
+        :param index: index of the worker.
+        :param conn: multiprocessing connection to the worker.
+        """
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                logger.warning("worker process exited")
+                with self.lock:
+                    self.conns.pop(index, None)
+                return
+            try:
+                if request[0] == 'send':
+                    self.system.send_information(request[1])
+                elif request[0] == 'send_to':
+                    self.system.send_to(request[1], request[2], request[3])
+                elif request[0] == 'geocast':
+                    self.system.geocast(request[1], request[2], request[3])
+                elif request[0] == 'forward':
+                    self.system.forward(request[1])
+                elif request[0] == 'relay':
+                    self.system.relay(request[1])
+                elif request[0] == 'handle':
+                    self._handle(request[1], request[2])
+            except Exception as e:
+                logger.debug(f"worker request failed {e}")
+
+    def _handle(self, index: int, record: dict):
+        """
+        Hand a record to the worker its node is assigned to, or handle it here if that
+        worker exited.
+        :param index: index of the worker.
+        :param record: received reading.
+        """
+        with self.lock:
+            conn = self.conns.get(index)
+        if conn is not None:
+            try:
+                with self.send_lock:
+                    conn.send(('handle', record))
+                return
+            except OSError as e:
+                logger.debug(f"handing record to worker {index} failed {e}")
+        self.handler(record)
+
+    def _publish(self):
+        """
+        Push the routing state, the peers' public keys and the node locations to the
+        workers every time they change.
+        """
+        published = None
+        while True:
+            routes = self.system.routes.snapshot()
+            peers = self.system.peers.snapshot()
+            neighbourhood_version = self.system.neighbourhood.version
+            if published is None or published[0] is not routes or published[1] is not peers or \
+                    published[2] != neighbourhood_version:
+                neighbourhood = None
+                if published is None or published[2] != neighbourhood_version:
+                    neighbourhood = self.system.neighbourhood.snapshot()
+                    neighbourhood_version = neighbourhood[0]
+                published = (routes, peers, neighbourhood_version)
+                state = ('state', self.system.routes.version, routes,
+                         [(peer.node_id, peer.host, peer.port, peer.formats) for peer in peers.values()],
+                         self.system.session_keys.peer_keys.pems(), neighbourhood)
+                with self.lock:
+                    conns = list(self.conns.values())
+                for conn in conns:
+                    try:
+                        with self.send_lock:
+                            conn.send(state)
+                    except OSError as e:
+                        logger.debug(f"publishing to worker failed {e}")
+            time.sleep(PUBLISH_INTERVAL)